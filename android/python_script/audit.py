@@ -0,0 +1,163 @@
+import abc
+import argparse
+import json
+import metrics
+from scan import scan_documents, scan_partitioned
+
+# Collection health checks evaluated together. Checks that are only a document
+# count use a server-side count() aggregation; every other check is fed from a
+# single scan that fetches only the fields the checks need.
+
+
+class Check(abc.ABC):
+    """A declarative audit check: which fields it needs, and what it makes of each document."""
+
+    fields = ()  # Fields to fetch for this check; empty for pure counts
+    count_only = False
+
+    def observe(self, doc_id, data):
+        pass
+
+    def set_count(self, count):
+        pass
+
+    @abc.abstractmethod
+    def result(self):
+        """What the check found, as JSON-serialisable data."""
+
+    @abc.abstractmethod
+    def report(self):
+        """Lines for the printed report."""
+
+
+class DocumentCount(Check):
+    """Number of documents in the collection."""
+
+    name = 'document_count'
+    count_only = True
+
+    def __init__(self):
+        self.count = 0
+
+    def set_count(self, count):
+        self.count = count
+
+    def result(self):
+        return self.count
+
+    def report(self):
+        return [f"Documents: {self.count}"]
+
+
+class MissingField(Check):
+    """Documents that do not have a field."""
+
+    def __init__(self, field):
+        self.field = field
+        self.fields = (field,)
+        self.name = f"missing_{field}"
+        self.doc_ids = []
+
+    def observe(self, doc_id, data):
+        if self.field not in data:
+            self.doc_ids.append(doc_id)
+
+    def result(self):
+        return self.doc_ids
+
+    def report(self):
+        return [f"Documents missing '{self.field}': {len(self.doc_ids)}"]
+
+
+class LeftoverFields(Check):
+    """Documents that still have any of the given fields (e.g. after a delete migration)."""
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.name = 'leftover_fields'
+        self.found = {}  # doc ID -> leftover fields
+
+    def observe(self, doc_id, data):
+        leftover = [field for field in self.fields if field in data]
+        if leftover:
+            self.found[doc_id] = leftover
+
+    def result(self):
+        return self.found
+
+    def report(self):
+        return [f"Documents with leftover fields {list(self.fields)}: {len(self.found)}"]
+
+
+def count_documents(collection_ref):
+    """Server-side document count; billed per 1000 index entries instead of per document."""
+    count = collection_ref.count().get()[0][0].value
+    metrics.current().count('read', count // 1000 + 1)
+    return count
+
+
+def run_audit(db, collection_name, checks, page_size=1000, partitions=1):
+    """
+    Evaluate all checks against a collection in one pass and return {check name: result}.
+    The document count comes from the scan when one is needed anyway, and from
+    a count() aggregation otherwise. partitions > 1 reads that many ID ranges at
+    once (see scan.scan_partitioned).
+    """
+    collection_ref = db.collection(collection_name)
+    scan_checks = [check for check in checks if not check.count_only]
+
+    if scan_checks:
+        fields = sorted({field for check in scan_checks for field in check.fields})
+        count = 0
+        if partitions > 1:
+            docs = (doc for page in scan_partitioned(db, collection_ref, partitions, page_size, select=fields)
+                    for doc in page)
+        else:
+            docs = scan_documents(collection_ref, page_size, select=fields)
+        for doc in docs:
+            data = doc.to_dict()
+            count += 1
+            for check in scan_checks:
+                check.observe(doc.id, data)
+    else:
+        count = count_documents(collection_ref)
+
+    for check in checks:
+        check.set_count(count)
+    return {check.name: check.result() for check in checks}
+
+
+def print_report(collection_name, checks):
+    print(f"Audit of '{collection_name}':")
+    for check in checks:
+        for line in check.report():
+            print(f"  {line}")
+
+
+def standard_checks():
+    """The checks that used to be count.py, checking.py, taggedver.py, cleaningvaldation.py and verifyDelete.py."""
+    return [
+        DocumentCount(),
+        MissingField('cleaned_ingredients'),
+        MissingField('Tags'),
+        LeftoverFields(["dish_type", "nutrients", "rattings", "serves", "subcategory"]),
+    ]
+
+
+if __name__ == "__main__":
+    import datastore
+
+    parser = argparse.ArgumentParser(description="Run all collection health checks in one pass.")
+    parser.add_argument('collection', nargs='?', default='recipes')
+    parser.add_argument('--json', metavar='PATH', help="also write the full results (including IDs) as JSON")
+    parser.add_argument('--partitions', type=int, default=1, help="ID ranges to scan in parallel, e.g. 8")
+    args = parser.parse_args()
+
+    metrics.start_job('audit')
+
+    checks = standard_checks()
+    results = run_audit(datastore.connect(), args.collection, checks, partitions=args.partitions)
+    print_report(args.collection, checks)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
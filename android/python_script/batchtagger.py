@@ -0,0 +1,409 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import datastore
+import metrics
+from bulkwriter import BulkWriter
+from cleaning import ingredients_as_list
+from ratelimit import backoff
+from scan import Checkpoint, scan_pages
+
+# Generate 'Tags' offline for recipes that have none, so the recipe page no
+# longer waits on generateRecipeTags() (lib/chat_service.dart) the first time
+# someone opens an untagged recipe.
+#
+# Recipes are sent to the chat completions endpoint several per request, a
+# few requests at a time. Every answer is cached on disk under a hash of the
+# recipe's name, description and ingredients, so a rerun (or a recipe that was
+# imported twice) never pays for the same tags again. The tags are written
+# back in batches through BulkWriter.
+#
+#   python batchtagger.py stub --port 8765       a local endpoint for testing
+#   QOOT_TAGGER_URL=http://127.0.0.1:8765/v1/chat/completions python batchtagger.py
+
+TAGGER_URL_ENV = 'QOOT_TAGGER_URL'
+TAGGER_KEY_ENV = 'QOOT_TAGGER_KEY'  # Falls back to OPENAI_API_KEY
+TAG_CACHE_ENV = 'QOOT_TAG_CACHE'
+DEFAULT_URL = 'https://api.openai.com/v1/chat/completions'
+DEFAULT_MODEL = 'gpt-4'  # What the app uses
+
+TAG_CACHE_PATH = os.environ.get(TAG_CACHE_ENV) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'tag_cache.jsonl')
+
+# Bump when the prompt changes, so cached tags from the old prompt are not reused
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = 'You are an AI that generates relevant food-related tags for recipes.'
+
+TAG_GUIDANCE = """The tags should reflect the recipe's *cuisine type, **dietary preferences, **meal type*, and any other notable features.
+For example, tags like: "Italian," "Vegan," "Gluten-Free," "Quick," "Dessert," "Healthy," etc.
+Do *not* just include ingredients as tags. Focus on *descriptive, meaningful tags* that categorize the recipe based on its *attributes*."""
+
+# HTTP statuses worth retrying: rate limited, or the server is having a bad moment
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class Recipe:
+    """The fields the prompt is built from."""
+
+    def __init__(self, doc_id, name, description, ingredients):
+        self.doc_id = doc_id
+        self.name = name or 'Unnamed Recipe'
+        self.description = description or 'No description'
+        self.ingredients = ingredients
+
+    @classmethod
+    def from_document(cls, doc):
+        data = doc.to_dict()
+        raw = data.get('ingredients')
+        ingredients = ingredients_as_list(raw) if raw is not None else []
+        if ingredients is None:
+            ingredients = [str(raw)]
+        return cls(doc.id, data.get('name'), data.get('description'), [str(i).strip() for i in ingredients])
+
+    def content_hash(self):
+        """Cache key: only what the model sees, so identical recipes share one answer."""
+        payload = json.dumps([PROMPT_VERSION, self.name, self.description, self.ingredients], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def prompt_lines(self):
+        return [f"- Recipe Name: {self.name}",
+                f"- Recipe Description: {self.description}",
+                f"- Ingredients: {', '.join(self.ingredients)}"]
+
+
+def single_prompt(recipe):
+    """The app's own prompt, for one recipe."""
+    return '\n'.join(["Generate a set of relevant, context-specific tags for the following recipe.",
+                      TAG_GUIDANCE, ""] + recipe.prompt_lines() + ["", "Return the tags as a JSON array of strings."])
+
+
+def batch_prompt(recipes):
+    """Several recipes in one request; the answer maps each recipe's number to its tags."""
+    lines = ["Generate a set of relevant, context-specific tags for each of the following recipes.",
+             TAG_GUIDANCE, ""]
+    for number, recipe in enumerate(recipes, 1):
+        lines.append(f"Recipe {number}:")
+        lines.extend(recipe.prompt_lines())
+        lines.append("")
+    lines.append('Return a JSON object whose keys are the recipe numbers ("1", "2", ...) '
+                 'and whose values are the tags of that recipe as a JSON array of strings.')
+    return '\n'.join(lines)
+
+
+def _clean_tags(value):
+    if not isinstance(value, list):
+        return None
+    tags = [tag.strip() for tag in value if isinstance(tag, str) and tag.strip()]
+    return tags or None
+
+
+def _json_content(content):
+    """Parse the model's answer, tolerating a ```json fence around it."""
+    content = content.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", content, re.DOTALL)
+    return json.loads(fenced.group(1) if fenced else content)
+
+
+class TagCache:
+    """
+    Tags by recipe content hash, kept in an append-only JSON-lines file.
+    Each answer is appended as soon as it arrives, so an interrupted run loses nothing.
+    """
+
+    def __init__(self, path=TAG_CACHE_PATH):
+        self.path = path
+        self._tags = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line torn by a crash
+                    self._tags[entry['key']] = entry['tags']
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self._tags)
+
+    def get(self, key):
+        return self._tags.get(key)
+
+    def put(self, key, tags):
+        with self._lock:
+            self._tags[key] = tags
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'tags': tags}, ensure_ascii=False) + '\n')
+
+
+class TagClient:
+    """Calls an OpenAI-compatible chat completions endpoint; retries 429s and 5xx with jittered backoff."""
+
+    def __init__(self, url=None, api_key=None, model=DEFAULT_MODEL, timeout=60.0, max_attempts=6):
+        self.url = url or os.environ.get(TAGGER_URL_ENV) or DEFAULT_URL
+        self.api_key = api_key or os.environ.get(TAGGER_KEY_ENV) or os.environ.get('OPENAI_API_KEY')
+        self.model = model
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    def complete(self, prompt, max_tokens):
+        body = json.dumps({
+            'model': self.model,
+            'messages': [{'role': 'system', 'content': SYSTEM_PROMPT}, {'role': 'user', 'content': prompt}],
+            'max_tokens': max_tokens,
+        }).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+
+        attempt = 0
+        while True:
+            request = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+            try:
+                with metrics.current().time('request'):
+                    with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                        data = json.load(response)
+                metrics.current().count('requests')
+                return data['choices'][0]['message']['content']
+            except (urllib.error.HTTPError, urllib.error.URLError, TimeoutError) as e:
+                status = getattr(e, 'code', None)
+                attempt += 1
+                if (status is not None and status not in RETRYABLE_STATUSES) or attempt >= self.max_attempts:
+                    raise
+                metrics.current().count('retries')
+                retry_after = e.headers.get('Retry-After') if status is not None else None
+                time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else backoff(attempt - 1))
+
+    def tag_one(self, recipe):
+        try:
+            return _clean_tags(_json_content(self.complete(single_prompt(recipe), 100)))
+        except ValueError:
+            return None
+
+    def tag_batch(self, recipes):
+        """
+        Tags for each recipe (None where none could be generated). A batch whose
+        answer cannot be matched up falls back to one request per missing recipe.
+        """
+        if len(recipes) == 1:
+            return [self.tag_one(recipes[0])]
+        try:
+            answer = _json_content(self.complete(batch_prompt(recipes), 100 * len(recipes)))
+        except ValueError:
+            answer = None
+        if not isinstance(answer, dict):
+            answer = {}
+        results = [_clean_tags(answer.get(str(number))) for number in range(1, len(recipes) + 1)]
+        for i, tags in enumerate(results):
+            if tags is None:
+                metrics.current().count('fallbacks')
+                results[i] = self.tag_one(recipes[i])
+        return results
+
+
+def _missing_tags(doc):
+    return 'Tags' not in doc.to_dict()
+
+
+def tag_missing_recipes(db, collection_name='recipes', client=None, cache=None, batch_size=10,
+                        concurrency=4, page_size=500, limit=None, dry_run=False, restart=False):
+    """
+    Generate and write 'Tags' for every recipe of collection_name without them.
+
+    Cached answers are written straight away; the rest are sent batch_size
+    recipes per request with at most concurrency requests in flight, while
+    the scan keeps reading ahead. Returns the writer (see BulkWriter).
+    """
+    client = client or TagClient()
+    cache = cache if cache is not None else TagCache()
+    collection_ref = db.collection(collection_name)
+    writer = BulkWriter(db)
+    checkpoint = None if dry_run else Checkpoint(f"batchtagger-{collection_name}")
+    if restart and checkpoint:
+        checkpoint.clear()
+    job = metrics.current()
+    counts = {'cached': 0, 'generated': 0, 'failed': 0, 'queued': 0}
+    pending = deque()  # request futures, plus the last ID of each page as a page-end marker
+    batch = []
+
+    def save(recipe, tags):
+        if tags is None:
+            counts['failed'] += 1
+            print(f"No tags generated for recipe {recipe.doc_id}")
+            return
+        if not dry_run:
+            writer.update(collection_ref.document(recipe.doc_id), {'Tags': tags}, stamp=True)
+        job.progress()
+
+    def drain(item):
+        if isinstance(item, str):
+            if checkpoint:
+                writer.after_committed(lambda: checkpoint.save(item))
+            return
+        recipes, future = item
+        try:
+            results = future.result()
+        except Exception as e:  # Not retryable, or out of attempts; the next run tries these again
+            print(f"Tag request for {len(recipes)} recipes failed: {e}")
+            results = [None] * len(recipes)
+        for recipe, tags in zip(recipes, results):
+            if tags is not None:
+                cache.put(recipe.content_hash(), tags)
+                counts['generated'] += 1
+            save(recipe, tags)
+
+    def submit():
+        nonlocal batch
+        if batch:
+            pending.append((batch, pool.submit(client.tag_batch, batch)))
+            batch = []
+        while sum(1 for item in pending if not isinstance(item, str)) > concurrency * 2:
+            drain(pending.popleft())
+
+    fields = ['name', 'description', 'ingredients', 'Tags']
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            for page in scan_pages(collection_ref, page_size, select=fields,
+                                   checkpoint=checkpoint):
+                last_id = None  # The last document looked at; with a limit, the page may stop early
+                for doc in page:
+                    if limit is not None and counts['queued'] >= limit:
+                        break
+                    last_id = doc.id
+                    if not _missing_tags(doc):
+                        continue
+                    counts['queued'] += 1
+                    recipe = Recipe.from_document(doc)
+                    tags = cache.get(recipe.content_hash())
+                    if tags is not None:
+                        counts['cached'] += 1
+                        save(recipe, tags)
+                        continue
+                    batch.append(recipe)
+                    if len(batch) >= batch_size:
+                        submit()
+                submit()  # A page's recipes never wait for the next page
+                if last_id is not None:
+                    pending.append(last_id)
+                if limit is not None and counts['queued'] >= limit:
+                    break
+            while pending:
+                drain(pending.popleft())
+        finally:
+            for item in pending:
+                if not isinstance(item, str):
+                    item[1].cancel()
+            writer.close()
+
+    if checkpoint and limit is None and not writer.failed:
+        checkpoint.clear()
+    action = "Would write" if dry_run else "Wrote"
+    print(f"{action} tags for {counts['cached'] + counts['generated']} recipes "
+          f"({counts['cached']} from the cache, {counts['generated']} generated), "
+          f"{counts['failed']} without tags, {len(writer.failed)} writes failed.")
+    return writer
+
+
+# Keyword -> tag rules of the stub endpoint
+_STUB_RULES = [
+    (('chicken', 'beef', 'pork', 'lamb', 'fish', 'shrimp', 'meat'), 'Protein-Rich'),
+    (('sugar', 'chocolate', 'cake', 'cookie', 'honey', 'cream'), 'Dessert'),
+    (('pasta', 'basil', 'parmesan', 'mozzarella', 'oregano'), 'Italian'),
+    (('cumin', 'saffron', 'cardamom', 'turmeric'), 'Middle Eastern'),
+    (('rice', 'soy', 'ginger', 'sesame', 'noodle'), 'Asian'),
+    (('lettuce', 'tomato', 'cucumber', 'spinach', 'lemon'), 'Healthy'),
+    (('chili', 'pepper', 'jalapeno', 'cayenne'), 'Spicy'),
+]
+
+
+def stub_tags(text):
+    """Deterministic tags from keywords, so the stub's answers can be checked."""
+    text = text.lower()
+    tags = [tag for words, tag in _STUB_RULES if any(word in text for word in words)]
+    return tags if 'Protein-Rich' in tags else tags + ['Vegetarian']
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers chat completion requests like the real endpoint, with an optional rate of 429s."""
+
+    fail_rate = 0.0
+    delay = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        if random.random() < self.fail_rate:
+            return self._reply(429, {'error': {'message': 'Rate limit reached (stub)'}})
+        time.sleep(self.delay)
+        prompt = body['messages'][-1]['content']
+        blocks = re.split(r"^Recipe (\d+):$", prompt, flags=re.MULTILINE)
+        if len(blocks) > 1:  # A batch prompt: "Recipe 1:" followed by its lines, and so on
+            answer = {number: stub_tags(text) for number, text in zip(blocks[1::2], blocks[2::2])}
+        else:
+            answer = stub_tags(prompt)
+        self._reply(200, {'choices': [{'message': {'role': 'assistant', 'content': json.dumps(answer)}}]})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the tagger's own output
+
+
+def serve_stub(port=8765, fail_rate=0.0, delay=0.0):
+    """Start the stub endpoint on a background thread; returns the server (call shutdown() to stop it)."""
+    handler = type('StubHandler', (_StubHandler,), {'fail_rate': fail_rate, 'delay': delay})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate 'Tags' for recipes that have none.")
+    subparsers = parser.add_subparsers(dest='command')
+    stub = subparsers.add_parser('stub', help="run a local stand-in for the tag endpoint")
+    stub.add_argument('--port', type=int, default=8765)
+    stub.add_argument('--fail-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    stub.add_argument('--delay', type=float, default=0.0, help="seconds each answer takes")
+    parser.add_argument('--collection', default='recipes')
+    parser.add_argument('--batch-size', type=int, default=10, help="recipes per request")
+    parser.add_argument('--concurrency', type=int, default=4, help="requests in flight")
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--limit', type=int, help="tag at most this many recipes")
+    parser.add_argument('--dry-run', action='store_true', help="generate tags but do not write them")
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore the checkpoint of an interrupted run and start from the beginning")
+    args = parser.parse_args()
+
+    if args.command == 'stub':
+        server = serve_stub(args.port, args.fail_rate, args.delay)
+        print(f"Stub tag endpoint on http://127.0.0.1:{args.port}/v1/chat/completions")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        metrics.start_job('batchtagger')
+        tag_missing_recipes(datastore.connect(), args.collection, TagClient(model=args.model),
+                            batch_size=args.batch_size, concurrency=args.concurrency, limit=args.limit,
+                            dry_run=args.dry_run, restart=args.restart)
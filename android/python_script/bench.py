@@ -0,0 +1,210 @@
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from localstore import LocalStore
+
+# Throughput benchmarks for the maintenance jobs, run against synthetic recipe
+# corpora in the local store instead of production.
+#
+#   python bench.py                         1k, 10k and 100k recipes, every stage
+#   python bench.py --sizes 1000 --stages clean export
+#   python bench.py --json results.json     save results for later comparison
+#   python bench.py --baseline results.json fail if a stage got slower or chattier
+#
+# Each stage runs in a fresh process on a fresh copy of the corpus, so peak RSS,
+# the time to the first document (startup.py) and the operation counts belong
+# to that stage alone.
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_data')
+STAGES = ('clean', 'export', 'import', 'audit', 'delete')
+DEFAULT_SIZES = (1000, 10000, 100000)
+COLLECTION = 'recipes'
+
+# Ingredient phrases are built from these, so cleaning sees realistic quantities and fillers
+_FOODS = ['flour', 'sugar', 'salt', 'butter', 'eggs', 'milk', 'onions', 'garlic', 'tomatoes', 'olive oil',
+          'chicken breasts', 'rice', 'basil', 'pepper', 'cinnamon', 'lemons', 'potatoes', 'carrots',
+          'cheese', 'yogurt', 'honey', 'beef', 'parsley', 'cumin', 'spinach', 'mushrooms', 'ginger']
+_QUANTITIES = ['1 cup', '2 cups', '1/2 cup', '1 tbsp', '2 tsp', '3', '200g', 'a pinch of', 'a handful of']
+_PREPARATIONS = ['', ', chopped', ', finely diced', ', grated', ' (optional)', ', to taste', ', fresh']
+_LEGACY_FIELDS = ['dish_type', 'nutrients', 'rattings', 'serves', 'subcategory']
+
+
+def _recipe(rng, n):
+    ingredients = [f"{rng.choice(_QUANTITIES)} {rng.choice(_FOODS)}{rng.choice(_PREPARATIONS)}"
+                   for _ in range(rng.randint(3, 12))]
+    recipe = {
+        'id': f"bench{n:07d}",
+        'name': f"Recipe {n}",
+        'ingredients': repr(ingredients),  # Stored as a string, like the original import
+        'flag': COLLECTION,
+        'source': rng.choice(['public', 'private']),
+    }
+    if rng.random() < 0.8:
+        recipe['Tags'] = rng.sample(['vegan', 'quick', 'dessert', 'dinner', 'spicy'], 2)
+    if rng.random() < 0.3:
+        recipe.update({field: rng.randint(1, 5) for field in _LEGACY_FIELDS})
+    return recipe
+
+
+def corpus_paths(size):
+    return os.path.join(BENCH_DIR, f"recipes-{size}.sqlite"), os.path.join(BENCH_DIR, f"recipes-{size}.csv")
+
+
+def build_corpus(size, seed=0):
+    """Write a synthetic corpus as a local store and as the same rows in CSV, once per size."""
+    db_path, csv_path = corpus_paths(size)
+    if os.path.exists(db_path) and os.path.exists(csv_path):
+        return db_path, csv_path
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    rng = random.Random(seed)
+    recipes = [_recipe(rng, n) for n in range(size)]
+
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    store = LocalStore(tmp_path)
+    collection_ref = store.collection(COLLECTION)
+    for start in range(0, size, 500):
+        batch = store.batch()
+        for recipe in recipes[start:start + 500]:
+            batch.set(collection_ref.document(recipe['id']), recipe)
+        batch.commit()
+    store.close()
+    os.replace(tmp_path, db_path)
+
+    columns = ['id', 'name', 'ingredients', 'flag', 'source', 'Tags'] + _LEGACY_FIELDS
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(recipes)
+    print(f"Built {size}-recipe corpus in {BENCH_DIR}")
+    return db_path, csv_path
+
+
+def run_stage(stage, csv_path, work_dir):
+    """Run one job against the store in $QOOT_DATASTORE; returns the number of documents it handled."""
+    import datastore
+    from audit import count_documents
+
+    db = datastore.connect()
+    docs = count_documents(db.collection(COLLECTION))
+    db.ops.clear()  # Only count the job's own operations
+
+    if stage == 'clean':
+        import cleanWors
+        cleanWors.process_and_update_firestore(full=True, restart=True)
+    elif stage == 'export':
+        import export
+        export.export_collection(COLLECTION, os.path.join(work_dir, 'export.csv'), fmt='csv')
+    elif stage == 'import':
+        import importnew
+        importnew.import_csv_to_firestore(csv_path, 'imported', id_column='id')
+    elif stage == 'audit':
+        import audit
+        audit.run_audit(db, COLLECTION, audit.standard_checks())
+    elif stage == 'delete':
+        import delete
+        delete.bulk_delete(COLLECTION)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    return docs
+
+
+def _child(stage, csv_path, result_path):
+    """Entry point of the per-stage process."""
+    import datastore
+    import metrics
+    import startup
+
+    work_dir = os.path.dirname(result_path)
+    start = time.perf_counter()
+    docs = run_stage(stage, csv_path, work_dir)
+    elapsed = time.perf_counter() - start
+    ops = dict(datastore.connect().ops)
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump({'docs': docs, 'seconds': elapsed, 'docs_per_s': docs / elapsed if elapsed else 0.0,
+                   'peak_rss_mb': metrics.peak_rss_bytes() / 2 ** 20, 'first_document_s': startup.elapsed,
+                   'ops': ops, 'stage_seconds': {stage: histogram.sum
+                                                 for stage, histogram in metrics.current().stages.items()}}, f)
+
+
+def benchmark(sizes=DEFAULT_SIZES, stages=STAGES, verbose=False):
+    """Run every stage on every corpus size; returns {"<size>/<stage>": result}."""
+    results = {}
+    for size in sizes:
+        db_path, csv_path = build_corpus(size)
+        for stage in stages:
+            with tempfile.TemporaryDirectory(prefix='qoot-bench-') as work_dir:
+                store_path = os.path.join(work_dir, 'store.sqlite')
+                shutil.copyfile(db_path, store_path)
+                result_path = os.path.join(work_dir, 'result.json')
+                env = dict(os.environ, QOOT_DATASTORE=f"sqlite:{store_path}",
+                           QOOT_CHECKPOINT_DIR=os.path.join(work_dir, 'checkpoints'))
+                command = [sys.executable, os.path.abspath(__file__), '--child', stage, csv_path, result_path]
+                output = None if verbose else subprocess.DEVNULL
+                completed = subprocess.run(command, env=env, stdout=output, stderr=subprocess.PIPE, text=True)
+                if completed.returncode != 0:
+                    print(f"{size}/{stage} failed:\n{completed.stderr[-2000:]}")
+                    continue
+                with open(result_path, encoding='utf-8') as f:
+                    result = results[f"{size}/{stage}"] = json.load(f)
+            ops = result['ops']
+            first = result['first_document_s']
+            print(f"{size:>7} {stage:<7} {result['seconds']:8.2f}s {result['docs_per_s']:10,.0f} docs/s "
+                  f"{result['peak_rss_mb']:7.1f} MB  first doc {'-' if first is None else f'{first:.2f}s'}  "
+                  f"reads {ops.get('read', 0)}, writes {ops.get('write', 0)}, "
+                  f"deletes {ops.get('delete', 0)}, commits {ops.get('commit', 0)}")
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Regressions against a saved run: throughput down by more than tolerance, or more operations."""
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if not before:
+            continue
+        if result['docs_per_s'] < before['docs_per_s'] * (1 - tolerance):
+            regressions.append(f"{key}: {result['docs_per_s']:,.0f} docs/s, was {before['docs_per_s']:,.0f}")
+        first, first_before = result.get('first_document_s'), before.get('first_document_s')
+        if first is not None and first_before is not None and first > first_before * (1 + tolerance):
+            regressions.append(f"{key}: first document after {first:.2f}s, was {first_before:.2f}s")
+        for op, count in result['ops'].items():
+            if count > before['ops'].get(op, 0):
+                regressions.append(f"{key}: {count} {op} ops, was {before['ops'].get(op, 0)}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == '--child':
+        _child(*sys.argv[2:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark the maintenance jobs on synthetic corpora.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="corpus sizes")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='PATH', help="compare with a previous --json run")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed throughput drop against the baseline (default 0.2 = 20%%)")
+    parser.add_argument('--verbose', action='store_true', help="show the jobs' own output")
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.stages, args.verbose)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,224 @@
+import argparse
+import ast
+import csv
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from ingredientindex import collect_entries, index_key
+
+# In-memory "recipes containing these ingredients" engine.
+#
+# Recipes are numbered 0..n-1 and ingredients are interned to integer IDs.
+# Each ingredient keeps the set of recipes that use it in one of two forms:
+# a sorted int32 array of recipe numbers when it is rare, or a packed bitmap
+# (n bits) once the array would be larger than the bitmap. Exact matches AND
+# the sets together, starting from the rarest; ranked matches add the sets
+# into a per-recipe counter with vectorized numpy operations.
+
+# Rows with fewer members than n / DENSE_RATIO are stored as arrays (4 bytes
+# per member) instead of bitmaps (n / 8 bytes)
+DENSE_RATIO = 32
+
+
+class IngredientBitmaps:
+    """Compressed per-ingredient recipe sets with all-of and ranked partial queries."""
+
+    def __init__(self, entries):
+        """entries maps each ingredient to the recipe keys ('<collection>/<id>') that use it."""
+        self.recipe_keys = sorted({key for keys in entries.values() for key in keys})
+        recipe_ids = {key: n for n, key in enumerate(self.recipe_keys)}
+        n = len(self.recipe_keys)
+
+        self.ingredient_ids = {}
+        self._rows = []
+        sizes = np.zeros(n, dtype=np.int32)
+        for ingredient, keys in entries.items():
+            members = np.unique(np.fromiter((recipe_ids[key] for key in keys), dtype=np.int32, count=len(keys)))
+            sizes[members] += 1
+            self.ingredient_ids[ingredient] = len(self._rows)
+            if len(members) * DENSE_RATIO >= n:
+                bits = np.zeros(n, dtype=bool)
+                bits[members] = True
+                self._rows.append(np.packbits(bits))
+            else:
+                self._rows.append(members)
+        self._cardinality = np.array([_cardinality(row) for row in self._rows], dtype=np.int64)
+        self.recipe_sizes = sizes  # number of indexed ingredients in each recipe
+
+    def __len__(self):
+        return len(self.recipe_keys)
+
+    def _lookup(self, ingredients):
+        """Interned IDs of the known ingredients, and whether any were unknown."""
+        ids, unknown = [], False
+        for ingredient in ingredients:
+            key = index_key(ingredient)
+            if key in self.ingredient_ids:
+                ids.append(self.ingredient_ids[key])
+            else:
+                unknown = True
+        return sorted(set(ids), key=lambda i: self._cardinality[i]), unknown
+
+    def match_all(self, ingredients):
+        """Keys of the recipes that contain every one of the ingredients."""
+        ids, unknown = self._lookup(ingredients)
+        if unknown or not ids:
+            return []
+
+        first = self._rows[ids[0]]
+        if first.dtype == np.uint8:
+            # Rows are ordered by cardinality, so if the rarest is a bitmap they all are
+            result = first.copy()
+            for i in ids[1:]:
+                np.bitwise_and(result, self._rows[i], out=result)
+            members = np.flatnonzero(self._unpacked(result))
+        else:
+            # Sparse start: filter the rarest ingredient's members through the others
+            members = first
+            for i in ids[1:]:
+                members = _intersect(members, self._rows[i])
+                if not len(members):
+                    break
+        return [self.recipe_keys[m] for m in members]
+
+    def match_counts(self, ingredients):
+        """Per-recipe number of the given ingredients it contains (uint16 array of length n)."""
+        ids, _ = self._lookup(ingredients)
+        counts = np.zeros(len(self), dtype=np.uint16)
+        for i in ids:
+            row = self._rows[i]
+            if row.dtype == np.uint8:
+                counts += self._unpacked(row)
+            else:
+                counts[row] += 1
+        return counts
+
+    def top_k(self, ingredients, k=10, min_matches=1):
+        """
+        Rank recipes by how few of their ingredients are missing ("you have 5 of 6"),
+        then by how many of the given ingredients they use.
+        Returns up to k (recipe key, matched, recipe size) tuples.
+        """
+        counts = self.match_counts(ingredients)
+        candidates = np.flatnonzero(counts >= max(min_matches, 1))
+        if not len(candidates):
+            return []
+
+        matched = counts[candidates].astype(np.int64)
+        missing = self.recipe_sizes[candidates].astype(np.int64) - matched
+        score = missing * (len(ingredients) + 1) - matched  # Lower is better
+        if len(candidates) > k:
+            best = np.argpartition(score, k - 1)[:k]
+        else:
+            best = np.arange(len(candidates))
+        best = best[np.argsort(score[best], kind='stable')]
+        return [(self.recipe_keys[candidates[b]], int(matched[b]), int(self.recipe_sizes[candidates[b]]))
+                for b in best]
+
+    def _unpacked(self, packed):
+        return np.unpackbits(packed, count=len(self)).view(bool)
+
+    def memory_bytes(self):
+        return sum(row.nbytes for row in self._rows)
+
+
+def _cardinality(row):
+    if row.dtype == np.uint8:
+        return int(np.unpackbits(row).sum())  # Popcount of the bitmap
+    return len(row)
+
+
+def _intersect(members, row):
+    """Members (sorted int32 array) that are also in row, whichever form row is stored in."""
+    if row.dtype == np.uint8:
+        return members[np.unpackbits(row)[members].astype(bool)]
+    return np.intersect1d(members, row, assume_unique=True)
+
+
+def load_from_firestore(db):
+    """Read cleaned_ingredients from recipes and public users_recipes."""
+    return IngredientBitmaps(collect_entries(db))
+
+
+def load_from_export(path, source=None):
+    """
+    Read cleaned_ingredients from an export.py dump (CSV or JSONL).
+    Recipes are keyed by their 'id' column when present, otherwise by row number;
+    the collection comes from the 'flag' column, falling back to source or the file name.
+    """
+    source = source or os.path.splitext(os.path.basename(path))[0]
+    entries = defaultdict(list)
+
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            rows = (json.loads(line) for line in f if line.strip())
+            _add_rows(entries, rows, source)
+    else:
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline='', encoding='utf-8') as f:
+            _add_rows(entries, csv.DictReader(f), source)
+    return IngredientBitmaps(entries)
+
+
+def _add_rows(entries, rows, source):
+    for number, row in enumerate(rows):
+        cleaned = row.get('cleaned_ingredients')
+        if isinstance(cleaned, str):
+            try:
+                cleaned = ast.literal_eval(cleaned)  # pandas writes lists as their repr
+            except (SyntaxError, ValueError):
+                continue
+        if not isinstance(cleaned, list):
+            continue
+        entry = f"{row.get('flag') or source}/{row.get('id') or number}"
+        for key in {index_key(str(ingredient)) for ingredient in cleaned}:
+            if key:
+                entries[key].append(entry)
+
+
+def benchmark(bitmaps, queries=10000, max_ingredients=5, k=10, seed=0):
+    """Time random all-of and top-k queries drawn from the indexed vocabulary."""
+    rng = random.Random(seed)
+    vocabulary = list(bitmaps.ingredient_ids)
+    workload = [rng.sample(vocabulary, rng.randint(1, min(max_ingredients, len(vocabulary))))
+                for _ in range(queries)]
+
+    for name, run in (('all-of', bitmaps.match_all), ('top-k', lambda q: bitmaps.top_k(q, k))):
+        start = time.perf_counter()
+        for query in workload:
+            run(query)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {queries} queries in {elapsed:.2f}s ({queries / elapsed:,.0f} queries/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query recipes by ingredients with per-ingredient bitmaps.")
+    parser.add_argument('--export', help="export.py dump (CSV or JSONL) to load instead of Firestore")
+    parser.add_argument('--query', nargs='+', help="ingredients to search for")
+    parser.add_argument('-k', type=int, default=10, help="number of ranked results")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="run N random queries and report throughput")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.export:
+        bitmaps = load_from_export(args.export)
+    else:
+        import datastore
+
+        bitmaps = load_from_firestore(datastore.connect())
+    print(f"Loaded {len(bitmaps)} recipes and {len(bitmaps.ingredient_ids)} ingredients "
+          f"({bitmaps.memory_bytes() / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s")
+
+    if args.query:
+        matches = bitmaps.match_all(args.query)
+        print(f"{len(matches)} recipes contain all of {args.query}")
+        for key, matched, size in bitmaps.top_k(args.query, args.k):
+            print(f"{key}: you have {matched} of {size}")
+    if args.benchmark:
+        benchmark(bitmaps, args.benchmark, k=args.k)
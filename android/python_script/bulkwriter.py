@@ -0,0 +1,225 @@
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import datastore
+import metrics
+from ratelimit import is_retryable, pacer_for
+
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_SIZE = 500
+
+# Stamped with the commit time on the recipe writes that ask for it (stamp=True),
+# so mirror.py can fetch only what changed
+UPDATED_AT = 'updated_at'
+
+# A single queued write: kind is 'update', 'set' or 'delete'
+WriteOp = namedtuple('WriteOp', ['kind', 'ref', 'data', 'merge', 'on_committed'], defaults=[None])
+
+
+def print_failure(op, error):
+    """Default error handler: log the failed write and keep going."""
+    print(f"Failed to {op.kind} document ID: {op.ref.id}. Error: {error}")
+
+
+class BulkWriter:
+    """
+    Group Firestore writes into full batches and commit several batches at once.
+
+    Writes are queued with update(), set() and delete(). Every time a batch is
+    full it is handed to a thread pool; at most max_in_flight batches are
+    committed concurrently, and the producer blocks once that limit is reached.
+    A batch commit is atomic, so when it fails the writer retries its ops one by
+    one to find the bad ones instead of dropping the whole batch.
+
+    Commits are paced by the process-wide ratelimit.Pacer for the client:
+    quota and contention errors slow every writer down and are retried with
+    jittered backoff, while sustained success lets the write rate climb.
+
+    update() and set() with stamp=True also write UPDATED_AT (the server's
+    commit time). Only writes to collections mirror.py syncs ask for it;
+    derived data such as the ingredient index is left unstamped.
+
+    on_committed, also given to update() or set(), is called without arguments
+    once that write has committed, on the committing thread; it is not called
+    for a write that fails.
+    """
+
+    def __init__(self, db, batch_size=MAX_BATCH_SIZE, max_in_flight=4, on_error=print_failure, pacer=None):
+        if not 0 < batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        self._db = db
+        self._batch_size = batch_size
+        self._on_error = on_error
+        self._pacer = pacer or pacer_for(db)
+        self._ops = []
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._producer_lock = threading.Lock()  # Lets several threads queue ops on one writer
+        self._next_seq = 0  # sequence number of the batch being filled
+        self._unfinished = set()  # sequence numbers of batches still committing
+        self._markers = []  # (last batch sequence number, callback)
+        self._marker_lock = threading.Lock()
+        self.committed = 0  # number of ops written successfully
+        self.failed = []  # (WriteOp, exception) pairs
+
+    def update(self, doc_ref, data, stamp=False, on_committed=None):
+        self._add(WriteOp('update', doc_ref, _stamped(data) if stamp else data, False, on_committed))
+
+    def set(self, doc_ref, data, merge=False, stamp=False, on_committed=None):
+        self._add(WriteOp('set', doc_ref, _stamped(data) if stamp else data, merge, on_committed))
+
+    def delete(self, doc_ref):
+        self._add(WriteOp('delete', doc_ref, None, False))
+
+    def after_committed(self, callback):
+        """
+        Run callback once every op queued so far has been committed or reported as failed.
+        Callbacks run in the order they were registered; use them to advance checkpoints.
+        """
+        with self._lock:
+            last_seq = self._next_seq if self._ops else self._next_seq - 1
+            self._markers.append((last_seq, callback))
+        self._run_markers()
+
+    def _run_markers(self):
+        with self._marker_lock:  # Keep callbacks in order across committing threads
+            while True:
+                with self._lock:
+                    if not self._markers:
+                        return
+                    last_seq, callback = self._markers[0]
+                    if last_seq >= self._next_seq or any(seq <= last_seq for seq in self._unfinished):
+                        return
+                    self._markers.pop(0)
+                callback()
+
+    def _add(self, op):
+        with self._producer_lock:
+            self._ops.append(op)
+            if len(self._ops) >= self._batch_size:
+                self._submit()
+
+    def _submit(self):
+        """Hand the current batch to the pool, waiting for a free slot first."""
+        if not self._ops:
+            return
+        self._slots.acquire()  # Backpressure: block the producer while the pool is full
+        with self._lock:
+            ops, self._ops = self._ops, []
+            seq = self._next_seq
+            self._next_seq += 1
+            self._unfinished.add(seq)
+        future = self._executor.submit(self._commit, seq, ops)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _commit(self, seq, ops):
+        try:
+            try:
+                with metrics.current().time('commit'):
+                    self._pacer.call(lambda: self._commit_batch(ops), len(ops))
+            except Exception as e:
+                if is_retryable(e):
+                    # Still throttled after the retries; writing ops one by one would only add load
+                    self._fail(ops, e)
+                    ops = []
+                else:
+                    # The batch was rejected as a whole; write ops one by one to isolate failures
+                    ops = self._commit_individually(ops)
+            else:
+                with self._lock:
+                    self.committed += len(ops)
+                _count_ops(ops)
+            for op in ops:
+                if op.on_committed:
+                    op.on_committed()
+        finally:
+            with self._lock:
+                self._unfinished.discard(seq)
+            self._slots.release()
+            self._run_markers()
+
+    def _commit_batch(self, ops):
+        batch = self._db.batch()  # A fresh batch per attempt; a failed one cannot be committed again
+        for op in ops:
+            _apply(batch, op)
+        batch.commit()
+
+    def _commit_individually(self, ops):
+        """Write ops one at a time; returns the ones that committed."""
+        committed = []
+        for op in ops:
+            try:
+                self._pacer.call(lambda: _write_one(op))
+                with self._lock:
+                    self.committed += 1
+                _count_ops([op])
+                committed.append(op)
+            except Exception as e:
+                self._fail([op], e)
+        return committed
+
+    def _fail(self, ops, error):
+        with self._lock:
+            self.failed.extend((op, error) for op in ops)
+        if self._on_error:
+            for op in ops:
+                self._on_error(op, error)
+
+    def flush(self):
+        """Commit any queued ops and wait until every batch has finished."""
+        with self._producer_lock:
+            self._submit()
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _stamped(data):
+    return {**data, UPDATED_AT: datastore.SERVER_TIMESTAMP}
+
+
+def _count_ops(ops):
+    """Add committed ops to the job's billed write and delete counts."""
+    deletes = sum(1 for op in ops if op.kind == 'delete')
+    job = metrics.current()
+    job.count('write', len(ops) - deletes)
+    job.count('delete', deletes)
+
+
+def _apply(batch, op):
+    """Add a queued op to a Firestore batch."""
+    if op.kind == 'update':
+        batch.update(op.ref, op.data)
+    elif op.kind == 'set':
+        batch.set(op.ref, op.data, merge=op.merge)
+    else:
+        batch.delete(op.ref)
+
+
+def _write_one(op):
+    """Apply a queued op directly to its document."""
+    if op.kind == 'update':
+        op.ref.update(op.data)
+    elif op.kind == 'set':
+        op.ref.set(op.data, merge=op.merge)
+    else:
+        op.ref.delete()
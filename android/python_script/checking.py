@@ -1,39 +1,27 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import datastore
+from audit import DocumentCount, MissingField, run_audit
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-firebase_admin.initialize_app(cred)
-
-# Firestore client
-db = firestore.client()
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
 
 def check_cleaned_ingredients():
-    recipes_ref = db.collection("recipes")
-    documents = recipes_ref.stream()
-
-    total_docs = 0
-    missing_field_docs = []
-    updated_docs_count = 0
-
-    for doc in documents:
-        total_docs += 1
-        data = doc.to_dict()
-
-        # Check if "cleaned_ingredients" exists
-        if "cleaned_ingredients" not in data:
-            print(f"Missing 'cleaned_ingredients' in document ID: {doc.id}")
-            missing_field_docs.append(doc.id)
+    missing = MissingField("cleaned_ingredients")
+    results = run_audit(db, "recipes", [DocumentCount(), missing])
 
-  
+    total_docs = results['document_count']
+    missing_field_docs = missing.doc_ids
 
     print(f"Total documents checked: {total_docs}")
     print(f"Documents missing 'cleaned_ingredients': {len(missing_field_docs)}")
-    print(f"Documents updated with default 'cleaned_ingredients': {updated_docs_count}")
 
     return missing_field_docs
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List recipes without 'cleaned_ingredients'.")
+    parser.add_argument('--mirror', action='store_true', help="read the local mirror (see mirror.py)")
+    if parser.parse_args().mirror:
+        db = datastore.connect('mirror')
     missing_docs = check_cleaned_ingredients()
 
     if missing_docs:
@@ -1,101 +1,272 @@
-import re
-import nltk
-from nltk.corpus import wordnet as wn
-from nltk.tokenize import word_tokenize
-from firebase_admin import credentials, firestore, initialize_app
+import argparse
+import datetime
+import threading
+from collections import OrderedDict, deque
+import datastore
+import metrics
 import time
+from bulkwriter import BulkWriter
+from cleaning import clean_ingredients, cleaning_version, ingredients_as_list, ingredients_hash
+from ingredientindex import IndexUpdater
+import startup
+from vocabulary import VocabularyUpdater
 
-# Initialize Firebase
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-initialize_app(cred)
-db = firestore.client()
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
 
-# Download required NLTK data
-nltk.download('wordnet')
-nltk.download('punkt')
+class CoalescingQueue:
+    """
+    Bounded FIFO of pending work keyed by document ID.
+
+    A newer change to a document that is still waiting replaces the older one
+    in place, so a burst of edits is cleaned once. put() blocks while the
+    queue is full, which slows the listener down instead of growing memory.
+    A key handed out by get_batch() is not handed out again until done() is
+    called for it, so two workers never process the same document at once.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._items = OrderedDict()  # doc_id -> (item, first enqueue time)
+        self._in_flight = set()
+        self._maxsize = maxsize
+        self._cond = threading.Condition()
+
+    def put(self, key, item):
+        with self._cond:
+            if key in self._items:
+                self._items[key] = (item, self._items[key][1])  # Keep the oldest enqueue time
+                return
+            while len(self._items) >= self._maxsize:
+                self._cond.wait()
+            self._items[key] = (item, time.monotonic())
+            self._cond.notify_all()
+
+    def get_batch(self, max_items, timeout=1.0):
+        """Up to max_items (key, item, enqueued_at) entries, waiting up to timeout for the first."""
+        with self._cond:
+            if not self._ready():
+                self._cond.wait(timeout)
+            batch = []
+            for key in self._ready():
+                if len(batch) >= max_items:
+                    break
+                item, enqueued_at = self._items.pop(key)
+                self._in_flight.add(key)
+                batch.append((key, item, enqueued_at))
+            if batch:
+                self._cond.notify_all()
+            return batch
+
+    def done(self, keys):
+        """Release keys handed out by get_batch(), so their newer changes can be processed."""
+        with self._cond:
+            self._in_flight.difference_update(keys)
+            self._cond.notify_all()
+
+    def _ready(self):
+        return [key for key in self._items if key not in self._in_flight]
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class LatencyStats:
+    """Recent end-to-end latencies (change seen by Firestore -> cleaned field committed)."""
 
-def get_food_words():
-    """Return a set of all food-related words from WordNet."""
-    food_words = set()
-    for synset in wn.all_synsets('n'):
-        if synset.lexname() == 'noun.food':  # Check if it belongs to the 'food' category
-            food_words.update(synset.lemma_names())
-    return food_words
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.processed = 0
 
-def clean_ingredient_entry(entry):
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.processed += 1
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return "no recipes processed yet"
+        p50 = samples[len(samples) // 2]
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return f"latency p50 {p50:.2f}s, p95 {p95:.2f}s, max {samples[-1]:.2f}s"
+
+
+def was_indexed(data):
     """
-    Clean individual ingredient entry by removing non-alphabetic characters.
+    Whether the recipe's last cleaned ingredients went into the search index.
+    Recipes cleaned before cleaned_source was stored were indexed if public.
     """
-    words = word_tokenize(entry)
-    cleaned_words = [word.lower() for word in words if word.isalpha()]  # Keep only alphabetic words
-    return " ".join(cleaned_words)  # Return as a single cleaned string
-
-def clean_ingredients(ingredients_list, food_words):
-    """Clean the ingredients list to retain only food-related nouns."""
-    cleaned = []
-    for ingredient in ingredients_list:
-        cleaned_entry = clean_ingredient_entry(ingredient)  # Clean individual entry
-        # Check if the cleaned entry exists as a food-related noun
-        if cleaned_entry in food_words:
-            cleaned.append(cleaned_entry)
-    return list(set(cleaned))  # Remove duplicates
-
-def safely_parse_ingredients(raw_ingredients):
+    return data.get('cleaned_source', data.get('source')) == 'public'
+
+
+def source_changed(data):
+    """Whether a cleaned recipe was made public or private (or never had its source recorded) since."""
+    return 'cleaned_ingredients' in data and (
+        'cleaned_source' not in data or data['cleaned_source'] != data.get('source'))
+
+
+def needs_cleaning(data, version, initial):
     """
-    Safely parse the ingredients string into a Python list.
-    Handles cases where the format is not a valid Python literal.
+    Whether a recipe's cleaned_ingredients are missing or out of date.
+    Recipes cleaned before hashes were stored are trusted during the initial
+    replay, so a restart does not re-clean the whole collection.
     """
-    try:
-        # Check if the string is in list-like format (e.g., "[item1, item2]")
-        if raw_ingredients.startswith("[") and raw_ingredients.endswith("]"):
-            # Remove surrounding brackets and split manually
-            raw_ingredients = raw_ingredients[1:-1]  # Strip brackets
-            items = re.split(r',\s*', raw_ingredients)  # Split by commas
-            return [item.strip() for item in items]
-        else:
-            raise ValueError("Ingredients not in valid list format")
-    except Exception as e:
-        print(f"Failed to parse ingredients: {e}")
-        return None
-
-def listen_for_new_recipes():
-    """Listen for newly created recipes and add cleaned_ingredients dynamically."""
-    food_words = get_food_words()
+    if 'ingredients' not in data:
+        return False
+    stored_hash = data.get('cleaned_ingredients_hash')
+    if stored_hash:
+        return stored_hash != ingredients_hash(data['ingredients'], version)
+    return not (initial and 'cleaned_ingredients' in data)
+
+
+def clean_recipe(doc_id, data, reclean, version, writer, index, vocabulary):
+    """Queue one recipe's cleaned ingredients and its search index changes."""
+    # Search entries as they are now, and as they should be after this change
+    old_entries = data.get('cleaned_ingredients') if was_indexed(data) else None
+    if 'ingredients' not in data:  # The recipe was deleted
+        index.remove('users_recipes', doc_id, old_entries)
+        vocabulary.remove('users_recipes', doc_id, old_entries)
+        return
+
+    job = metrics.current()
+    updates = {'cleaned_source': data.get('source')}
+    if reclean:
+        raw_ingredients = data['ingredients']
+        with job.time('parse'):
+            ingredients_list = ingredients_as_list(raw_ingredients)
+        if not ingredients_list:  # Skip if parsing failed
+            print(f"Skipping recipe {doc_id}: invalid ingredients format")
+            return
+
+        # Clean the ingredients list
+        with job.time('normalize'):
+            cleaned = clean_ingredients(ingredients_list)
+        updates['cleaned_ingredients'] = cleaned
+        updates['cleaned_ingredients_hash'] = ingredients_hash(raw_ingredients, version)
+    else:  # Only made public or private
+        cleaned = data.get('cleaned_ingredients')
+
+    # Queue the cleaned ingredients; public recipes also go into the search index once that is committed
+    new_entries = cleaned if data.get('source') == 'public' else None
+
+    def index_recipe():
+        index.update('users_recipes', doc_id, old_entries, new_entries)
+        vocabulary.update('users_recipes', doc_id, old_entries, new_entries)
+
+    writer.update(db.collection('users_recipes').document(doc_id), updates, stamp=True,
+                  on_committed=index_recipe)
+    job.progress()
+
+
+def clean_worker(work, version, stats, stop, batch_size):
+    """
+    Drain the queue in batches: clean each recipe, then commit the batch together.
+    A recipe or batch that fails is logged and counted, and the worker carries on.
+    """
+    writer = BulkWriter(db)
+    index = IndexUpdater(db, writer)
+    vocabulary = VocabularyUpdater(db, writer)
+
+    while not stop.is_set():
+        batch = work.get_batch(batch_size)
+        if not batch:
+            continue
+
+        try:
+            for doc_id, (data, _, reclean), _ in batch:
+                try:
+                    clean_recipe(doc_id, data, reclean, version, writer, index, vocabulary)
+                except Exception as e:
+                    print(f"Skipping recipe {doc_id}: {e!r}")
+                    metrics.current().count('failed')
+
+            # Commit this batch's updates, then its index changes with one write per touched document
+            writer.flush()
+            index.flush()
+            vocabulary.flush()
+            writer.flush()
+        except Exception as e:
+            print(f"Failed to commit a batch of {len(batch)} recipes: {e!r}")
+            metrics.current().count('failed', len(batch))
+        finally:
+            work.done([doc_id for doc_id, _, _ in batch])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for _, (_, read_time, _), enqueued_at in batch:
+            if read_time is not None:
+                stats.add((now - read_time).total_seconds())
+            else:
+                stats.add(time.monotonic() - enqueued_at)
+
+    writer.close()
+
+
+def listen_for_new_recipes(workers=4, batch_size=100, queue_size=10000, report_every=30):
+    """
+    Listen for new and edited recipes and add cleaned_ingredients dynamically.
+
+    The snapshot callback only queues changes; a pool of worker threads cleans
+    and batch-writes them. Returns the stop event and the watch so callers can
+    shut the listener down.
+    """
+    version = cleaning_version()  # Loads the lexicon first, so a missing artifact fails before any I/O
     collection_ref = db.collection('users_recipes')
+    work = CoalescingQueue(queue_size)
+    stats = LatencyStats()
+    stop = threading.Event()
+    initial = [True]  # The first snapshot replays every existing document as ADDED
 
-    # Callback to process added recipes
+    # Callback to queue added, edited and removed recipes
     def on_snapshot(col_snapshot, changes, read_time):
+        startup.first_document()
+        metrics.current().count('read', len(changes))  # Each delivered change is a billed read
+        replay = initial[0]
+        initial[0] = False
         for change in changes:
-            if change.type.name == 'ADDED':  # Process newly added documents
-                doc = change.document
-                doc_id = doc.id
-                data = doc.to_dict()
-
-                if 'ingredients' in data:  # Check if the ingredients field exists
-                    raw_ingredients = data['ingredients']
-                    if isinstance(raw_ingredients, str):  # Convert string to list
-                        ingredients_list = safely_parse_ingredients(raw_ingredients)
-                        if not ingredients_list:  # Skip if parsing failed
-                            print(f"Skipping recipe {doc_id}: invalid ingredients format")
-                            continue
-
-                    # Clean the ingredients list
-                    cleaned = clean_ingredients(ingredients_list, food_words)
-
-                    # Update Firestore with the cleaned ingredients
-                    try:
-                        collection_ref.document(doc_id).update({'cleaned_ingredients': cleaned})
-                        print(f"Added cleaned_ingredients to recipe {doc_id}: {cleaned}")
-                    except Exception as e:
-                        print(f"Failed to update recipe {doc_id}: {e}")
+            doc = change.document
+            data = doc.to_dict() or {}
+            if change.type.name == 'REMOVED':
+                if was_indexed(data):
+                    work.put(doc.id, ({k: v for k, v in data.items() if k != 'ingredients'}, read_time, False))
+            elif needs_cleaning(data, version, replay):
+                work.put(doc.id, (data, read_time, True))
+            elif source_changed(data):
+                work.put(doc.id, (data, read_time, False))
+
+    threads = [threading.Thread(target=clean_worker, args=(work, version, stats, stop, batch_size),
+                                daemon=True)
+               for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    def report():
+        while not stop.wait(report_every):
+            print(f"Queue depth {len(work)}, processed {stats.processed}, {stats.summary()}")
+
+    threading.Thread(target=report, daemon=True).start()
 
     # Attach the listener to the Firestore collection
-    collection_ref.on_snapshot(on_snapshot)
+    watch = collection_ref.on_snapshot(on_snapshot)
     print("Listening for new recipes...")
+    return stop, watch
 
 # Run the listener
-if __name__ == "_main_":
-    listen_for_new_recipes()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean users_recipes ingredients as recipes are added or edited.")
+    parser.add_argument('--workers', type=int, default=4, help="cleaning threads")
+    parser.add_argument('--batch-size', type=int, default=100, help="recipes committed per worker batch")
+    parser.add_argument('--report-every', type=int, default=30, help="seconds between queue/latency reports")
+    args = parser.parse_args()
+
+    metrics.start_job('cleanUserWord')
+    stop, watch = listen_for_new_recipes(workers=args.workers, batch_size=args.batch_size,
+                                         report_every=args.report_every)
     # Keep the script running to monitor Firestore in real-time
-    while True:
-        time.sleep(1)
\ No newline at end of file
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watch.unsubscribe()
+        stop.set()
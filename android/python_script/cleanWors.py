@@ -1,123 +1,118 @@
-import ast
-import nltk
-from nltk.corpus import wordnet as wn
-from nltk.tokenize import word_tokenize
-from firebase_admin import credentials, firestore, initialize_app
-import time
-
-
-# Initialize Firebase
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-initialize_app(cred)
-db = firestore.client()
-
-# Download necessary NLTK data
-nltk.download('wordnet')
-nltk.download('punkt')  # Ensure 'punkt' tokenizer data is downloaded
-
-def is_food_noun(word):
-    """
-    Check if a word is a food-related noun using WordNet.
-    """
-    for synset in wn.synsets(word, pos=wn.NOUN):  # Check only noun 
-        if synset.lexname() == 'noun.food':
-            return True
-    return False
-
-def clean_ingredients(ingredients_list):
-    """
-    Clean the ingredients list to retain only food-related nouns.
-    """
-    cleaned = []
-    for ingredient in ingredients_list:
-        words = word_tokenize(ingredient)  
-        for word in words:
-            word_lower = word.lower()
-            if is_food_noun(word_lower):  # Dynamically check if it's a food noun
-                cleaned.append(word_lower)
-    return list(set(cleaned))  # Remove duplicates
-
-def safely_parse_ingredients(raw_ingredients):
-    """
-    Safely parse the ingredients string into a Python list.
-    Handles cases where the format is not a valid Python literal.
-    """
-    try:
-        parsed_ingredients = ast.literal_eval(raw_ingredients)
-        if isinstance(parsed_ingredients, list):
-            return parsed_ingredients
-    except (SyntaxError, ValueError):
-        pass 
-
-    # Attempt manual parsing if literal_eval fails
-    if raw_ingredients.startswith("[") and raw_ingredients.endswith("]"):
-        # Remove brackets and split manually
-        raw_ingredients = raw_ingredients[1:-1]  # Strip brackets
-        items = raw_ingredients.split(",")  # Split by commas (assuming ingredients are comma-separated)
-        return [item.strip() for item in items]
-
-    print(f"Failed to parse ingredients: {raw_ingredients}")
-    return None
-
-def update_document_with_retry(doc_ref, data, retries=3, delay=2):
-    """
-    Retry logic for updating Firestore documents.
-    """
-    for attempt in range(retries):
-        try:
-            doc_ref.update(data)
-            return True
-        except Exception as e:
-            print(f"Retry {attempt + 1}/{retries} failed for {doc_ref.id}: {e}")
-            time.sleep(delay)
-    print(f"Failed to update document {doc_ref.id} after {retries} retries.")
-    return False
-
-def process_and_update_firestore():
+import argparse
+import functools
+from collections import deque
+import datastore
+import metrics
+from bulkwriter import BulkWriter
+from cleaning import cleaning_version, ingredients_hash
+from cleanpipeline import clean_chunk, run_cleaning_pipeline
+from ingredientindex import IndexUpdater
+from scan import Checkpoint, scan_pages
+from vocabulary import VocabularyUpdater, rerank_vocabulary
+
+
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
+
+def process_and_update_firestore(workers=0, full=False, restart=False):
     """
     Fetch ingredients from Firestore in batches, clean them, and update Firestore.
+    Recipes whose ingredients hash is unchanged since the last run are skipped
+    unless full is set. With workers > 1, reading, cleaning and writing run as
+    overlapping stages. An interrupted run resumes from its checkpoint unless
+    restart is set.
     """
-    recipes_ref = db.collection('recipes')  
+    version = cleaning_version()  # Loads the lexicon first, so a missing artifact fails before any I/O
+    recipes_ref = db.collection('recipes')
     batch_size = 100  # Number of documents to process in each batch
-    last_doc = None  # Keep track of the last document in the previous batch
-
-    while True:
-        # Fetch a batch of documents
-        query = recipes_ref.order_by('name').limit(batch_size)
-        if last_doc:
-            query = query.start_after(last_doc)
-
-        recipes = list(query.stream())  
-
-        if not recipes:
-            break  
-
-        for recipe in recipes:
-            try:
-                data = recipe.to_dict()
-                if 'ingredients' in data:  # Check if the ingredients field exists
-                    raw_ingredients = data['ingredients']
-                    if isinstance(raw_ingredients, str):  # Convert string to list
-                        ingredients_list = safely_parse_ingredients(raw_ingredients)
-                        if not ingredients_list:  # Skip if parsing failed
-                            print(f"Skipping recipe {recipe.id}: invalid ingredients format")
-                            continue
-
-                    # Clean the ingredients list
-                    cleaned = clean_ingredients(ingredients_list) 
-                    # Update Firestore with the cleaned ingredients
-                    update_document_with_retry(
-                        recipes_ref.document(recipe.id),
-                        {'cleaned_ingredients': cleaned}
-                    )
-                    print(f"Processed recipe {recipe.id}: {cleaned}")
-            except Exception as e:
-                print(f"Failed to process recipe {recipe.id}: {e}")
-
-        last_doc = recipes[-1]
-
-    print("All recipes processed.")
+    writer = BulkWriter(db)
+    index = IndexUpdater(db, writer)
+    vocabulary = VocabularyUpdater(db, writer)
+    skipped = 0
+    committed_pages = deque()  # Last IDs of pages whose recipe writes are done, added on the writer's threads
+    checkpoint = Checkpoint('cleanWors-recipes')
+    if restart:
+        checkpoint.clear()
+
+    # Only fetch what the cleaner needs
+    pages = scan_pages(recipes_ref, batch_size,
+                       select=['ingredients', 'cleaned_ingredients', 'cleaned_ingredients_hash'],
+                       checkpoint=checkpoint)
+
+    def make_task(doc):
+        nonlocal skipped
+        data = doc.to_dict()
+        if 'ingredients' not in data:  # Check if the ingredients field exists
+            return None
+        content_hash = ingredients_hash(data['ingredients'], version)
+        if not full and data.get('cleaned_ingredients_hash') == content_hash:
+            skipped += 1
+            return None
+        return (doc.id, data['ingredients'], (content_hash, data.get('cleaned_ingredients')))
+
+    def index_recipe(doc_id, old_cleaned, cleaned):
+        index.update('recipes', doc_id, old_cleaned, cleaned)
+        vocabulary.update('recipes', doc_id, old_cleaned, cleaned)
+
+    def write_result(doc_id, cleaned, context, error):
+        if error:
+            print(f"Skipping recipe {doc_id}: {error}")
+            return
+        content_hash, old_cleaned = context
+        # Queue the update; the writer commits it in a batch, and only then is it indexed
+        writer.update(recipes_ref.document(doc_id), {
+            'cleaned_ingredients': cleaned,
+            'cleaned_ingredients_hash': content_hash,
+        }, stamp=True, on_committed=functools.partial(index_recipe, doc_id, old_cleaned, cleaned))
+        metrics.current().progress()
+
+    def save_if_no_failures(last_id):
+        # After a failed write the checkpoint stays before that page, so a resumed run retries it
+        if not writer.failed:
+            checkpoint.save(last_id)
+
+    def flush_index():
+        # Pages taken here have all their committed recipes collected, so their index
+        # changes go out in this flush; the checkpoint moves once those are committed too
+        last_id = None
+        while committed_pages:
+            last_id = committed_pages.popleft()
+        index.flush()
+        vocabulary.flush()
+        if last_id is not None:
+            writer.after_committed(functools.partial(save_if_no_failures, last_id))
+
+    def page_done(last_id):
+        writer.after_committed(lambda: committed_pages.append(last_id))
+        flush_index()
+
+    if workers > 1:
+        run_cleaning_pipeline(pages, make_task, write_result, workers, on_page_done=page_done)
+    else:
+        for recipes in pages:
+            page = [task for task in map(make_task, recipes) if task]
+            for result in clean_chunk(page):
+                write_result(*result)
+            page_done(recipes[-1].id)
+
+    writer.flush()
+    flush_index()
+    writer.close()
+    rerank_vocabulary(db, vocabulary.touched)
+    if not writer.failed:
+        checkpoint.clear()
+    print(f"All recipes processed. {writer.committed} updated, {skipped} unchanged, "
+          f"{len(writer.failed)} failed.")
 
 # Fixed typo here: should be "__main__"
 if __name__ == "__main__":
-    process_and_update_firestore()
+    parser = argparse.ArgumentParser(description="Clean recipe ingredients into 'cleaned_ingredients'.")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="number of cleaning processes; 2 or more enables the pipelined mode")
+    parser.add_argument('--full', action='store_true',
+                        help="re-clean every recipe, even if its ingredients have not changed")
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore the checkpoint of an interrupted run and start from the beginning")
+    args = parser.parse_args()
+    metrics.start_job('cleanWors')
+    process_and_update_firestore(workers=args.workers, full=args.full, restart=args.restart)
@@ -0,0 +1,225 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+from foodlexicon import FoodLexicon, load_food_lexicon, require_nltk_data
+
+# Side-effect free on import, so cleaning worker processes can load it cheaply
+
+# Bump when clean_ingredients changes behaviour, so every recipe gets re-cleaned
+CLEANER_VERSION = 2
+
+# Quantity, preparation and filler words that are never kept, even when WordNet
+# files them under food (formerly the second pass in furthercleaning.py)
+STOPWORDS = frozenset({
+    'tbsp', 'tsp', 'etc', 'slice', 'slices', 'and', 'into', 'cubes', 'good',
+    'quality', 'shapes', 'chopped', 'finely', 'fresh', 'ground', 'handful',
+    'halves', 'pieces', 'whole', 'to', 'taste', 'grated', 'small', 'large',
+    'medium', 'pinch', 'optional', 'of', 'diced', 'for', 'cooking', 'or', 'such as'})
+
+# Changes whenever the word list changes, so edited lists re-clean everything
+STOPWORDS_VERSION = hashlib.sha1('\n'.join(sorted(STOPWORDS)).encode('utf-8')).hexdigest()[:12]
+
+# Runs of letters, optionally joined by hyphens ("extra-virgin"). Like the
+# Treebank tokenizer it splits off possessives and ignores numbers and
+# punctuation, but it is a single compiled scan instead of a cascade of regexes.
+_WORD_RE = re.compile(r"\b[^\W\d_]+(?:-[^\W\d_]+)*\b")
+
+# What the legacy cleaner made of a set of sample recipes, checked by test_cleaning.py
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_data', 'cleaning_golden.json')
+
+
+def is_food_noun(word):
+    """
+    Check if a word is a food-related noun using the precompiled WordNet food lexicon.
+    """
+    return load_food_lexicon().is_food_noun(word)
+
+class IngredientNormalizer:
+    """
+    Tokenize, drop stopwords, keep food nouns and deduplicate in one pass.
+
+    Every distinct word is classified once and the verdict is remembered, so
+    repeated words ("salt", "onion") cost a dict lookup.
+    """
+
+    def __init__(self, lexicon, stopwords=STOPWORDS):
+        self._lexicon = lexicon
+        self._stopwords = stopwords
+        self._verdicts = {}
+
+    def _keep(self, word):
+        verdict = self._verdicts.get(word)
+        if verdict is None:
+            verdict = self._verdicts[word] = word not in self._stopwords and self._lexicon.is_food_noun(word)
+        return verdict
+
+    def normalize(self, ingredients_list):
+        """Food nouns of the ingredients, in order of first appearance, without duplicates."""
+        cleaned = {}
+        for ingredient in ingredients_list:
+            for word in _WORD_RE.findall(ingredient.lower()):
+                if word not in cleaned and self._keep(word):
+                    cleaned[word] = None
+        return list(cleaned)
+
+
+_normalizers = {}
+
+
+def get_normalizer():
+    """The normalizer for the current lexicon, shared by every caller in the process."""
+    lexicon = load_food_lexicon()
+    if lexicon.version not in _normalizers:
+        _normalizers[lexicon.version] = IngredientNormalizer(lexicon)
+    return _normalizers[lexicon.version]
+
+def clean_ingredients(ingredients_list):
+    """
+    Clean the ingredients list to retain only food-related nouns.
+    """
+    return get_normalizer().normalize(ingredients_list)
+
+def legacy_clean_ingredients(ingredients_list):
+    """
+    The original two-stage result: NLTK word_tokenize plus the lexicon, then the
+    stopword filter furthercleaning.py applied. Only used to check the fused
+    pipeline against; needs the 'punkt_tab' tokenizer data.
+    """
+    require_nltk_data('tokenizers/punkt_tab')
+    from nltk.tokenize import word_tokenize
+
+    cleaned = []
+    for ingredient in ingredients_list:
+        words = word_tokenize(ingredient)
+        for word in words:
+            word_lower = word.lower()
+            if is_food_noun(word_lower):  # Dynamically check if it's a food noun
+                cleaned.append(word_lower)
+    return [word for word in set(cleaned) if word not in STOPWORDS]  # Remove duplicates
+
+def safely_parse_ingredients(raw_ingredients):
+    """
+    Safely parse the ingredients string into a Python list.
+    Handles cases where the format is not a valid Python literal.
+    """
+    try:
+        parsed_ingredients = ast.literal_eval(raw_ingredients)
+        if isinstance(parsed_ingredients, list):
+            return parsed_ingredients
+    except (SyntaxError, ValueError):
+        pass
+
+    # Attempt manual parsing if literal_eval fails
+    if raw_ingredients.startswith("[") and raw_ingredients.endswith("]"):
+        # Remove brackets and split manually
+        raw_ingredients = raw_ingredients[1:-1]  # Strip brackets
+        items = raw_ingredients.split(",")  # Split by commas (assuming ingredients are comma-separated)
+        return [item.strip() for item in items]
+
+    print(f"Failed to parse ingredients: {raw_ingredients}")
+    return None
+
+def ingredients_as_list(raw_ingredients):
+    """
+    Return the recipe's ingredients as a list, parsing the string form if needed.
+    Returns None when the value cannot be understood.
+    """
+    if isinstance(raw_ingredients, str):  # Convert string to list
+        return safely_parse_ingredients(raw_ingredients)
+    if isinstance(raw_ingredients, list):
+        return [str(item) for item in raw_ingredients]
+    return None
+
+def cleaning_version():
+    """Version of everything that shapes 'cleaned_ingredients' besides the input itself."""
+    return f"{CLEANER_VERSION}-{load_food_lexicon().version}-{STOPWORDS_VERSION}"
+
+def ingredients_hash(raw_ingredients, version):
+    """
+    Hash of an ingredients value together with the cleaner version.
+    A document whose stored hash matches does not need to be cleaned again.
+    """
+    payload = json.dumps([version, raw_ingredients], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def compare_with_legacy(recipes):
+    """
+    Run the fused and the legacy cleaners over ingredient lists and return the
+    (ingredients, fused, legacy) cases whose word sets differ.
+    """
+    mismatches = []
+    for ingredients_list in recipes:
+        fused = clean_ingredients(ingredients_list)
+        legacy = legacy_clean_ingredients(ingredients_list)
+        if set(fused) != set(legacy):
+            mismatches.append((ingredients_list, sorted(fused), sorted(legacy)))
+    return mismatches
+
+
+def write_golden(recipes, path=GOLDEN_PATH):
+    """
+    Record the legacy cleaner's output for the recipes, together with the
+    lexicon entries their words are looked up against, so the fused cleaner
+    can be checked against it without NLTK or the built artifact.
+    """
+    lexicon = load_food_lexicon()
+    words = {word for recipe in recipes for ingredient in recipe for word in _WORD_RE.findall(ingredient.lower())}
+    subset = lexicon.subset(words)
+    golden = {
+        'lexicon': {'version': lexicon.version, 'words': sorted(subset.words), 'exceptions': subset.exceptions},
+        'samples': [{'ingredients': recipe, 'cleaned': sorted(legacy_clean_ingredients(recipe))}
+                    for recipe in recipes],
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(golden, f, indent=1, ensure_ascii=False)
+        f.write('\n')
+
+
+def load_golden(path=GOLDEN_PATH):
+    """The recorded lexicon slice and the (ingredients, legacy cleaned words) samples."""
+    with open(path, encoding='utf-8') as f:
+        golden = json.load(f)
+    lexicon = golden['lexicon']
+    samples = [(sample['ingredients'], sample['cleaned']) for sample in golden['samples']]
+    return FoodLexicon(lexicon['words'], lexicon['exceptions'], lexicon['version']), samples
+
+
+def _recipes_from_export(path):
+    """Ingredient lists from an export.py dump (CSV or JSONL)."""
+    import csv
+    import sys
+
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    recipes = (ingredients_as_list(row.get('ingredients')) for row in rows)
+    return [recipe for recipe in recipes if recipe]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the fused cleaner against the legacy two-stage cleaner.")
+    parser.add_argument('--export', help="export.py dump (CSV or JSONL) to take recipes from "
+                                         "instead of the golden samples")
+    parser.add_argument('--write-golden', action='store_true',
+                        help=f"record the legacy cleaner's output for the recipes in {GOLDEN_PATH}")
+    args = parser.parse_args()
+
+    recipes = _recipes_from_export(args.export) if args.export else [sample for sample, _ in load_golden()[1]]
+    if args.write_golden:
+        write_golden(recipes)
+        print(f"Recorded the legacy output for {len(recipes)} recipes in {GOLDEN_PATH}.")
+        raise SystemExit(0)
+    mismatches = compare_with_legacy(recipes)
+    for ingredients_list, fused, legacy in mismatches[:20]:
+        print(f"{ingredients_list}\n  fused:  {fused}\n  legacy: {legacy}")
+    print(f"{len(recipes) - len(mismatches)} of {len(recipes)} recipes match the legacy cleaner.")
+    raise SystemExit(1 if mismatches else 0)
@@ -1,30 +1,26 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import datastore
+from audit import MissingField, run_audit
 
-# Initialize Firebase
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-firebase_admin.initialize_app(cred)
+parser = argparse.ArgumentParser(description="List recipes without 'cleaned_ingredients'.")
+parser.add_argument('--partitions', type=int, default=1, help="ID ranges to scan in parallel, e.g. 8")
+args = parser.parse_args()
 
-# Initialize Firestore
-db = firestore.client()
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
 
 # Define the Firestore collection name
 collection_name = 'recipes'  # Update with your collection name
 
-# Track documents without the 'cleanedingredients' field
-uncleaned_docs = []
-
-# Retrieve all documents and check for 'cleanedingredients' field
-docs = db.collection(collection_name).stream()
-for doc in docs:
-    data = doc.to_dict()
-    if 'cleanedingredients' not in data:
-        uncleaned_docs.append(doc.id)
+# Track documents without the 'cleaned_ingredients' field, fetching only that field
+missing_cleaned = MissingField('cleaned_ingredients')
+run_audit(db, collection_name, [missing_cleaned], partitions=args.partitions)
+uncleaned_docs = missing_cleaned.doc_ids
 
 # Output the result
 if uncleaned_docs:
-    print("The following documents are missing the 'cleanedingredients' field:")
+    print("The following documents are missing the 'cleaned_ingredients' field:")
     for doc_id in uncleaned_docs:
         print(f"Document ID: {doc_id}")
 else:
-    print("All documents are updated with the 'cleanedingredients' field.")
+    print("All documents are updated with the 'cleaned_ingredients' field.")
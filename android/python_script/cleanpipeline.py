@@ -0,0 +1,138 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+from cleaning import clean_ingredients, ingredients_as_list
+from foodlexicon import LEXICON_PATH, load_food_lexicon
+
+# Overlaps the three stages of a re-clean: a reader thread pages ahead through
+# Firestore, a process pool tokenizes and classifies, and the caller's writer
+# commits. Every hand-off is bounded so a slow stage throttles the ones before it.
+
+_DONE = object()
+
+
+def _init_worker(lexicon_path):
+    """Load the food lexicon once per worker process instead of once per chunk."""
+    load_food_lexicon(lexicon_path, build_if_missing=False)
+
+
+def clean_chunk(chunk):
+    """
+    Clean a list of (doc_id, raw_ingredients, context) tasks.
+    Returns (doc_id, cleaned, context, error) tuples; cleaned is None when the
+    recipe was skipped. context is whatever the caller needs back when writing
+    the result (e.g. the content hash) and is passed through untouched.
+    """
+    job = metrics.current()
+    results = []
+    for doc_id, raw_ingredients, context in chunk:
+        try:
+            with job.time('parse'):
+                ingredients_list = ingredients_as_list(raw_ingredients)
+            if not ingredients_list:  # Skip if parsing failed
+                results.append((doc_id, None, context, "invalid ingredients format"))
+                continue
+            with job.time('normalize'):  # Tokenizing and classifying are one pass in the normalizer
+                cleaned = clean_ingredients(ingredients_list)
+            results.append((doc_id, cleaned, context, None))
+        except Exception as e:
+            results.append((doc_id, None, context, str(e)))
+    return results
+
+
+def _clean_chunk_in_worker(chunk):
+    """clean_chunk in a pool process; the stage timings go back to the parent with the results."""
+    with metrics.collect() as job:
+        results = clean_chunk(chunk)
+    return results, {stage: histogram.as_dict() for stage, histogram in job.stages.items()}
+
+
+def _put(out_queue, item, stop):
+    """Block on a full queue, but give up once the pipeline is shutting down."""
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def read_pages(pages, make_task, out_queue, stop):
+    """
+    Reader stage: pull pages of documents and pass (tasks, last_id) downstream.
+    make_task(doc) returns a (doc_id, raw_ingredients, context) task, or None
+    to leave the document alone; only the task crosses the process boundary.
+    """
+    try:
+        for docs in pages:
+            if stop.is_set():
+                return
+            tasks = [task for task in map(make_task, docs) if task]
+            if not _put(out_queue, (tasks, docs[-1].id), stop):
+                return
+        _put(out_queue, _DONE, stop)
+    except Exception as e:
+        _put(out_queue, e, stop)
+
+
+def run_cleaning_pipeline(pages, make_task, on_result, workers, on_page_done=None,
+                          chunk_size=25, pages_ahead=4):
+    """
+    Clean every recipe in pages (an iterable of document lists, see scan.scan_pages)
+    using a pool of worker processes.
+
+    make_task(doc) picks the documents to clean (see read_pages), and
+    on_result(doc_id, cleaned, context, error) is called in the calling
+    thread for each recipe, in page order; hand the write to a BulkWriter there
+    so commits overlap with reading and cleaning. on_page_done(last_id) is
+    called after the last result of each page.
+    """
+    load_food_lexicon()  # Build the artifact once here rather than racing in every worker
+
+    page_queue = queue.Queue(maxsize=pages_ahead)
+    stop = threading.Event()
+    reader = threading.Thread(target=read_pages, args=(pages, make_task, page_queue, stop), daemon=True)
+    pending = deque()  # chunk futures, plus the last ID of each page as a page-end marker
+    max_pending = workers * 2  # Keep every worker busy without buffering the whole collection
+
+    def drain(item):
+        if isinstance(item, str):
+            if on_page_done:
+                on_page_done(item)
+            return
+        results, stages = item.result()
+        metrics.current().merge_stages(stages)
+        for result in results:
+            on_result(*result)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(LEXICON_PATH,)) as pool:
+        reader.start()
+        try:
+            while True:
+                page = page_queue.get()
+                if page is _DONE:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+
+                tasks, last_id = page
+                for start in range(0, len(tasks), chunk_size):
+                    pending.append(pool.submit(_clean_chunk_in_worker, tasks[start:start + chunk_size]))
+                    while len(pending) > max_pending:
+                        drain(pending.popleft())
+                pending.append(last_id)
+
+            while pending:
+                drain(pending.popleft())
+        finally:
+            stop.set()
+            for item in pending:
+                if not isinstance(item, str):
+                    item.cancel()
+            reader.join()
@@ -0,0 +1,22 @@
+import pytest
+
+from localstore import LocalStore
+
+
+class FailingStore(LocalStore):
+    """A local store whose writes to the document IDs in failing fail, like a rejected Firestore write."""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+    def _commit(self, ops):
+        for _, ref, _, _ in ops:
+            if ref.id in self.failing:
+                raise ValueError(f"Injected failure writing {ref.path}")
+        return super()._commit(ops)
+
+
+@pytest.fixture
+def failing_store():
+    return FailingStore()
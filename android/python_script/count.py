@@ -1,16 +1,16 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import datastore
+from audit import count_documents
 
-# Initialize the Firebase app (replace with the path to your Firebase Admin SDK JSON file)
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-firebase_admin.initialize_app(cred)
+parser = argparse.ArgumentParser(description="Count the documents in 'recipes'.")
+parser.add_argument('--mirror', action='store_true', help="read the local mirror (see mirror.py)")
+args = parser.parse_args()
 
-# Initialize Firestore
-db = firestore.client()
+# Firestore, the local mirror, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect('mirror' if args.mirror else None)
 
-# Count documents in "recipes" collection
+# Count documents in "recipes" collection with a server-side aggregation
 recipes_collection = db.collection("recipes")
-docs = recipes_collection.stream()
-count = sum(1 for _ in docs)
+count = count_documents(recipes_collection)
 
 print(f"The 'recipes' collection contains {count} documents.")
@@ -0,0 +1,116 @@
+import os
+import threading
+
+# Where the maintenance scripts read and write. QOOT_DATASTORE selects the backend:
+#
+#   firestore            the production project (default), using QOOT_SERVICE_ACCOUNT
+#   memory               an empty in-memory local store
+#   sqlite:<path>        a local store kept in a SQLite file (see localstore.py)
+#   mirror               the local mirror kept up to date by mirror.py ($QOOT_MIRROR)
+#
+# Scripts call connect() instead of initializing Firebase themselves, so the
+# same job can be run against a local copy for testing and benchmarking. The
+# client libraries are only imported when the client is first used, so a
+# script that exits early (--help, a missing artifact) starts in milliseconds.
+
+DATASTORE_ENV = 'QOOT_DATASTORE'
+SERVICE_ACCOUNT_ENV = 'QOOT_SERVICE_ACCOUNT'
+DEFAULT_SERVICE_ACCOUNT = '/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json'
+MIRROR_ENV = 'QOOT_MIRROR'
+STORAGE_BUCKET_ENV = 'QOOT_STORAGE_BUCKET'  # Firebase Storage bucket, for scripts that upload files
+DEFAULT_MIRROR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mirror.sqlite')
+
+# Write transforms, looked up in firebase_admin.firestore on first use (see __getattr__)
+TRANSFORMS = ('ArrayUnion', 'ArrayRemove', 'Increment', 'DELETE_FIELD', 'SERVER_TIMESTAMP')
+
+_clients = {}
+_lock = threading.Lock()
+
+
+class LazyClient:
+    """Stands in for a client and opens the real one on first attribute access."""
+
+    def __init__(self, url):
+        self._url = url
+        self._client = None
+        self._open_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._open_lock:
+                if self._client is None:
+                    self._client = _open(self._url)
+        return getattr(self._client, name)
+
+    def __repr__(self):
+        return f"<LazyClient {self._url} ({'open' if self._client is not None else 'not opened'})>"
+
+
+def connect(url=None):
+    """The client for url (default: $QOOT_DATASTORE, else Firestore), created once per process."""
+    url = url or os.environ.get(DATASTORE_ENV) or 'firestore'
+    with _lock:
+        if url not in _clients:
+            _clients[url] = LazyClient(url)
+        return _clients[url]
+
+
+def __getattr__(name):
+    """
+    datastore.DELETE_FIELD etc.; the local store recognises them too.
+    datastore.NotFound is the error both backends raise for a missing document.
+    """
+    if name in TRANSFORMS:
+        from firebase_admin import firestore
+
+        return getattr(firestore, name)
+    if name == 'NotFound':
+        try:
+            from google.api_core.exceptions import NotFound
+        except ImportError:  # What the local store raises without the Google client libraries
+            return LookupError
+        return NotFound
+    raise AttributeError(f"module 'datastore' has no attribute {name!r}")
+
+
+def _open(url):
+    if url == 'firestore':
+        from firebase_admin import firestore
+
+        return firestore.client(firebase_app())
+
+    from localstore import LocalStore
+
+    if url == 'mirror':
+        path = mirror_path()
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No mirror at {path}; create it with: python mirror.py")
+        return LocalStore(path)
+    if url == 'memory':
+        return LocalStore()
+    if url.startswith('sqlite:'):
+        return LocalStore(url[len('sqlite:'):])
+    raise ValueError(f"Unknown datastore {url!r}; expected 'firestore', 'mirror', 'memory' or 'sqlite:<path>'")
+
+
+def firebase_app():
+    """The default Firebase app, initialized from the service account on first use."""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with _lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:  # Not initialized yet
+            cred = credentials.Certificate(os.environ.get(SERVICE_ACCOUNT_ENV) or DEFAULT_SERVICE_ACCOUNT)
+            bucket = os.environ.get(STORAGE_BUCKET_ENV)
+            return firebase_admin.initialize_app(cred, {'storageBucket': bucket} if bucket else None)
+
+
+def mirror_path():
+    return os.environ.get(MIRROR_ENV) or DEFAULT_MIRROR
+
+
+def is_local(db):
+    """Whether db is a local store (which counts its own operations in db.ops)."""
+    return hasattr(db, 'ops')
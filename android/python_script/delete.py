@@ -1,21 +1,142 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import datastore
+import metrics
+from audit import count_documents
+from bulkwriter import BulkWriter
+from scan import scan_pages
 
-# Initialize the Firebase app (replace with the path to your Firebase Admin SDK JSON file)
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
 
-firebase_admin.initialize_app(cred)
+FILTER_OPS = ('==', '!=', '<', '<=', '>', '>=', 'in', 'not-in', 'array_contains', 'array_contains_any')
 
-# Initialize Firestore
-db = firestore.client()
-recipes_collection = db.collection("recipes")
 
-# Query and delete 900 documents
-docs = recipes_collection.limit(900).stream()
-delete_count = 0
+def parse_value(text):
+    """A --where value: JSON when it parses (numbers, true, lists), otherwise the plain string."""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
 
-for doc in docs:
-    doc.reference.delete()
-    delete_count += 1
 
-print(f"Deleted {delete_count} documents from the 'recipes' collection.")
+class _Progress:
+    """Rate-limited 'deleted N (x docs/s), M remaining' lines."""
+
+    def __init__(self, writer, total, every=5.0):
+        self._writer = writer
+        self._total = total
+        self._every = every
+        self._start = self._last = time.monotonic()
+        self.queued = 0  # top-level documents queued for deletion
+
+    def tick(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < self._every:
+            return
+        self._last = now
+        elapsed = now - self._start
+        remaining = f", about {max(self._total - self.queued, 0)} remaining" if self._total is not None else ""
+        print(f"Deleted {self._writer.committed} documents ({self._writer.committed / elapsed:,.0f} docs/s)"
+              f"{remaining}")
+
+
+def _delete_subcollections(doc_ref, delete):
+    """Queue every document below doc_ref, deepest first, and return how many there were."""
+    count = 0
+    for subcollection in doc_ref.collections():
+        # list_documents() also returns "missing" parents that only hold deeper subcollections
+        for child_ref in subcollection.list_documents():
+            count += _delete_subcollections(child_ref, delete)
+            delete(child_ref)
+            count += 1
+    return count
+
+
+def _ref_pages(query, list_all, page_size):
+    """
+    Pages of document references. Queries fetch IDs only; list_all walks the
+    collection's listing instead, which also finds documents that no longer
+    exist but still have subcollections under them.
+    """
+    if list_all:
+        refs = iter(query.list_documents())
+        while True:
+            page = list(itertools.islice(refs, page_size))
+            if not page:
+                return
+            yield page
+    else:
+        for page in scan_pages(query, page_size, select=[]):
+            yield [doc.reference for doc in page]
+
+
+def bulk_delete(collection_path, where=None, recursive=False, page_size=500, max_in_flight=8,
+                threads=8, dry_run=False):
+    """
+    Delete every document of a collection (or the part of it matching where).
+
+    Documents are listed by ID without their fields and deleted in full
+    batches, max_in_flight commits at a time. With recursive, each document's
+    subcollections (e.g. users/{uid}/planner/{week}/...) are found by a pool
+    of threads and deleted before the document itself, so nothing is left
+    orphaned. dry_run counts what would be deleted without deleting it.
+    """
+    query = db.collection(collection_path)
+    for field, op, value in where or []:
+        query = query.where(field, op, value)
+    total = count_documents(query)
+    print(f"{total} documents in '{collection_path}' match"
+          + (" (subcollections included in the deletion)" if recursive else ""))
+
+    writer = BulkWriter(db, max_in_flight=max_in_flight)
+    delete = (lambda ref: None) if dry_run else writer.delete
+    progress = _Progress(writer, total)
+    nested = 0
+    pool = ThreadPoolExecutor(max_workers=threads) if recursive else None
+    try:
+        for refs in _ref_pages(query, recursive and not where, page_size):
+            if pool:
+                # Listing subcollections is one round trip per document, so overlap them
+                nested += sum(pool.map(lambda ref: _delete_subcollections(ref, delete), refs))
+            for ref in refs:
+                delete(ref)
+            progress.queued += len(refs)
+            progress.tick()
+    finally:
+        if pool:
+            pool.shutdown()
+        writer.close()
+
+    if dry_run:
+        print(f"Dry run: would delete {progress.queued} documents and {nested} documents in subcollections.")
+    else:
+        progress.tick(force=True)
+        print(f"Deleted {writer.committed} documents ({nested} in subcollections), {len(writer.failed)} failed.")
+    return writer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete a collection, or part of it, in parallel batches.")
+    parser.add_argument('collection', nargs='?', default="recipes",
+                        help="collection path, e.g. recipes or users/<uid>/planner")
+    parser.add_argument('--where', nargs=3, action='append', metavar=('FIELD', 'OP', 'VALUE'),
+                        help=f"only delete matching documents; OP is one of {' '.join(FILTER_OPS)}")
+    parser.add_argument('--recursive', action='store_true', help="also delete the documents' subcollections")
+    parser.add_argument('--in-flight', type=int, default=8, help="batch commits running at once")
+    parser.add_argument('--threads', type=int, default=8, help="threads listing subcollections")
+    parser.add_argument('--dry-run', action='store_true', help="count what would be deleted")
+    args = parser.parse_args()
+
+    metrics.start_job('delete')
+
+    where = []
+    for field, op, value in args.where or []:
+        if op not in FILTER_OPS:
+            parser.error(f"unknown operator {op!r}")
+        where.append((field, op, parse_value(value)))
+    bulk_delete(args.collection, where, recursive=args.recursive, max_in_flight=args.in_flight,
+                threads=args.threads, dry_run=args.dry_run)
@@ -1,24 +1,221 @@
 
-import firebase_admin
-from firebase_admin import credentials, firestore
-import pandas as pd
+import argparse
+import csv
+import datetime
+import json
+import os
+import datastore
+import metrics
+from scan import scan_documents, scan_partitioned
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
 
 # Specify your Firestore collection name
 collection_name = "recipes"
 
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+
+def format_for(output_file):
+    extension = os.path.splitext(output_file)[1].lstrip('.').lower()
+    return extension if extension in FORMATS else 'csv'
+
+
+def csv_value(value):
+    """Render a field the way the old pandas export did."""
+    if value is None:
+        return ''
+    return str(value)
+
+
+def _to_json(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _kind(value):
+    """Coarse type of a field value, used to pick a Parquet column type."""
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'str'
+    if isinstance(value, datetime.datetime):
+        return 'timestamp'
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return 'str_list'
+    return 'other'
+
+
+def _rows(collection_name, fields, include_id, page_size, partitions=1):
+    """Stream (row dict) per document, one page in memory at a time."""
+    collection_ref = db.collection(collection_name)
+    if partitions > 1:  # Rows come out grouped by ID range instead of in ID order
+        docs = (doc for page in scan_partitioned(db, collection_ref, partitions, page_size, select=fields)
+                for doc in page)
+    else:
+        docs = scan_documents(collection_ref, page_size, select=fields)
+    for doc in docs:
+        row = doc.to_dict()
+        if include_id:
+            row = {'document_id': doc.id, **row}
+        yield row
+
+
+def export_collection(collection_name, output_file, fields=None, fmt=None, include_id=False, page_size=500,
+                      partitions=1):
+    """
+    Export a Firestore collection to CSV, JSONL or Parquet in constant memory.
+
+    Documents are read page by page and only the requested fields are fetched.
+    JSONL, and CSV with an explicit field list, are written as pages arrive.
+    Otherwise the columns are the union of every document's fields, which is
+    only known at the end, so rows are spooled to a temporary JSONL file and
+    then written out in chunks (Parquet row groups) with a stable schema.
+    partitions > 1 reads that many ID ranges at once (see scan.scan_partitioned).
+    """
+    fmt = fmt or format_for(output_file)
+    rows = _rows(collection_name, fields, include_id, page_size, partitions)
+    columns = (['document_id'] if include_id else []) + list(fields) if fields else None
+
+    if fmt == 'jsonl':
+        count = _write_jsonl(rows, output_file)
+    elif fmt == 'csv' and columns:
+        count = _write_csv(rows, output_file, columns)
+    else:
+        spool_file = output_file + '.spool'
+        try:
+            count, columns, kinds = _spool(rows, spool_file)
+            spooled = _read_spool(spool_file, kinds)
+            if fmt == 'parquet':
+                _write_parquet(spooled, output_file, columns, kinds, page_size)
+            else:
+                _write_csv(spooled, output_file, columns)
+        finally:
+            if os.path.exists(spool_file):
+                os.remove(spool_file)
+
+    print(f"Exported {count} documents to {output_file}")
+    return count
+
+
+def _write_jsonl(rows, output_file):
+    count = 0
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, default=_to_json) + '\n')
+            count += 1
+    return count
+
+
+def _write_csv(rows, output_file, columns):
+    count = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([csv_value(row.get(column)) for column in columns])
+            count += 1
+    return count
+
+
+def _spool(rows, spool_file):
+    """Write rows to a JSONL spool, collecting the column union (in first-seen order) and kinds."""
+    columns = {}
+    count = 0
+    with open(spool_file, 'w', encoding='utf-8') as f:
+        for row in rows:
+            for column, value in row.items():
+                kinds = columns.setdefault(column, set())
+                if value is not None:
+                    kinds.add(_kind(value))
+            f.write(json.dumps(row, ensure_ascii=False, default=_to_json) + '\n')
+            count += 1
+    return count, list(columns), columns
+
+
+def _read_spool(spool_file, kinds):
+    timestamp_columns = [column for column, k in kinds.items() if k == {'timestamp'}]
+    with open(spool_file, encoding='utf-8') as f:
+        for line in f:
+            row = json.loads(line)
+            for column in timestamp_columns:
+                if row.get(column) is not None:
+                    row[column] = datetime.datetime.fromisoformat(row[column])
+            yield row
+
+
+def _write_parquet(rows, output_file, columns, kinds, chunk_size):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, _arrow_type(pa, kinds[column])) for column in columns])
+    converters = [_arrow_converter(kinds[column]) for column in columns]
+
+    with pq.ParquetWriter(output_file, schema) as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                writer.write_table(_table(pa, schema, columns, converters, chunk))
+                chunk = []
+        if chunk:
+            writer.write_table(_table(pa, schema, columns, converters, chunk))
+
+
+def _arrow_type(pa, kinds):
+    if kinds == {'bool'}:
+        return pa.bool_()
+    if kinds == {'int'}:
+        return pa.int64()
+    if kinds and kinds <= {'int', 'float'}:
+        return pa.float64()
+    if kinds == {'timestamp'}:
+        return pa.timestamp('us', tz='UTC')
+    if kinds == {'str_list'}:
+        return pa.list_(pa.string())
+    return pa.string()
+
+
+def _arrow_converter(kinds):
+    """Coerce a value to the column's Arrow type; mixed columns fall back to strings."""
+    if kinds and kinds <= {'int', 'float'} and kinds != {'int'}:
+        return lambda value: None if value is None else float(value)
+    if kinds in ({'bool'}, {'int'}, {'timestamp'}, {'str_list'}):
+        return lambda value: value
+    return lambda value: None if value is None else (
+        value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=_to_json))
+
+
+def _table(pa, schema, columns, converters, chunk):
+    arrays = {column: [convert(row.get(column)) for row in chunk]
+              for column, convert in zip(columns, converters)}
+    return pa.Table.from_pydict(arrays, schema=schema)
+
+
 # Export Firestore collection to CSV
 def export_to_csv(collection_name, output_file):
-    docs = db.collection(collection_name).stream()
-    data = [doc.to_dict() for doc in docs]
-    df = pd.DataFrame(data)
-    df.to_csv(output_file, index=False)
-    print(f"Data exported to {output_file}")
+    export_collection(collection_name, output_file, fmt='csv')
 
 if __name__ == "__main__":
-    export_to_csv(collection_name, "/Users/saraabdullah/Desktop/NEWoutput.csv")
+    parser = argparse.ArgumentParser(description="Export a Firestore collection to CSV, JSONL or Parquet.")
+    parser.add_argument('collection', nargs='?', default=collection_name)
+    parser.add_argument('output', nargs='?', default="/Users/saraabdullah/Desktop/NEWoutput.csv")
+    parser.add_argument('--fields', nargs='+', help="only export these fields")
+    parser.add_argument('--format', choices=FORMATS, help="output format (default: from the file extension)")
+    parser.add_argument('--include-id', action='store_true', help="add a 'document_id' column")
+    parser.add_argument('--mirror', action='store_true', help="read the local mirror (see mirror.py)")
+    parser.add_argument('--partitions', type=int, default=1, help="ID ranges to scan in parallel, e.g. 8")
+    args = parser.parse_args()
+
+    metrics.start_job('export')
+    if args.mirror:
+        db = datastore.connect('mirror')
+    export_collection(args.collection, args.output, fields=args.fields, fmt=args.format,
+                      include_id=args.include_id, partitions=args.partitions)
 
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+
+# Bump when the artifact layout or the extraction rules change
+LEXICON_FORMAT = 3
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'food_lexicon.json')
+
+# WordNet's noun detachment rules (see nltk's morphy), used to map plurals to lemmas
+NOUN_SUFFIXES = [
+    ("s", ""), ("ses", "s"), ("ves", "f"), ("xes", "x"), ("zes", "z"),
+    ("ches", "ch"), ("shes", "sh"), ("men", "man"), ("ies", "y"),
+]
+
+_cache = {}
+
+
+class FoodLexicon:
+    """
+    The set of WordNet 'noun.food' lemmas, loaded from the precompiled artifact.
+
+    Multi-word lemmas are stored with spaces ("olive oil"). The cleaner looks
+    words up one token at a time, so it never matches them; they are kept so
+    the artifact lists the whole category. `word in lexicon` is a plain set
+    lookup; is_food_noun() also resolves plurals and irregular forms the same
+    way wn.synsets() does.
+    """
+
+    def __init__(self, words, exceptions, version):
+        self.words = frozenset(words)
+        self.exceptions = exceptions  # irregular noun form -> food lemmas it maps to
+        self.version = version
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def __len__(self):
+        return len(self.words)
+
+    def is_food_noun(self, word):
+        """Check if a lowercase word is (an inflection of) a food noun."""
+        if word in self.words:
+            return True
+        if word in self.exceptions:
+            # WordNet does not apply the suffix rules to irregular forms
+            return bool(self.exceptions[word])
+        for suffix, ending in NOUN_SUFFIXES:
+            if word.endswith(suffix) and word[:len(word) - len(suffix)] + ending in self.words:
+                return True
+        return False
+
+    def subset(self, words, version=None):
+        """A smaller lexicon that classifies the given words exactly like this one."""
+        kept, exceptions = set(), {}
+        for word in words:
+            if word in self.exceptions:
+                exceptions[word] = self.exceptions[word]
+            candidates = [word] + [word[:len(word) - len(suffix)] + ending
+                                   for suffix, ending in NOUN_SUFFIXES if word.endswith(suffix)]
+            kept.update(candidate for candidate in candidates if candidate in self.words)
+        return FoodLexicon(kept, exceptions, version or self.version)
+
+
+def require_nltk_data(*resources):
+    """
+    Fail fast when NLTK data is missing instead of downloading it at run time.
+    resources are nltk.data paths such as 'corpora/wordnet'.
+    """
+    import nltk
+
+    missing = []
+    for resource in resources:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(resource)
+    if missing:
+        names = ' '.join(resource.split('/')[-1] for resource in missing)
+        raise LookupError(f"NLTK data not installed: {', '.join(missing)}. "
+                          f"Install it once with: python -m nltk.downloader {names}")
+
+
+def build_food_lexicon():
+    """
+    Extract every 'noun.food' lemma from WordNet.
+    Returns the artifact dict written by save_food_lexicon().
+    """
+    require_nltk_data('corpora/wordnet')
+    from nltk.corpus import wordnet as wn
+
+    words = set()
+    for synset in wn.all_synsets('n'):
+        if synset.lexname() == 'noun.food':
+            words.update(name.replace('_', ' ').lower() for name in synset.lemma_names())
+
+    # Irregular plurals ("geese" -> "goose"); keep every form so the rules are skipped for them
+    exceptions = {}
+    for form, bases in getattr(wn, '_exception_map', {}).get('n', {}).items():
+        exceptions[form.replace('_', ' ')] = sorted(
+            base.replace('_', ' ') for base in bases if base.replace('_', ' ') in words
+        )
+
+    sorted_words = sorted(words)
+    digest = hashlib.sha1('\n'.join(sorted_words).encode('utf-8')).hexdigest()[:12]
+    return {
+        'format': LEXICON_FORMAT,
+        'wordnet': wn.get_version(),
+        'version': f"{LEXICON_FORMAT}-{digest}",
+        'words': sorted_words,
+        'exceptions': exceptions,
+    }
+
+
+def save_food_lexicon(artifact, path=LEXICON_PATH):
+    """Write the artifact atomically so a crashed build never leaves a half file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_food_lexicon(path=LEXICON_PATH, build_if_missing=True):
+    """
+    Load the food lexicon, building and caching it on disk if it is missing or stale.
+    The result is memoized per path, so repeated calls are free.
+    """
+    if path in _cache:
+        return _cache[path]
+
+    artifact = None
+    try:
+        with open(path, encoding='utf-8') as f:
+            artifact = json.load(f)
+        if artifact.get('format') != LEXICON_FORMAT:
+            artifact = None
+    except (OSError, ValueError):
+        artifact = None
+
+    if artifact is None:
+        if not build_if_missing:
+            raise FileNotFoundError(f"Food lexicon not found or outdated: {path}")
+        artifact = build_food_lexicon()
+        save_food_lexicon(artifact, path)
+        print(f"Built food lexicon with {len(artifact['words'])} words at {path}")
+
+    lexicon = FoodLexicon(artifact['words'], artifact['exceptions'], artifact['version'])
+    _cache[path] = lexicon
+    return lexicon
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the food lexicon artifact from WordNet.")
+    parser.add_argument('--download', action='store_true',
+                        help="download the WordNet corpus first (the only step that uses the network)")
+    args = parser.parse_args()
+    if args.download:
+        import nltk
+        nltk.download('wordnet')
+
+    artifact = build_food_lexicon()
+    save_food_lexicon(artifact)
+    print(f"Saved {len(artifact['words'])} food words (version {artifact['version']}) to {LEXICON_PATH}")
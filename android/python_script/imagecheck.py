@@ -0,0 +1,455 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+from PIL import Image, ImageOps
+
+import datastore
+import metrics
+from bulkwriter import BulkWriter
+from ratelimit import backoff
+from scan import scan_documents
+
+# Check every recipe's image URL ahead of time, so the list screens stop
+# probing images from the device (SelectIngredients.isImageAccessible) and
+# stop downloading full-size images for thumbnails.
+#
+# Unique URLs are checked concurrently over one pooled, keep-alive session,
+# with at most per_host connections to any one host; the queue is interleaved
+# by host so a slow host does not hold up the rest. Results are cached on disk
+# by URL for a while (dead links for less), so a rerun only checks what is due.
+# Dead links are flagged on the recipes in batches through BulkWriter:
+#
+#   recipes/{id}   {image_dead: true}          removed again once the image loads
+#                  {thumbnail: "<url>"}         with --thumbnails --upload
+#
+# Only definite answers (a 404, a host that does not resolve, an HTML page or
+# undecodable bytes where an image should be) flag a link; timeouts and
+# server errors leave it as it was until the next run.
+#
+#   python imagecheck.py stub --port 8766         a local image server for testing
+#   python imagecheck.py --thumbnails --upload     check, then upload list thumbnails
+
+IMAGE_CACHE_ENV = 'QOOT_IMAGE_CACHE'
+IMAGE_CACHE_PATH = os.environ.get(IMAGE_CACHE_ENV) or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'image_cache.jsonl')
+THUMBNAIL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thumbnails')
+
+DEFAULT_COLLECTIONS = ['recipes', 'users_recipes']
+
+ALIVE_TTL = 7 * 24 * 3600  # Seconds a working image is trusted
+DEAD_TTL = 24 * 3600  # Dead links are checked again sooner, in case they come back
+
+THUMBNAIL_SIZE = 320  # Longest side, in pixels; list tiles are at most ~160 dp wide
+THUMBNAIL_QUALITY = 80
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+# Statuses that mean the image is gone, and those worth asking again
+DEAD_STATUSES = {400, 401, 403, 404, 410, 451}
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# Servers that refuse HEAD but serve GET
+HEAD_REFUSED = {403, 405, 501}
+
+
+def image_url(data):
+    """The image the list screens show: 'image', or the first of a list."""
+    image = data.get('image')
+    if isinstance(image, list):
+        image = image[0] if image else None
+    return image.strip() if isinstance(image, str) and image.strip() else None
+
+
+def thumbnail_name(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:20] + '.jpg'
+
+
+class ImageCache:
+    """
+    Check results by URL, kept in an append-only JSON-lines file; the last
+    line for a URL wins. Each entry holds 'dead', 'status' and 'checked_at',
+    and 'thumbnail' (an uploaded URL) once there is one.
+    """
+
+    def __init__(self, path=IMAGE_CACHE_PATH):
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line torn by a crash
+                    self._entries[entry['url']] = entry
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url):
+        return self._entries.get(url)
+
+    def fresh(self, url, now=None):
+        """The entry for url if it has not expired yet."""
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        ttl = DEAD_TTL if entry['dead'] else ALIVE_TTL
+        return entry if (now or time.time()) - entry['checked_at'] < ttl else None
+
+    def put(self, url, **fields):
+        with self._lock:
+            entry = self._entries[url] = {**self._entries.get(url, {}), 'url': url, **fields}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            return entry
+
+
+def interleave_by_host(urls):
+    """Round-robin over the URLs' hosts, so workers spread over hosts instead of queueing on one."""
+    by_host = defaultdict(deque)
+    for url in urls:
+        by_host[urllib.parse.urlsplit(url).hostname].append(url)
+    queues = deque(by_host.values())
+    while queues:
+        queue = queues.popleft()
+        yield queue.popleft()
+        if queue:
+            queues.append(queue)
+
+
+def make_thumbnail(data, path):
+    """Down-scale image bytes to a JPEG thumbnail at path; raises OSError if they are not an image."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('RGB', (THUMBNAIL_SIZE, THUMBNAIL_SIZE))  # JPEGs decode at a fraction of the size
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + '.partial'
+        image.save(partial, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        os.replace(partial, path)
+
+
+class ImageChecker:
+    """Checks URLs over one pooled session; optionally downloads each live image once to make its thumbnail."""
+
+    def __init__(self, concurrency=32, per_host=4, timeout=30.0, max_attempts=4, thumbnail_dir=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=min(timeout, 10.0))
+        self.max_attempts = max_attempts
+        self.thumbnail_dir = thumbnail_dir
+
+    def check_all(self, urls, on_result):
+        """Check every URL; on_result(url, result) is called as each finishes (result None: no verdict)."""
+        asyncio.run(self._check_all(urls, on_result))
+
+    async def _check_all(self, urls, on_result):
+        pending = deque(interleave_by_host(urls))
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host,
+                                         ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector, timeout=self.timeout,
+                                         headers={'User-Agent': 'qoot-imagecheck/1'}) as session:
+            async def worker():
+                while pending:
+                    url = pending.popleft()
+                    on_result(url, await self.check(session, url))
+
+            await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(pending)))))
+
+    async def check(self, session, url):
+        """{'dead', 'status'} plus 'thumbnail_path' for a live image when thumbnails are on; None if undecided."""
+        if urllib.parse.urlsplit(url).scheme not in ('http', 'https'):
+            return {'dead': True, 'status': 'bad-url'}
+        job = metrics.current()
+        want_image = self.thumbnail_dir is not None
+        method = 'GET' if want_image else 'HEAD'
+        for attempt in range(self.max_attempts):
+            if attempt:
+                job.count('retries')
+            try:
+                job.count('probe')
+                async with session.request(method, url, allow_redirects=True) as response:
+                    status = response.status
+                    if method == 'HEAD' and status in HEAD_REFUSED:
+                        method = 'GET'
+                        continue
+                    if status in RETRYABLE_STATUSES:
+                        await asyncio.sleep(_retry_after(response) or backoff(attempt))
+                        continue
+                    if status in DEAD_STATUSES:
+                        return {'dead': True, 'status': status}
+                    if status >= 400:
+                        return None
+                    if response.content_type.startswith('text/'):
+                        return {'dead': True, 'status': f'{status} {response.content_type}'}
+                    if method == 'HEAD' or not want_image:
+                        return {'dead': False, 'status': status}
+                    data = await response.content.read(MAX_IMAGE_BYTES + 1)
+            except aiohttp.ClientConnectorError as error:
+                if isinstance(error.os_error, socket.gaierror):
+                    return {'dead': True, 'status': 'no-host'}
+                await asyncio.sleep(backoff(attempt))
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await asyncio.sleep(backoff(attempt))
+                continue
+            return await self._thumbnail(url, status, data)
+        return None
+
+    async def _thumbnail(self, url, status, data):
+        if len(data) > MAX_IMAGE_BYTES:
+            return {'dead': False, 'status': status}  # Loads, but too big to thumbnail here
+        path = os.path.join(self.thumbnail_dir, thumbnail_name(url))
+        try:
+            with metrics.current().time('thumbnail'):
+                await asyncio.to_thread(make_thumbnail, data, path)
+        except (OSError, Image.DecompressionBombError, ValueError):
+            return {'dead': True, 'status': f'{status} undecodable'}
+        return {'dead': False, 'status': status, 'thumbnail_path': path}
+
+
+def _retry_after(response):
+    try:
+        return min(float(response.headers.get('Retry-After', '')), 60.0)
+    except ValueError:
+        return None
+
+
+def upload_thumbnail(path, bucket=None):
+    """Upload a thumbnail to Firebase Storage; returns its download URL."""
+    from firebase_admin import storage
+
+    bucket = storage.bucket(bucket, app=datastore.firebase_app())
+    blob = bucket.blob('thumbnails/' + os.path.basename(path))
+    token = str(uuid.uuid4())
+    blob.metadata = {'firebaseStorageDownloadTokens': token}  # What getDownloadURL() hands out
+    blob.cache_control = 'public, max-age=31536000'
+    blob.upload_from_filename(path, content_type='image/jpeg')
+    return (f"https://firebasestorage.googleapis.com/v0/b/{bucket.name}/o/"
+            f"{urllib.parse.quote(blob.name, safe='')}?alt=media&token={token}")
+
+
+def collect_images(db, collections=DEFAULT_COLLECTIONS, page_size=500, limit=None):
+    """(collection, id, image URL, stored image_dead, stored thumbnail) of every recipe with an image."""
+    recipes = []
+    for name in collections:
+        for doc in scan_documents(db.collection(name), page_size, select=['image', 'image_dead', 'thumbnail']):
+            data = doc.to_dict()
+            url = image_url(data)
+            if url:
+                recipes.append((name, doc.id, url, bool(data.get('image_dead')), data.get('thumbnail')))
+            if limit and len(recipes) >= limit:
+                return recipes
+    return recipes
+
+
+def check_images(db, collections=DEFAULT_COLLECTIONS, checker=None, cache=None, upload=False,
+                 bucket=None, full=False, dry_run=False, limit=None):
+    """
+    Check the recipes' image URLs that are not fresh in the cache, then flag
+    dead links and (with upload) set thumbnails where the stored fields differ.
+    """
+    checker = checker or ImageChecker()
+    cache = cache or ImageCache()
+    job = metrics.current()
+    with job.time('load'):
+        recipes = collect_images(db, collections, limit=limit)
+    urls = sorted({url for _, _, url, _, _ in recipes})
+
+    def thumbnail_due(url, entry):
+        if checker.thumbnail_dir is None or entry['dead'] or entry.get('thumbnail'):
+            return False
+        return not os.path.exists(os.path.join(checker.thumbnail_dir, thumbnail_name(url)))
+
+    def due(url):
+        entry = None if full else cache.fresh(url)
+        return entry is None or thumbnail_due(url, entry)
+
+    todo = [url for url in urls if due(url)]
+    print(f"{len(recipes)} recipes with images, {len(urls)} unique URLs, {len(todo)} to check")
+
+    undecided = 0
+
+    def on_result(url, result):
+        nonlocal undecided
+        if result is None:
+            undecided += 1
+        else:
+            result.pop('thumbnail_path', None)
+            cache.put(url, checked_at=time.time(), **result, **({'thumbnail': None} if result['dead'] else {}))
+        job.progress()
+
+    checker.check_all(todo, on_result)
+
+    if upload and not dry_run:
+        # Thumbnails made on this run or an earlier one that never got uploaded
+        for url in urls:
+            entry = cache.get(url)
+            path = os.path.join(checker.thumbnail_dir, thumbnail_name(url))
+            if entry and not entry['dead'] and not entry.get('thumbnail') and os.path.exists(path):
+                with job.time('upload'):
+                    cache.put(url, thumbnail=upload_thumbnail(path, bucket))
+
+    writer = BulkWriter(db)
+    flagged = cleared = thumbnails = 0
+    for name, doc_id, url, stored_dead, stored_thumbnail in recipes:
+        entry = cache.get(url)
+        if entry is None:
+            continue
+        changes = {}
+        if entry['dead'] and not stored_dead:
+            changes['image_dead'] = True
+            flagged += 1
+        elif not entry['dead'] and stored_dead:
+            changes['image_dead'] = datastore.DELETE_FIELD
+            cleared += 1
+        thumbnail = entry.get('thumbnail')
+        if upload and thumbnail != stored_thumbnail and (thumbnail or stored_thumbnail):
+            changes['thumbnail'] = thumbnail or datastore.DELETE_FIELD
+            thumbnails += bool(thumbnail)
+        if changes and not dry_run:
+            writer.update(db.collection(name).document(doc_id), changes, stamp=True)
+    writer.close()
+
+    dead = sum(1 for url in urls if (cache.get(url) or {}).get('dead'))
+    action = "Would flag" if dry_run else "Flagged"
+    print(f"{dead} dead URLs, {undecided} undecided. {action} {flagged} recipes as dead and {cleared} as "
+          f"fixed, {thumbnails} new thumbnails; {len(writer.failed)} writes failed.")
+    return flagged, cleared
+
+
+def stub_image(name, size=(1600, 1200)):
+    """A deterministic JPEG, a different colour for each name."""
+    digest = hashlib.sha1(name.encode('utf-8')).digest()
+    output = io.BytesIO()
+    Image.new('RGB', size, tuple(digest[:3])).save(output, 'JPEG', quality=90)
+    return output.getvalue()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves images by path, for testing against a local server:
+
+      /img/<name>      a JPEG                 /missing/<name>  404
+      /nohead/<name>   405 to HEAD, else JPEG  /html/<name>     an HTML page
+      /broken/<name>   bytes that are no image /flaky/<name>    503 at fail_rate, else JPEG
+
+    Peak concurrent requests are recorded in peak, to check the per-host limit.
+    """
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+    fail_rate = 0.0
+    delay = 0.0
+    active = 0
+    peak = 0
+    requests = 0
+    lock = threading.Lock()
+    images = {}
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _serve(self, head):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.requests += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            time.sleep(self.delay)
+            kind, _, name = self.path.strip('/').partition('/')
+            if kind == 'missing' or not name:
+                return self._reply(404, b'not found', 'text/plain', head)
+            if kind == 'nohead' and head:
+                return self._reply(405, b'', 'text/plain', head)
+            if kind == 'html':
+                return self._reply(200, b'<html>gone</html>', 'text/html', head)
+            if kind == 'broken':
+                return self._reply(200, b'\xff\xd8 not really a jpeg', 'image/jpeg', head)
+            if kind == 'flaky' and random.random() < self.fail_rate:
+                return self._reply(503, b'busy', 'text/plain', head)
+            with cls.lock:
+                if name not in cls.images:
+                    cls.images[name] = stub_image(name)
+            self._reply(200, cls.images[name], 'image/jpeg', head)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def _reply(self, status, data, content_type, head):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the checker's own output
+
+
+def serve_stub(port=8766, fail_rate=0.0, delay=0.0):
+    """Start the stub image server on a background thread; returns the server (call shutdown() to stop it)."""
+    handler = type('StubHandler', (_StubHandler,), {
+        'fail_rate': fail_rate, 'delay': delay, 'lock': threading.Lock(), 'images': {}})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.handler = handler
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check recipe image URLs, flag dead links and make thumbnails.")
+    subparsers = parser.add_subparsers(dest='command')
+    stub = subparsers.add_parser('stub', help="run a local image server for testing")
+    stub.add_argument('--port', type=int, default=8766)
+    stub.add_argument('--fail-rate', type=float, default=0.0, help="fraction of /flaky/ requests answered with 503")
+    stub.add_argument('--delay', type=float, default=0.0, help="seconds each answer takes")
+    parser.add_argument('--collections', nargs='+', default=DEFAULT_COLLECTIONS)
+    parser.add_argument('--concurrency', type=int, default=32, help="requests in flight")
+    parser.add_argument('--per-host', type=int, default=4, help="connections to any one host")
+    parser.add_argument('--timeout', type=float, default=30.0, help="seconds per request")
+    parser.add_argument('--thumbnails', action='store_true', help="download live images and make thumbnails")
+    parser.add_argument('--thumbnail-dir', default=THUMBNAIL_DIR)
+    parser.add_argument('--upload', action='store_true',
+                        help="upload the thumbnails to Firebase Storage ($QOOT_STORAGE_BUCKET) and set 'thumbnail'")
+    parser.add_argument('--full', action='store_true', help="check every URL, ignoring the cache")
+    parser.add_argument('--limit', type=int, help="check at most this many recipes")
+    parser.add_argument('--dry-run', action='store_true', help="check, but do not write to the recipes")
+    args = parser.parse_args()
+
+    if args.command == 'stub':
+        server = serve_stub(args.port, args.fail_rate, args.delay)
+        print(f"Stub image server on http://127.0.0.1:{args.port}/img/<name>")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        if args.upload and not args.thumbnails:
+            parser.error("--upload needs --thumbnails")
+        metrics.start_job('imagecheck')
+        checker = ImageChecker(args.concurrency, args.per_host, args.timeout,
+                               thumbnail_dir=args.thumbnail_dir if args.thumbnails else None)
+        check_images(datastore.connect(), args.collections, checker, upload=args.upload, full=args.full,
+                     dry_run=args.dry_run, limit=args.limit)
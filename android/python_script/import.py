@@ -1,16 +1,12 @@
-import firebase_admin
-import google.cloud
-from firebase_admin import credentials, firestore
+import datastore
 
-cred = credentials.Certificate("./ServiceAccountKey.json")
-app = firebase_admin.initialize_app(cred)
-
-store = firestore.client()
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+store = datastore.connect()
 doc_ref = store.collection(u'users').limit(2)
 
 try:
     docs = doc_ref.get()
     for doc in docs:
         print(u'Doc Data:{}'.format(doc.to_dict()))
-except google.cloud.exceptions.NotFound:
+except datastore.NotFound:
     print(u'Missing data')
\ No newline at end of file
@@ -1,35 +1,108 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import math
+import time
+import datastore
+import metrics
 import pandas as pd
+from bulkwriter import BulkWriter
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json') # Replace with your service account key file path
-firebase_admin.initialize_app(cred)
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
+
+_MISSING = object()
+
+
+def normalize_value(value):
+    """Turn a CSV cell into a Firestore-friendly value; NaN/NA become _MISSING."""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return _MISSING
+    if isinstance(value, float) and math.isnan(value):
+        return _MISSING
+    if hasattr(value, 'item'):  # NumPy scalar that tolist() left behind
+        return value.item()
+    return value
+
+
+def records_from_chunk(chunk):
+    """
+    Convert a DataFrame chunk to one dict per row, column by column.
+    Empty cells are left out of the record instead of being stored as NaN.
+    """
+    columns = [(str(name), [normalize_value(v) for v in chunk[name].tolist()]) for name in chunk.columns]
+    for i in range(len(chunk)):
+        yield {name: values[i] for name, values in columns if values[i] is not _MISSING}
+
+
+def document_id(value):
+    """Document ID from a column value; whole floats (1.0) map to '1'."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    doc_id = str(value).strip()
+    if not doc_id or '/' in doc_id:
+        raise ValueError(f"invalid document ID: {value!r}")
+    return doc_id
 
-# Get Firestore client
-db = firestore.client()
 
 # Function to import data from CSV to Firestore
-def import_csv_to_firestore(csv_file_path, collection_name):
-    # Read the CSV file into a DataFrame
-    data = pd.read_csv(csv_file_path)
+def import_csv_to_firestore(csv_file_path, collection_name, id_column=None, chunk_size=5000,
+                            max_in_flight=8, dry_run=False):
+    """
+    Import a CSV file into a collection in batched, concurrent commits.
+
+    The file is read chunk_size rows at a time. With id_column, each row is
+    written to the document named by that column, so re-running an import
+    overwrites instead of duplicating. dry_run parses everything but writes
+    nothing, which measures the parsing rate on its own.
+    """
+    collection_ref = db.collection(collection_name)
+    writer = None if dry_run else BulkWriter(db, max_in_flight=max_in_flight)
+    rows = 0
+    skipped = 0
+    start = time.perf_counter()
+
+    # Read the CSV file in chunks so memory does not grow with the file
+    for chunk in pd.read_csv(csv_file_path, chunksize=chunk_size):
+        for record in records_from_chunk(chunk):
+            if id_column:
+                try:
+                    doc_ref = collection_ref.document(document_id(record.get(id_column, '')))
+                except ValueError as e:
+                    print(f"Skipping row {rows + skipped + 1}: {e}")
+                    skipped += 1
+                    continue
+            else:
+                doc_ref = collection_ref.document()  # Auto-generate ID
+
+            if writer:
+                writer.set(doc_ref, record, stamp=True)
+            rows += 1
+
+        elapsed = time.perf_counter() - start
+        print(f"Read {rows} rows ({rows / elapsed:,.0f} rows/s)")
 
-    # Iterate over the rows of the DataFrame
-    for index, row in data.iterrows():
-        # Convert row to a dictionary
-        record = row.to_dict()
+    if writer:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    if dry_run:
+        print(f"Dry run: {rows} rows parsed, {skipped} skipped in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    else:
+        print(f"Imported {writer.committed} documents, {len(writer.failed)} failed, {skipped} skipped "
+              f"in {elapsed:.1f}s ({writer.committed / elapsed:,.0f} rows/s)")
 
-        # Generate a unique document ID (use Firestore's auto-generated ID or a specific field)
-        doc_ref = db.collection(collection_name).document()  # Auto-generate ID
-        # doc_ref = db.collection(collection_name).document(str(record['id']))  # Use a specific field as ID if needed
 
-        # Add the record to Firestore
-        doc_ref.set(record)
-        print(f"Document added with data: {record}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a CSV file into a Firestore collection.")
+    # Path to your CSV file
+    parser.add_argument('csv_file', nargs='?', default="/Users/saraabdullah/Desktop/Outputset.csv")
+    parser.add_argument('collection', nargs='?', default="recipes")
+    parser.add_argument('--id-column', help="column to use as the document ID (makes re-runs idempotent)")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="rows read from the CSV at a time")
+    parser.add_argument('--in-flight', type=int, default=8, help="batch commits running at once")
+    parser.add_argument('--dry-run', action='store_true', help="parse the file without writing")
+    args = parser.parse_args()
 
-# Path to your CSV file
-csv_file_path = "/Users/saraabdullah/Desktop/Outputset.csv"
-  # Replace with the actual path to your CSV file
+    metrics.start_job('importnew')
 
-# Call the function to import data
-import_csv_to_firestore(csv_file_path, "recipes")
+    # Call the function to import data
+    import_csv_to_firestore(args.csv_file, args.collection, id_column=args.id_column,
+                            chunk_size=args.chunk_size, max_in_flight=args.in_flight, dry_run=args.dry_run)
@@ -0,0 +1,191 @@
+import math
+import threading
+import zlib
+from collections import defaultdict
+
+import datastore
+import metrics
+from bulkwriter import BulkWriter
+from scan import scan_documents
+
+# Inverted index from cleaned ingredient to the recipes that contain it:
+#
+#   ingredient_index/{ingredient}             {ingredient, count, shards}
+#   ingredient_index/{ingredient}/shards/{n}  {recipes: ["recipes/<id>", "users_recipes/<id>", ...]}
+#
+# A search reads the parent doc of each selected ingredient, then its shards,
+# and intersects the entry lists. Entries are spread over the shards by a hash
+# of the entry, so an ingredient used by many recipes never outgrows the 1 MiB
+# document limit.
+
+INDEX_COLLECTION = 'ingredient_index'
+SHARD_COLLECTION = 'shards'
+SHARD_CAPACITY = 5000  # entries per shard document, well under the size limit
+
+# Collections that feed the search, and the filter applied to each
+SOURCES = {
+    'recipes': None,
+    'users_recipes': ('source', '==', 'public'),
+}
+
+
+def index_key(ingredient):
+    """Document ID for an ingredient, or None if it cannot be used as one."""
+    key = ingredient.strip().lower().replace('/', ' ')
+    if not key or key in ('.', '..') or (key.startswith('__') and key.endswith('__')):
+        return None
+    return key
+
+
+def shard_for(entry, shard_count):
+    """The shard an entry lives in; stable across runs and processes."""
+    return zlib.crc32(entry.encode('utf-8')) % shard_count
+
+
+def shard_count_for(size):
+    return max(1, math.ceil(size / SHARD_CAPACITY))
+
+
+def collect_entries(db, page_size=500):
+    """Read cleaned_ingredients from every source and group the entries by ingredient."""
+    entries = defaultdict(list)
+    for source, condition in SOURCES.items():
+        collection_ref = db.collection(source)
+        if condition:
+            collection_ref = collection_ref.where(*condition)
+        for doc in scan_documents(collection_ref, page_size, select=['cleaned_ingredients']):
+            cleaned = doc.to_dict().get('cleaned_ingredients')
+            if not isinstance(cleaned, list):
+                continue
+            entry = f"{source}/{doc.id}"
+            for key in {index_key(str(ingredient)) for ingredient in cleaned}:
+                if key:
+                    entries[key].append(entry)
+    return entries
+
+
+def build_index(db):
+    """
+    Rebuild the whole index from the recipe collections.
+    Ingredients that no longer appear anywhere, and shards left over from a
+    larger shard count, are deleted.
+    """
+    entries = collect_entries(db)
+    index_ref = db.collection(INDEX_COLLECTION)
+
+    # Current shard counts, so stale shards can be removed
+    old_shards = {doc.id: doc.to_dict().get('shards', 1)
+                  for doc in scan_documents(index_ref, select=['shards'])}
+
+    writer = BulkWriter(db)
+    for key, recipe_entries in entries.items():
+        shard_count = shard_count_for(len(recipe_entries))
+        shards = [[] for _ in range(shard_count)]
+        for entry in recipe_entries:
+            shards[shard_for(entry, shard_count)].append(entry)
+
+        parent_ref = index_ref.document(key)
+        writer.set(parent_ref, {'ingredient': key, 'count': len(recipe_entries), 'shards': shard_count})
+        for n, shard in enumerate(shards):
+            writer.set(parent_ref.collection(SHARD_COLLECTION).document(str(n)), {'recipes': shard})
+        for n in range(shard_count, old_shards.get(key, 0)):
+            writer.delete(parent_ref.collection(SHARD_COLLECTION).document(str(n)))
+
+    for key, shard_count in old_shards.items():
+        if key not in entries:
+            parent_ref = index_ref.document(key)
+            for n in range(shard_count):
+                writer.delete(parent_ref.collection(SHARD_COLLECTION).document(str(n)))
+            writer.delete(parent_ref)
+
+    writer.close()
+    print(f"Indexed {len(entries)} ingredients. {writer.committed} writes, {len(writer.failed)} failed.")
+
+
+class IndexUpdater:
+    """
+    Keep the index in step with the cleaners' writes.
+
+    Call update() with a recipe's previous and new cleaned ingredients once
+    the recipe's own write has committed (pass it as the write's on_committed),
+    so a write that fails and is retried later is not counted twice; update()
+    may be called from the writer's threads. The changes are collected in
+    memory and flush() queues them on the cleaner's BulkWriter: one count
+    increment per touched ingredient and one array change per touched shard,
+    however many recipes changed them. Call flush() once per page or batch,
+    and before closing the writer.
+    """
+
+    def __init__(self, db, writer):
+        self._db = db
+        self._index_ref = db.collection(INDEX_COLLECTION)
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._entries = defaultdict(dict)  # ingredient -> {entry: (net count change, whether it ends up added)}
+
+    def _shard_counts(self, keys):
+        """Current shard count of each ingredient; None if it is not indexed yet."""
+        refs = [self._index_ref.document(key) for key in keys]
+        metrics.current().count('read', len(refs))
+        shard_counts = dict.fromkeys(keys)
+        for snapshot in self._db.get_all(refs, field_paths=['shards']):
+            if snapshot.exists:
+                shard_counts[snapshot.id] = snapshot.to_dict().get('shards', 1)
+        return shard_counts
+
+    def update(self, source, doc_id, old_ingredients, new_ingredients):
+        entry = f"{source}/{doc_id}"
+        old_keys = {index_key(str(i)) for i in old_ingredients or []} - {None}
+        new_keys = {index_key(str(i)) for i in new_ingredients or []} - {None}
+
+        with self._lock:
+            for key in new_keys - old_keys:
+                self._change(key, entry, 1)
+            for key in old_keys - new_keys:
+                self._change(key, entry, -1)
+
+    def _change(self, key, entry, delta):
+        # The entry's last change decides the array write; the count takes every change
+        previous, _ = self._entries[key].get(entry, (0, None))
+        self._entries[key][entry] = (previous + delta, delta > 0)
+
+    def remove(self, source, doc_id, old_ingredients):
+        """Drop a recipe that was deleted or made private."""
+        self.update(source, doc_id, old_ingredients, [])
+
+    def flush(self):
+        """Queue the collected changes on the writer, placed by the shard counts stored now."""
+        with self._lock:
+            entries, self._entries = self._entries, defaultdict(dict)
+        if not entries:
+            return
+        shard_counts = self._shard_counts(list(entries))
+        for key, changes in entries.items():
+            shard_count = shard_counts[key]
+            if shard_count is None:
+                changes = {entry: change for entry, change in changes.items() if change[1]}  # Never indexed
+                if not changes:
+                    continue
+                shard_count = 1
+                parent = {'ingredient': key, 'shards': 1, 'count': datastore.Increment(len(changes))}
+            else:
+                delta = sum(change for change, _ in changes.values())
+                parent = {'ingredient': key, 'count': datastore.Increment(delta)} if delta else None
+            parent_ref = self._index_ref.document(key)
+            if parent:
+                self._writer.set(parent_ref, parent, merge=True)
+
+            shards = defaultdict(lambda: ([], []))
+            for entry, (_, added) in changes.items():
+                shards[shard_for(entry, shard_count)][0 if added else 1].append(entry)
+            for n, (added, removed) in shards.items():
+                shard_ref = parent_ref.collection(SHARD_COLLECTION).document(str(n))
+                # A write can only transform a field once, so adds and removes go separately
+                if added:
+                    self._writer.set(shard_ref, {'recipes': datastore.ArrayUnion(added)}, merge=True)
+                if removed:
+                    self._writer.set(shard_ref, {'recipes': datastore.ArrayRemove(removed)}, merge=True)
+
+
+if __name__ == "__main__":
+    build_index(datastore.connect())
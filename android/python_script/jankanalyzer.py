@@ -0,0 +1,353 @@
+import argparse
+import glob
+import json
+import os
+import re
+
+# Raster timings from Flutter's RenderFrameWithRasterStats dumps
+# (flutter_jank_metrics_*.json at the repository root).
+#
+# Each dump holds the frame's layers, and every layer carries a PNG snapshot
+# of itself as a JSON list of byte values, which is nearly all of the file.
+# The parser reads the file in chunks and skips those lists with a byte
+# search instead of building a Python int per byte; it only keeps where each
+# snapshot lies, so one can still be decoded (or saved as a PNG) on demand.
+#
+#   python jankanalyzer.py report ../../flutter_jank_metrics_*.json
+#   python jankanalyzer.py diff before/ after/          compare two builds
+#   python jankanalyzer.py report dump.json --snapshots out/   also save the PNGs
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+DEFAULT_DUMPS = os.path.join(REPO_ROOT, 'flutter_jank_metrics_*.json')
+
+SKIPPED_ARRAYS = frozenset({'snapshot'})  # Keys whose integer lists are skipped, not parsed
+
+_CHUNK_SIZE = 1 << 16
+_WHITESPACE = b' \t\r\n'
+_NUMBER_RE = re.compile(rb'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][-+]?\d+)?')
+_DELIMITER_RE = re.compile(rb'[,\]}\s]')
+_LITERALS = {b't': (b'true', True), b'f': (b'false', False), b'n': (b'null', None)}
+
+
+class SnapshotRef:
+    """Where a skipped snapshot lies in its file; read() decodes it only when asked."""
+
+    def __init__(self, path, start, end, length):
+        self.path = path
+        self.start = start  # File offsets of the list, brackets included
+        self.end = end
+        self.length = length  # Number of bytes in the snapshot
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            return bytes(json.loads(f.read(self.end - self.start)))
+
+    def __repr__(self):
+        return f"<SnapshotRef {os.path.basename(self.path)} {self.length} bytes>"
+
+
+class _StreamParser:
+    """A small JSON parser over a file read in chunks, which skips the SKIPPED_ARRAYS lists."""
+
+    def __init__(self, f, path):
+        self._f = f
+        self._path = path
+        self._buf = b''
+        self._pos = 0
+        self._offset = 0  # File offset of _buf[0]
+
+    def _fill(self):
+        data = self._f.read(_CHUNK_SIZE)
+        if not data:
+            return False
+        self._offset += self._pos
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos:self._pos + 1]
+            if not self._fill():
+                return None
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"{self._path}: expected {char.decode()} at offset {self._offset + self._pos}")
+        self._pos += 1
+
+    def values(self):
+        """Every top-level value in the file (one, or several concatenated / one per line)."""
+        while self._peek() is not None:
+            yield self._value()
+
+    def _value(self, key=None):
+        char = self._peek()
+        if char == b'{':
+            return self._object()
+        if char == b'[':
+            return self._skip_array() if key in SKIPPED_ARRAYS else self._array()
+        if char == b'"':
+            return self._string()
+        if char in _LITERALS:
+            text, value = _LITERALS[char]
+            while len(self._buf) - self._pos < len(text) and self._fill():
+                pass
+            if self._buf[self._pos:self._pos + len(text)] != text:
+                raise ValueError(f"{self._path}: bad literal at offset {self._offset + self._pos}")
+            self._pos += len(text)
+            return value
+        return self._number()
+
+    def _object(self):
+        self._expect(b'{')
+        result = {}
+        if self._peek() == b'}':
+            self._pos += 1
+            return result
+        while True:
+            key = self._string()
+            self._expect(b':')
+            result[key] = self._value(key)
+            if self._peek() == b',':
+                self._pos += 1
+                continue
+            self._expect(b'}')
+            return result
+
+    def _array(self):
+        self._expect(b'[')
+        result = []
+        if self._peek() == b']':
+            self._pos += 1
+            return result
+        while True:
+            result.append(self._value())
+            if self._peek() == b',':
+                self._pos += 1
+                continue
+            self._expect(b']')
+            return result
+
+    def _skip_array(self):
+        """Step over a flat list of numbers, counting its items, without parsing them."""
+        self._expect(b'[')
+        start = self._offset + self._pos - 1
+        commas = 0
+        empty = self._peek() == b']'
+        while True:
+            end = self._buf.find(b']', self._pos)
+            if end >= 0:
+                commas += self._buf.count(b',', self._pos, end)
+                self._pos = end + 1
+                return SnapshotRef(self._path, start, self._offset + self._pos, 0 if empty else commas + 1)
+            commas += self._buf.count(b',', self._pos)
+            self._pos = len(self._buf)
+            if not self._fill():
+                raise ValueError(f"{self._path}: unterminated list starting at offset {start}")
+
+    def _string(self):
+        self._expect(b'"')
+        search = self._pos
+        while True:
+            end = self._buf.find(b'"', search)
+            if end < 0:
+                searched = len(self._buf) - self._pos
+                if not self._fill():
+                    raise ValueError(f"{self._path}: unterminated string")
+                search = self._pos + searched
+                continue
+            backslashes = 0
+            while end - backslashes > self._pos and self._buf[end - backslashes - 1] == 0x5c:
+                backslashes += 1
+            if backslashes % 2:  # An escaped quote
+                search = end + 1
+                continue
+            text = b'"' + self._buf[self._pos:end + 1]
+            self._pos = end + 1
+            return json.loads(text)
+
+    def _number(self):
+        while not _DELIMITER_RE.search(self._buf, self._pos) and self._fill():
+            pass  # The number may continue in the next chunk
+        match = _NUMBER_RE.match(self._buf, self._pos)
+        if not match:
+            raise ValueError(f"{self._path}: unexpected data at offset {self._offset + self._pos}")
+        self._pos = match.end()
+        text = match.group()
+        return float(text) if any(c in text for c in b'.eE') else int(text)
+
+
+class Layer:
+    def __init__(self, data):
+        self.layer_id = data.get('layer_unique_id')
+        self.duration_micros = data.get('duration_micros', 0)
+        self.rect = tuple(data.get(k, 0.0) for k in ('left', 'top', 'width', 'height'))
+        self.snapshot = data.get('snapshot')  # SnapshotRef, or None
+
+
+class Frame:
+    def __init__(self, source, index, data):
+        self.source = source
+        self.index = index  # Position within its file
+        self.size = (data.get('frame_width'), data.get('frame_height'))
+        self.layers = [Layer(layer) for layer in data.get('snapshots', [])]
+
+    @property
+    def duration_micros(self):
+        return sum(layer.duration_micros for layer in self.layers)
+
+    @property
+    def name(self):
+        return f"{os.path.basename(self.source)}#{self.index}"
+
+
+def read_frames(path):
+    """Yield the RenderFrameWithRasterStats frames of a dump, with snapshots left undecoded."""
+    with open(path, 'rb') as f:
+        index = 0
+        for value in _StreamParser(f, path).values():
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, dict) and item.get('type') == 'RenderFrameWithRasterStats':
+                    yield Frame(path, index, item)
+                    index += 1
+
+
+def expand_paths(paths):
+    """Files, directories (their *.json) and glob patterns, in a stable order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.json'))))
+        elif any(char in path for char in '*?['):
+            files.extend(sorted(glob.glob(path)))
+        else:
+            files.append(path)
+    return files
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-len(sorted_values) * fraction // 1))
+    return sorted_values[int(rank) - 1]
+
+
+def _stats(values):
+    values = sorted(values)
+    return {'count': len(values), 'p50': percentile(values, 0.5), 'p90': percentile(values, 0.9),
+            'p99': percentile(values, 0.99), 'max': values[-1] if values else 0}
+
+
+def summarize(frames, worst=5):
+    """Raster duration percentiles per layer and for whole frames, plus the slowest frames."""
+    by_layer = {}
+    for frame in frames:
+        for layer in frame.layers:
+            by_layer.setdefault(layer.layer_id, []).append(layer.duration_micros)
+    return {
+        'frames': _stats([frame.duration_micros for frame in frames]),
+        'layers': {layer_id: _stats(durations) for layer_id, durations in sorted(by_layer.items())},
+        'worst': [{'frame': frame.name, 'duration_micros': frame.duration_micros,
+                   'layers': {layer.layer_id: layer.duration_micros for layer in frame.layers}}
+                  for frame in sorted(frames, key=lambda f: -f.duration_micros)[:worst]],
+    }
+
+
+def diff(before, after):
+    """Change of each percentile from the before summary to the after one, for frames and shared layers."""
+    def change(old, new):
+        return {key: {'before': old[key], 'after': new[key], 'delta': new[key] - old[key],
+                      'percent': (new[key] - old[key]) / old[key] * 100 if old[key] else None}
+                for key in ('p50', 'p90', 'p99', 'max')}
+
+    shared = sorted(set(before['layers']) & set(after['layers']))
+    return {
+        'frames': change(before['frames'], after['frames']),
+        'layers': {layer_id: change(before['layers'][layer_id], after['layers'][layer_id]) for layer_id in shared},
+        # Layer IDs are assigned at runtime, so a rebuilt widget tree may not share them
+        'only_before': sorted(set(before['layers']) - set(after['layers'])),
+        'only_after': sorted(set(after['layers']) - set(before['layers'])),
+    }
+
+
+def _ms(micros):
+    return f"{micros / 1000:7.2f}ms"
+
+
+def print_summary(summary):
+    frames = summary['frames']
+    print(f"{frames['count']} frames: p50 {_ms(frames['p50'])}  p90 {_ms(frames['p90'])}  "
+          f"p99 {_ms(frames['p99'])}  max {_ms(frames['max'])}")
+    for layer_id, stats in summary['layers'].items():
+        print(f"  layer {layer_id!s:>6}: {stats['count']:>5} x  p50 {_ms(stats['p50'])}  p90 {_ms(stats['p90'])}  "
+              f"p99 {_ms(stats['p99'])}  max {_ms(stats['max'])}")
+    print("Worst frames:")
+    for entry in summary['worst']:
+        layers = ', '.join(f"{layer_id}: {_ms(micros).strip()}" for layer_id, micros in entry['layers'].items())
+        print(f"  {entry['frame']:<40} {_ms(entry['duration_micros'])}  ({layers})")
+
+
+def print_diff(result):
+    def line(label, changes):
+        parts = []
+        for key, change in changes.items():
+            percent = '' if change['percent'] is None else f" ({change['percent']:+.1f}%)"
+            parts.append(f"{key} {_ms(change['before']).strip()} -> {_ms(change['after']).strip()}{percent}")
+        print(f"  {label:<12} " + '  '.join(parts))
+
+    line('frames', result['frames'])
+    for layer_id, changes in result['layers'].items():
+        line(f"layer {layer_id}", changes)
+    if result['only_before'] or result['only_after']:
+        print(f"  layers only before: {result['only_before']}, only after: {result['only_after']}")
+
+
+def save_snapshots(frames, directory):
+    os.makedirs(directory, exist_ok=True)
+    for frame in frames:
+        for layer in frame.layers:
+            if layer.snapshot is not None:
+                name = f"{os.path.splitext(os.path.basename(frame.source))[0]}-{frame.index}-layer{layer.layer_id}.png"
+                with open(os.path.join(directory, name), 'wb') as f:
+                    f.write(layer.snapshot.read())
+
+
+def _load(paths):
+    frames = [frame for path in expand_paths(paths) for frame in read_frames(path)]
+    if not frames:
+        raise SystemExit(f"No RenderFrameWithRasterStats frames in {' '.join(paths)}")
+    return frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raster timings from Flutter jank metric dumps.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    report = subparsers.add_parser('report', help="percentiles per layer and the worst frames")
+    report.add_argument('paths', nargs='*', default=[DEFAULT_DUMPS], help="dump files, directories or globs")
+    report.add_argument('--worst', type=int, default=5, help="how many of the slowest frames to list")
+    report.add_argument('--snapshots', metavar='DIR', help="also decode the layer snapshots into PNG files")
+    report.add_argument('--json', metavar='PATH', help="also write the summary as JSON")
+    compare = subparsers.add_parser('diff', help="compare two sets of dumps, e.g. two builds")
+    compare.add_argument('before', help="dump file, directory or glob")
+    compare.add_argument('after', help="dump file, directory or glob")
+    compare.add_argument('--json', metavar='PATH', help="also write the comparison as JSON")
+    args = parser.parse_args()
+
+    if args.command == 'report':
+        frames = _load(args.paths)
+        result = summarize(frames, args.worst)
+        print_summary(result)
+        if args.snapshots:
+            save_snapshots(frames, args.snapshots)
+    else:
+        result = diff(summarize(_load([args.before])), summarize(_load([args.after])))
+        print_diff(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
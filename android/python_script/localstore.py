@@ -0,0 +1,788 @@
+import datetime
+import enum
+import itertools
+import json
+import queue
+import random
+import sqlite3
+import string
+import threading
+from collections import Counter, namedtuple
+
+
+# A stand-in for the parts of the Firestore client the maintenance scripts use,
+# stored in SQLite (a file, or ':memory:'). Documents are JSON rows keyed by
+# (collection path, ID); queries filter and sort in Python, except the common
+# "order by ID, start after ID, limit N" page which SQLite answers from its key.
+#
+# Firestore's transforms (ArrayUnion, ArrayRemove, Increment, DELETE_FIELD,
+# SERVER_TIMESTAMP) are recognised by shape, so scripts keep using the ones
+# from firebase_admin.firestore. Every read, write, delete and commit is
+# counted in LocalStore.ops, which is what the benchmarks report.
+
+DOCUMENT_ID = '__name__'
+MAX_BATCH_SIZE = 500
+
+# How many rows to pull from SQLite at a time while filtering an ID-ordered query
+_FETCH_SIZE = 1000
+
+_DELETE = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    parent TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (parent, id)
+) WITHOUT ROWID
+"""
+
+ChangeType = enum.Enum('ChangeType', ['ADDED', 'MODIFIED', 'REMOVED'])
+DocumentChange = namedtuple('DocumentChange', ['type', 'document', 'old_index', 'new_index'])
+AggregationResult = namedtuple('AggregationResult', ['alias', 'value', 'read_time'])
+
+
+def _not_found(message):
+    """The Firestore client's NotFound, so callers can catch the same error for both backends."""
+    try:
+        from google.api_core.exceptions import NotFound
+    except ImportError:  # Lets the local store run without the Google client libraries
+        return LookupError(message)
+    return NotFound(message)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'__timestamp__': value.isoformat()}
+    if isinstance(value, LocalDocumentReference):
+        return {'__reference__': value.path}
+    raise TypeError(f"Cannot store {type(value).__name__} in the local store")
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_encode)
+
+
+def _loads(text, store):
+    def decode(obj):
+        if len(obj) == 1:
+            if '__timestamp__' in obj:
+                return datetime.datetime.fromisoformat(obj['__timestamp__'])
+            if '__reference__' in obj:
+                return store.document(obj['__reference__'])
+        return obj
+    return json.loads(text, object_hook=decode)
+
+
+def _split(path):
+    parts = path.strip('/').split('/')
+    return '/'.join(parts[:-1]), parts[-1]
+
+
+def _auto_id():
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=20))
+
+
+# Field values and transforms
+
+def _get_field(data, field_path):
+    """(found, value) of a dotted field path."""
+    value = data
+    for part in field_path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+def _resolve(value, old, now):
+    """The stored value for a written value, applying Firestore transforms against the old one."""
+    kind = type(value).__name__
+    if kind == 'Sentinel':
+        if 'delete' in value.description.lower():
+            return _DELETE
+        return now  # SERVER_TIMESTAMP
+    if kind == 'ArrayUnion':
+        base = list(old) if isinstance(old, list) else []
+        return base + [item for item in value.values if item not in base]
+    if kind == 'ArrayRemove':
+        return [item for item in old if item not in value.values] if isinstance(old, list) else []
+    if kind == 'Increment':
+        base = old if isinstance(old, (int, float)) and not isinstance(old, bool) else 0
+        return base + value.value
+    if isinstance(value, dict):
+        return {k: v for k, v in ((k, _resolve(v, None, now)) for k, v in value.items()) if v is not _DELETE}
+    return value
+
+
+def _merge(old, data, now):
+    """set(..., merge=True): nested maps are merged, everything else replaced."""
+    merged = dict(old)
+    for key, value in data.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value, now)
+            continue
+        resolved = _resolve(value, merged.get(key), now)
+        if resolved is _DELETE:
+            merged.pop(key, None)
+        else:
+            merged[key] = resolved
+    return merged
+
+
+def _update(old, data, now):
+    """update(): keys are field paths; nested maps in the values replace whole fields."""
+    updated = _copy_tree(old)
+    for field_path, value in data.items():
+        parts = field_path.split('.')
+        parent = updated
+        for part in parts[:-1]:
+            if not isinstance(parent.get(part), dict):
+                parent[part] = {}
+            parent = parent[part]
+        resolved = _resolve(value, parent.get(parts[-1]), now)
+        if resolved is _DELETE:
+            parent.pop(parts[-1], None)
+        else:
+            parent[parts[-1]] = resolved
+    return updated
+
+
+def _copy_tree(value):
+    """Copy nested maps and arrays; leaves (including references) are shared."""
+    if isinstance(value, dict):
+        return {key: _copy_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_tree(item) for item in value]
+    return value
+
+
+# Ordering and filters, following Firestore's cross-type order
+
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime.datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, LocalDocumentReference):
+        return 6
+    if isinstance(value, list):
+        return 8
+    return 9
+
+
+def _order_key(value):
+    rank = _type_rank(value)
+    if rank == 6:
+        return (rank, value.path)
+    if rank == 8:
+        return (rank, tuple(_order_key(item) for item in value))
+    if rank == 9:
+        return (rank, tuple((k, _order_key(v)) for k, v in sorted(value.items())))
+    return (rank, value)
+
+
+class _Descending:
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def _comparable(a, b):
+    return _type_rank(a) == _type_rank(b)
+
+
+def _matches(op, found, value, target):
+    if not found:
+        return False
+    if op == '==':
+        return _comparable(value, target) and value == target
+    if op == '!=':
+        return value is not None and not (_comparable(value, target) and value == target)
+    if op in ('<', '<=', '>', '>='):
+        if not _comparable(value, target):
+            return False
+        a, b = _order_key(value), _order_key(target)
+        return {'<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b}[op]
+    if op == 'in':
+        return any(_comparable(value, t) and value == t for t in target)
+    if op == 'not-in':
+        return value is not None and not any(_comparable(value, t) and value == t for t in target)
+    if op == 'array_contains':
+        return isinstance(value, list) and target in value
+    if op == 'array_contains_any':
+        return isinstance(value, list) and any(t in value for t in target)
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def _project(data, field_paths):
+    projected = {}
+    for field_path in field_paths:
+        found, value = _get_field(data, field_path)
+        if not found:
+            continue
+        parts = field_path.split('.')
+        parent = projected
+        for part in parts[:-1]:
+            parent = parent.setdefault(part, {})
+        parent[parts[-1]] = value
+    return projected
+
+
+class LocalStore:
+    """
+    A Firestore-like client over SQLite. Use ':memory:' for a throwaway store.
+
+    Safe to share between threads: every statement runs under one lock, and a
+    batch commit is a single SQLite transaction, so it is atomic like a
+    Firestore batch.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(_SCHEMA)
+        self._lock = threading.RLock()
+        self._watches = []
+        self.ops = Counter()  # 'read', 'write', 'delete', 'commit', 'query', 'aggregation'
+
+    def collection(self, path):
+        return LocalCollection(self, path.strip('/'))
+
+    def document(self, path):
+        parent, doc_id = _split(path)
+        return LocalDocumentReference(self, parent, doc_id)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def get_all(self, references, field_paths=None):
+        for reference in references:
+            yield reference.get(field_paths)
+
+    def collection_group(self, collection_id):
+        return LocalCollectionGroup(self, collection_id)
+
+    def collections(self):
+        """Top-level collections."""
+        return [self.collection(path) for path in self._child_collections('')]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _child_collections(self, doc_path):
+        """Collections directly under a document ('' for the root), including ones with only nested documents."""
+        with self._lock:
+            if doc_path:
+                prefix = doc_path + '/'
+                rows = self._conn.execute(
+                    'SELECT DISTINCT parent FROM documents WHERE parent > ? AND parent < ?',
+                    (prefix, prefix + '\uffff')).fetchall()
+            else:
+                prefix = ''
+                rows = self._conn.execute('SELECT DISTINCT parent FROM documents').fetchall()
+        names = {row[0][len(prefix):].split('/')[0] for row in rows}
+        return sorted(prefix + name for name in names)
+
+    def _load(self, parent, doc_id):
+        row = self._conn.execute('SELECT data FROM documents WHERE parent = ? AND id = ?',
+                                 (parent, doc_id)).fetchone()
+        return _loads(row[0], self) if row else None
+
+    def _commit(self, ops):
+        """Apply (kind, ref, data, merge) ops in one transaction and notify watches."""
+        if len(ops) > MAX_BATCH_SIZE:
+            raise ValueError(f"A batch can contain at most {MAX_BATCH_SIZE} writes, got {len(ops)}")
+        now = _now()
+        changes = []
+        with self._lock:
+            states = {}
+            for kind, ref, data, merge in ops:
+                key = (ref._parent, ref.id)
+                if key not in states:
+                    states[key] = (self._load(*key),) * 2
+                original, current = states[key]
+                if kind == 'delete':
+                    new = None
+                elif kind == 'update':
+                    if current is None:
+                        raise _not_found(f"No document to update: {ref.path}")
+                    new = _update(current, data, now)
+                elif kind == 'create' and current is not None:
+                    raise ValueError(f"Document already exists: {ref.path}")
+                elif merge and current is not None:
+                    new = _merge(current, data, now)
+                else:
+                    new = _resolve(data, None, now)
+                states[key] = (original, new)
+
+            self._conn.execute('BEGIN')
+            try:
+                for (parent, doc_id), (original, new) in states.items():
+                    if new is None:
+                        self._conn.execute('DELETE FROM documents WHERE parent = ? AND id = ?', (parent, doc_id))
+                    else:
+                        self._conn.execute('INSERT OR REPLACE INTO documents (parent, id, data) VALUES (?, ?, ?)',
+                                           (parent, doc_id, _dumps(new)))
+                    changes.append((parent, doc_id, original, new))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            for kind, *_ in ops:
+                self.ops['delete' if kind == 'delete' else 'write'] += 1
+            self.ops['commit'] += 1
+            watches = list(self._watches)
+
+        for watch in watches:
+            watch._notify(changes, now)
+        return now
+
+    def _scan(self, parent, after_id=None, inclusive=False):
+        """Yield (id, data) in ID order, fetching rows in chunks so writers are not blocked."""
+        while True:
+            with self._lock:
+                if after_id is None:
+                    rows = self._conn.execute(
+                        'SELECT id, data FROM documents WHERE parent = ? ORDER BY id LIMIT ?',
+                        (parent, _FETCH_SIZE)).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        f"SELECT id, data FROM documents WHERE parent = ? AND id {'>=' if inclusive else '>'} ? "
+                        'ORDER BY id LIMIT ?',
+                        (parent, after_id, _FETCH_SIZE)).fetchall()
+            for doc_id, text in rows:
+                yield doc_id, _loads(text, self)
+            if len(rows) < _FETCH_SIZE:
+                return
+            after_id, inclusive = rows[-1][0], False
+
+    def _group_paths(self, collection_id):
+        """Paths of every document in a collection named collection_id, at any depth, in path order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT parent, id FROM documents WHERE parent = ? OR parent LIKE ? ORDER BY parent, id",
+                (collection_id, '%/' + collection_id)).fetchall()
+        return [f"{parent}/{doc_id}" for parent, doc_id in rows]
+
+
+class LocalDocumentSnapshot:
+    def __init__(self, reference, data, read_time=None):
+        self.reference = reference
+        self._data = data
+        self.read_time = read_time
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return None if self._data is None else dict(self._data)
+
+    def get(self, field_path):
+        if field_path == DOCUMENT_ID:
+            return self.reference
+        found, value = _get_field(self._data or {}, field_path)
+        if not found:
+            raise KeyError(field_path)
+        return value
+
+
+class LocalDocumentReference:
+    def __init__(self, store, parent, doc_id):
+        self._store = store
+        self._parent = parent
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._parent}/{self.id}"
+
+    @property
+    def parent(self):
+        return LocalCollection(self._store, self._parent)
+
+    def __eq__(self, other):
+        return isinstance(other, LocalDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def __repr__(self):
+        return f"<LocalDocumentReference {self.path}>"
+
+    def collection(self, name):
+        return LocalCollection(self._store, f"{self.path}/{name}")
+
+    def collections(self):
+        return [LocalCollection(self._store, path) for path in self._store._child_collections(self.path)]
+
+    def get(self, field_paths=None):
+        with self._store._lock:
+            data = self._store._load(self._parent, self.id)
+            self._store.ops['read'] += 1
+        if data is not None and field_paths is not None:
+            data = _project(data, field_paths)
+        return LocalDocumentSnapshot(self, data, _now())
+
+    def set(self, document_data, merge=False):
+        return self._store._commit([('set', self, document_data, merge)])
+
+    def create(self, document_data):
+        return self._store._commit([('create', self, document_data, False)])
+
+    def update(self, field_updates):
+        return self._store._commit([('update', self, field_updates, False)])
+
+    def delete(self):
+        return self._store._commit([('delete', self, None, False)])
+
+
+class LocalWriteBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append(('set', reference, document_data, merge))
+
+    def create(self, reference, document_data):
+        self._ops.append(('create', reference, document_data, False))
+
+    def update(self, reference, field_updates):
+        self._ops.append(('update', reference, field_updates, False))
+
+    def delete(self, reference):
+        self._ops.append(('delete', reference, None, False))
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        return self._store._commit(ops)
+
+    def __len__(self):
+        return len(self._ops)
+
+
+class LocalQuery:
+    """Immutable query; each builder method returns a new one, like the Firestore client."""
+
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+    def __init__(self, store, path, filters=(), orders=(), limit=None, cursor=None, projection=None,
+                 start_inclusive=False, end=None, end_inclusive=False):
+        self._store = store
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor  # The start cursor; start_after() unless start_inclusive
+        self._projection = projection
+        self._start_inclusive = start_inclusive
+        self._end = end
+        self._end_inclusive = end_inclusive
+
+    def _copy(self, **changes):
+        fields = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      cursor=self._cursor, projection=self._projection, start_inclusive=self._start_inclusive,
+                      end=self._end, end_inclusive=self._end_inclusive)
+        fields.update(changes)
+        return LocalQuery(self._store, self._path, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot, start_inclusive=False)
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot, start_inclusive=True)
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy(end=document_fields_or_snapshot, end_inclusive=False)
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._copy(end=document_fields_or_snapshot, end_inclusive=True)
+
+    def count(self, alias=None):
+        return LocalAggregationQuery(self, alias or 'field_1')
+
+    def get(self):
+        return list(self.stream())
+
+    def stream(self):
+        read_time = _now()
+        store = self._store
+        with store._lock:
+            store.ops['query'] += 1
+        for doc_id, data in self._results():
+            with store._lock:
+                store.ops['read'] += 1
+            if self._projection is not None:
+                data = _project(data, self._projection)
+            yield LocalDocumentSnapshot(LocalDocumentReference(self._store, self._path, doc_id), data, read_time)
+
+    def on_snapshot(self, callback):
+        return LocalWatch(self, callback)
+
+    def _matches(self, data):
+        return all(_matches(op, *_get_field(data, field), target) for field, op, target in self._filters)
+
+    def _by_id(self):
+        return all(field == DOCUMENT_ID and direction == self.ASCENDING for field, direction in self._orders)
+
+    def _cursor_values(self, cursor):
+        """A cursor (a field dict or a snapshot) as order-field values plus the document ID, if given."""
+        values = []
+        for field, _ in self._orders:
+            if field == DOCUMENT_ID:
+                continue
+            values.append(cursor.get(field))
+        if isinstance(cursor, LocalDocumentSnapshot):
+            doc_id = cursor.id
+        else:
+            doc_id = cursor.get(DOCUMENT_ID)
+            doc_id = getattr(doc_id, 'id', doc_id)
+            doc_id = doc_id.split('/')[-1] if isinstance(doc_id, str) else doc_id
+        return values, doc_id
+
+    def _results(self):
+        if self._by_id():
+            # Fast path: SQLite walks the primary key, Python applies the filters
+            after_id = self._cursor_values(self._cursor)[1] if self._cursor is not None else None
+            rows = self._store._scan(self._path, after_id, self._start_inclusive)
+            if self._end is not None:
+                end_id = self._cursor_values(self._end)[1]
+                if self._end_inclusive:
+                    rows = itertools.takewhile(lambda row: row[0] <= end_id, rows)
+                else:
+                    rows = itertools.takewhile(lambda row: row[0] < end_id, rows)
+            matched = (row for row in rows if self._matches(row[1]))
+        else:
+            matched = self._sorted()
+        for n, row in enumerate(matched):
+            if self._limit is not None and n >= self._limit:
+                return
+            yield row
+
+    def _sort_key(self, doc_id, data):
+        key = []
+        for field, direction in self._orders:
+            if field == DOCUMENT_ID:
+                continue
+            value = _order_key(_get_field(data, field)[1])
+            key.append(_Descending(value) if direction == self.DESCENDING else value)
+        descending_id = any(f == DOCUMENT_ID and d == self.DESCENDING for f, d in self._orders)
+        key.append(_Descending(doc_id) if descending_id else doc_id)
+        return key
+
+    def _sorted(self):
+        order_fields = [field for field, _ in self._orders if field != DOCUMENT_ID]
+        rows = [(doc_id, data) for doc_id, data in self._store._scan(self._path)
+                if self._matches(data) and all(_get_field(data, f)[0] for f in order_fields)]
+        rows.sort(key=lambda row: self._sort_key(*row))
+        if self._cursor is not None:
+            start_key = self._bound_key(self._cursor, order_fields)
+            if self._start_inclusive:
+                rows = [row for row in rows if not self._sort_key(*row)[:len(start_key)] < start_key]
+            else:
+                rows = [row for row in rows if start_key < self._sort_key(*row)[:len(start_key)]]
+        if self._end is not None:
+            end_key = self._bound_key(self._end, order_fields)
+            if self._end_inclusive:
+                rows = [row for row in rows if not end_key < self._sort_key(*row)[:len(end_key)]]
+            else:
+                rows = [row for row in rows if self._sort_key(*row)[:len(end_key)] < end_key]
+        return rows
+
+    def _bound_key(self, cursor, order_fields):
+        values, doc_id = self._cursor_values(cursor)
+        key = self._sort_key(doc_id, _cursor_data(order_fields, values))
+        # A cursor on field values only compares equal to every document with those values
+        return key[:-1] if doc_id is None else key
+
+
+def _cursor_data(fields, values):
+    data = {}
+    for field, value in zip(fields, values):
+        parts = field.split('.')
+        parent = data
+        for part in parts[:-1]:
+            parent = parent.setdefault(part, {})
+        parent[parts[-1]] = value
+    return data
+
+
+class LocalCollection(LocalQuery):
+    def __init__(self, store, path):
+        super().__init__(store, path)
+
+    @property
+    def id(self):
+        return self._path.split('/')[-1]
+
+    def document(self, document_id=None):
+        return LocalDocumentReference(self._store, self._path, document_id or _auto_id())
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        return ref.create(document_data), ref
+
+    def list_documents(self):
+        """Every document, including missing ones that only have subcollections, like Firestore's listing."""
+        prefix = self._path + '/'
+        with self._store._lock:
+            ids = {row[0] for row in self._store._conn.execute(
+                'SELECT id FROM documents WHERE parent = ?', (self._path,))}
+            ids.update(row[0][len(prefix):].split('/')[0] for row in self._store._conn.execute(
+                'SELECT DISTINCT parent FROM documents WHERE parent > ? AND parent < ?',
+                (prefix, prefix + '\uffff')))
+        return [LocalDocumentReference(self._store, self._path, doc_id) for doc_id in sorted(ids)]
+
+
+class LocalAggregationQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self):
+        query = self._query
+        count = sum(1 for _ in query._results())
+        with query._store._lock:
+            query._store.ops['aggregation'] += 1
+        return [[AggregationResult(self._alias, count, _now())]]
+
+
+LocalQueryPartition = namedtuple('LocalQueryPartition', ['start_at', 'end_at'])
+
+
+class LocalCollectionGroup:
+    """collection_group() for the local store; only get_partitions() is supported."""
+
+    def __init__(self, store, collection_id):
+        self._store = store
+        self._collection_id = collection_id
+
+    def get_partitions(self, partition_count):
+        """
+        Split the group into at most partition_count ranges of about equal size,
+        each bounded by document references like Firestore's QueryPartition.
+        """
+        paths = self._store._group_paths(self._collection_id)
+        with self._store._lock:
+            self._store.ops['query'] += 1
+        step = len(paths) / partition_count
+        split_paths = sorted({paths[int(step * i)] for i in range(1, partition_count)} if paths else set())
+        start_at = None
+        for path in split_paths:
+            end_at = self._store.document(path)
+            yield LocalQueryPartition(start_at, end_at)
+            start_at = end_at
+        yield LocalQueryPartition(start_at, None)
+
+
+class LocalWatch:
+    """
+    on_snapshot() for the local store. The callback gets the initial result set
+    as ADDED changes, then one call per commit that touches the query, always
+    on this watch's own thread so a slow callback never blocks a writer.
+    """
+
+    def __init__(self, query, callback):
+        self._query = query
+        self._callback = callback
+        self._events = queue.Queue()
+        self._docs = {}
+        self._closed = threading.Event()
+        with query._store._lock:
+            initial = list(query._results())
+            query._store._watches.append(self)
+        read_time = _now()
+        changes = []
+        for index, (doc_id, data) in enumerate(initial):
+            snapshot = self._snapshot(doc_id, data, read_time)
+            self._docs[doc_id] = snapshot
+            changes.append(DocumentChange(ChangeType.ADDED, snapshot, -1, index))
+        self._events.put((None, changes, read_time))
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def _snapshot(self, doc_id, data, read_time):
+        ref = LocalDocumentReference(self._query._store, self._query._path, doc_id)
+        return LocalDocumentSnapshot(ref, data, read_time)
+
+    def _notify(self, writes, read_time):
+        """Queue the (parent, id, old, new) writes of a commit that belong to this collection."""
+        writes = [write for write in writes if write[0] == self._query._path]
+        if writes:
+            self._events.put((writes, None, read_time))
+
+    def _changes(self, writes, read_time):
+        changes = []
+        for _, doc_id, old, new in writes:
+            was = old is not None and self._query._matches(old)
+            now = new is not None and self._query._matches(new)
+            if now:
+                snapshot = self._snapshot(doc_id, new, read_time)
+                self._docs[doc_id] = snapshot
+                changes.append(DocumentChange(ChangeType.MODIFIED if was else ChangeType.ADDED, snapshot, -1, -1))
+            elif was:
+                del self._docs[doc_id]
+                changes.append(DocumentChange(ChangeType.REMOVED, self._snapshot(doc_id, old, read_time), -1, -1))
+        return changes
+
+    def _dispatch(self):
+        while not self._closed.is_set():
+            try:
+                writes, changes, read_time = self._events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if writes is not None:
+                changes = self._changes(writes, read_time)
+                if not changes:
+                    continue
+            self._callback(list(self._docs.values()), changes, read_time)
+
+    def unsubscribe(self):
+        self._closed.set()
+        with self._query._store._lock:
+            if self in self._query._store._watches:
+                self._query._store._watches.remove(self)
@@ -0,0 +1,248 @@
+import atexit
+import bisect
+import contextlib
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# Job instrumentation shared by the scripts and the helpers they use.
+#
+# scan.py counts the documents it reads and times each page fetch, BulkWriter
+# counts committed writes and deletes and times each commit, the cleaners time
+# parsing and normalizing. A job calls start_job() once; it then gets a single
+# progress line every few seconds instead of a print per document, and a
+# summary at exit. With QOOT_METRICS_FILE set, the numbers are also written to
+# that file at intervals and at exit: JSON, or the Prometheus textfile format
+# when the name ends in .prom.
+
+METRICS_FILE_ENV = 'QOOT_METRICS_FILE'
+METRICS_INTERVAL_ENV = 'QOOT_METRICS_INTERVAL'
+
+# Upper bounds (seconds) of the stage histogram buckets
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+OPERATIONS = ('read', 'write', 'delete')  # What Firestore bills for
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, data):
+        for i, n in enumerate(data['counts']):
+            self.counts[i] += n
+        self.count += data['count']
+        self.sum += data['sum']
+        self.max = max(self.max, data['max'])
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of observations."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS + (self.max,), self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'counts': list(self.counts), 'count': self.count, 'sum': self.sum, 'max': self.max}
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # bytes on macOS, KiB on Linux
+
+
+class JobMetrics:
+    """Counters, stage timings and throughput of one job."""
+
+    def __init__(self, job, progress_every=5.0, path=None, write_every=30.0):
+        self.job = job
+        self.counters = {op: 0 for op in OPERATIONS}
+        self.stages = {}
+        self.documents = 0
+        self.started = time.monotonic()
+        self._progress_every = progress_every
+        self._last_progress = self.started
+        self._path = path
+        self._write_every = write_every
+        self._last_write = self.started
+        self._lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram()
+            self.stages[stage].observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def merge_stages(self, stages):
+        """Add stage histograms exported by another process (see collect())."""
+        with self._lock:
+            for stage, data in stages.items():
+                self.stages.setdefault(stage, Histogram()).merge(data)
+
+    def progress(self, n=1):
+        """Count processed documents; prints a progress line (and writes the file) now and then."""
+        with self._lock:
+            self.documents += n
+            now = time.monotonic()
+            due_line = now - self._last_progress >= self._progress_every
+            due_file = self._path and now - self._last_write >= self._write_every
+            if due_line:
+                self._last_progress = now
+            if due_file:
+                self._last_write = now
+        if due_line:
+            print(self.progress_line())
+        if due_file:
+            self.write()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def progress_line(self):
+        elapsed = self.elapsed()
+        ops = ', '.join(f"{op}s {self.counters.get(op, 0):,}" for op in OPERATIONS)
+        stages = ', '.join(f"{stage} p95 {histogram.percentile(0.95) * 1000:.1f}ms"
+                           for stage, histogram in sorted(self.stages.items()))
+        line = f"{self.job}: {self.documents:,} docs ({self.documents / elapsed:,.0f} docs/s), {ops}"
+        return f"{line} | {stages}" if stages else line
+
+    def snapshot(self):
+        elapsed = self.elapsed()
+        with self._lock:
+            return {
+                'job': self.job,
+                'elapsed_seconds': elapsed,
+                'documents': self.documents,
+                'documents_per_second': self.documents / elapsed if elapsed else 0.0,
+                'peak_rss_bytes': peak_rss_bytes(),
+                'counters': dict(self.counters),
+                'stages': {stage: histogram.as_dict() for stage, histogram in self.stages.items()},
+            }
+
+    def summary(self):
+        """
+        Where the time went: total, share of wall time and percentiles per stage.
+        Stages run by several threads at once (commits) can add up to more than 100%.
+        """
+        snapshot = self.snapshot()
+        lines = [self.progress_line(),
+                 f"  elapsed {snapshot['elapsed_seconds']:.1f}s, peak RSS {snapshot['peak_rss_bytes'] / 1e6:.0f} MB"]
+        extra = {k: v for k, v in snapshot['counters'].items() if k not in OPERATIONS and v}
+        if extra:
+            lines.append('  ' + ', '.join(f"{name} {value:,}" for name, value in sorted(extra.items())))
+        for stage, histogram in sorted(self.stages.items(), key=lambda item: -item[1].sum):
+            share = histogram.sum / snapshot['elapsed_seconds'] * 100 if snapshot['elapsed_seconds'] else 0
+            lines.append(f"  {stage:<10} {histogram.count:>9,} x  total {histogram.sum:8.2f}s ({share:5.1f}%)  "
+                         f"p50 {histogram.percentile(0.5) * 1000:8.2f}ms  "
+                         f"p95 {histogram.percentile(0.95) * 1000:8.2f}ms  max {histogram.max * 1000:8.2f}ms")
+        return '\n'.join(lines)
+
+    def write(self, path=None):
+        path = path or self._path
+        if not path:
+            return
+        snapshot = self.snapshot()
+        text = prometheus_text(snapshot) if path.endswith('.prom') else json.dumps(snapshot, indent=2)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)  # The textfile collector must never see a half-written file
+
+
+def prometheus_text(snapshot):
+    job = snapshot['job']
+    lines = ['# TYPE qoot_job_operations_total counter']
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append(f'qoot_job_operations_total{{job="{job}",op="{name}"}} {value}')
+    lines += ['# TYPE qoot_job_documents_total counter',
+              f'qoot_job_documents_total{{job="{job}"}} {snapshot["documents"]}',
+              '# TYPE qoot_job_documents_per_second gauge',
+              f'qoot_job_documents_per_second{{job="{job}"}} {snapshot["documents_per_second"]:.3f}',
+              '# TYPE qoot_job_elapsed_seconds gauge',
+              f'qoot_job_elapsed_seconds{{job="{job}"}} {snapshot["elapsed_seconds"]:.3f}',
+              '# TYPE qoot_job_peak_rss_bytes gauge',
+              f'qoot_job_peak_rss_bytes{{job="{job}"}} {snapshot["peak_rss_bytes"]}',
+              '# TYPE qoot_job_stage_seconds histogram']
+    for stage, data in sorted(snapshot['stages'].items()):
+        labels = f'job="{job}",stage="{stage}"'
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ('+Inf',), data['counts']):
+            cumulative += n
+            lines.append(f'qoot_job_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'qoot_job_stage_seconds_sum{{{labels}}} {data["sum"]:.6f}')
+        lines.append(f'qoot_job_stage_seconds_count{{{labels}}} {data["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+_current = JobMetrics('job')
+_job_started = False
+
+
+def current():
+    """The metrics of the running job (a default one until start_job() is called)."""
+    return _current
+
+
+def start_job(job, progress_every=5.0):
+    """Name the job, and print a summary and write $QOOT_METRICS_FILE when the process exits."""
+    global _current, _job_started
+    path = os.environ.get(METRICS_FILE_ENV)
+    write_every = float(os.environ.get(METRICS_INTERVAL_ENV) or 30.0)
+    metrics = JobMetrics(job, progress_every, path, write_every)
+    metrics.merge_stages({stage: h.as_dict() for stage, h in _current.stages.items()})
+    for name, value in _current.counters.items():
+        metrics.count(name, value)
+    _current = metrics
+    if not _job_started:
+        _job_started = True
+        atexit.register(_finish)
+    return metrics
+
+
+def _finish():
+    print(_current.summary())
+    _current.write()
+
+
+@contextlib.contextmanager
+def collect():
+    """
+    Record into a fresh JobMetrics for the duration (used in worker processes,
+    whose stage timings are sent back to the parent and merged there).
+    """
+    global _current
+    previous = _current
+    _current = JobMetrics(previous.job)
+    try:
+        yield _current
+    finally:
+        _current = previous
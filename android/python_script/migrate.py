@@ -0,0 +1,214 @@
+import abc
+import argparse
+from collections import OrderedDict
+import datastore
+import metrics
+from bulkwriter import BulkWriter
+from scan import Checkpoint, scan_documents
+
+# Declarative schema migrations. Each migration is an ordered list of field
+# operations on one collection. Every pending migration of a collection is
+# applied in a single pass: the scan fetches only the fields the operations
+# touch, each document gets at most one update, and the applied versions are
+# recorded in _migrations so running the script again does nothing.
+
+MIGRATIONS_COLLECTION = '_migrations'
+
+
+class Operation(abc.ABC):
+    """A field change. apply() edits data (the document as seen so far) and records the write in updates."""
+
+    fields = ()  # Fields the operation reads
+
+    @abc.abstractmethod
+    def apply(self, data, updates):
+        """Change data in place and add the matching field writes to updates."""
+
+    @abc.abstractmethod
+    def describe(self):
+        """Short description, printed at the start of a pass and stored in _migrations."""
+
+
+class DeleteFields(Operation):
+    def __init__(self, *fields):
+        self.fields = fields
+
+    def apply(self, data, updates):
+        for field in self.fields:
+            if field in data:
+                del data[field]
+                updates[field] = datastore.DELETE_FIELD
+
+    def describe(self):
+        return f"delete {', '.join(self.fields)}"
+
+
+class RenameField(Operation):
+    """
+    Move old to new, converting the value on the way if convert is given.
+    When new is already set, the old field is dropped and new is left alone.
+    """
+
+    def __init__(self, old, new, convert=None):
+        self.old, self.new, self.convert = old, new, convert
+        self.fields = (old, new)
+
+    def apply(self, data, updates):
+        if self.old not in data:
+            return
+        value = data.pop(self.old)
+        updates[self.old] = datastore.DELETE_FIELD
+        if self.new not in data:
+            data[self.new] = updates[self.new] = self.convert(value) if self.convert else value
+
+    def describe(self):
+        return f"rename {self.old} to {self.new}"
+
+
+class SetField(Operation):
+    """Set a constant, skipping documents that already have it."""
+
+    def __init__(self, field, value):
+        self.field, self.value = field, value
+        self.fields = (field,)
+
+    def apply(self, data, updates):
+        if data.get(self.field, object()) != self.value:
+            data[self.field] = updates[self.field] = self.value
+
+    def describe(self):
+        return f"set {self.field} = {self.value!r}"
+
+
+class TransformField(Operation):
+    """Replace a field with function(value) when it is present and the result differs."""
+
+    def __init__(self, field, function, description=None):
+        self.field, self.function = field, function
+        self.fields = (field,)
+        self.description = description or getattr(function, '__name__', 'transform')
+
+    def apply(self, data, updates):
+        if self.field not in data:
+            return
+        value = self.function(data[self.field])
+        if value != data[self.field]:
+            data[self.field] = updates[self.field] = value
+
+    def describe(self):
+        return f"{self.description} {self.field}"
+
+
+class Migration:
+    def __init__(self, version, collection, operations, description=''):
+        self.version = version
+        self.collection = collection
+        self.operations = operations
+        self.description = description
+
+
+# Applied in this order; never renumber or edit one that has shipped, add a new one instead
+MIGRATIONS = [
+    Migration('001-drop-legacy-recipe-fields', 'recipes',
+              [DeleteFields("dish_type", "nutrients", "rattings", "serves", "subcategory")],
+              "Fields from the original dataset the app never used (was deleteFeilds.py)"),
+    Migration('002-flag-recipes', 'recipes', [SetField('flag', "recipes")],
+              "Source flag read by the planner and collections (was flagqoot.py)"),
+    Migration('003-flag-users-recipes', 'users_recipes', [SetField('flag', "users_recipes")],
+              "Source flag for user recipes (was flaguser.py)"),
+    # Not copied into cleaned_ingredients: that would bypass the search index and vocabulary,
+    # so cleanWors.py cleans these recipes from their ingredients instead
+    Migration('004-drop-cleanedingredients', 'recipes',
+              [DeleteFields('cleanedingredients', 'cleanedingredients_hash')],
+              "The old pipeline's field, superseded by cleaned_ingredients (was furthercleaning.py)"),
+]
+
+
+def applied_versions(db):
+    return {doc.id for doc in db.collection(MIGRATIONS_COLLECTION).select([]).stream()}
+
+
+def pending_migrations(db, migrations=MIGRATIONS, only=None, force=False):
+    applied = set() if force else applied_versions(db)
+    return [m for m in migrations
+            if m.version not in applied and (not only or m.version in only)]
+
+
+def migrate_collection(db, collection_name, migrations, dry_run=False, page_size=500):
+    """Apply several migrations to one collection in one pass; returns the number of documents changed."""
+    operations = [op for migration in migrations for op in migration.operations]
+    fields = sorted({field for op in operations for field in op.fields})
+    versions = [migration.version for migration in migrations]
+    print(f"Migrating '{collection_name}': {', '.join(versions)}")
+    for op in operations:
+        print(f"  {op.describe()}")
+
+    writer = BulkWriter(db)
+    checkpoint = None if dry_run else Checkpoint(f"migrate-{collection_name}-{versions[-1]}")
+    collection_ref = db.collection(collection_name)
+    scanned = changed = 0
+    for doc in scan_documents(collection_ref, page_size, select=fields, checkpoint=checkpoint, writer=writer):
+        scanned += 1
+        data = doc.to_dict()
+        updates = {}
+        for op in operations:
+            op.apply(data, updates)
+        if updates:
+            changed += 1
+            if not dry_run:
+                writer.update(collection_ref.document(doc.id), updates, stamp=True)
+    writer.close()
+
+    if dry_run:
+        print(f"Dry run: {changed} of {scanned} documents would change.")
+        return changed
+    if writer.failed:
+        # Leave the versions unrecorded; the checkpoint stopped before the first page
+        # with a failed update, so the next run retries from there
+        print(f"{len(writer.failed)} updates failed; {', '.join(versions)} not recorded as applied.")
+        return changed
+
+    for migration in migrations:
+        db.collection(MIGRATIONS_COLLECTION).document(migration.version).set({
+            'collection': collection_name,
+            'description': migration.description,
+            'operations': [op.describe() for op in migration.operations],
+            'documents_changed': changed,  # By the whole pass, shared with the other migrations in it
+            'applied_at': datastore.SERVER_TIMESTAMP,
+        })
+    checkpoint.clear()
+    print(f"Updated {writer.committed} of {scanned} documents.")
+    return changed
+
+
+def run_migrations(db, migrations=MIGRATIONS, only=None, force=False, dry_run=False):
+    """Run every pending migration, one pass per collection, in the order they are listed."""
+    pending = pending_migrations(db, migrations, only, force)
+    if not pending:
+        print("No pending migrations.")
+        return
+    by_collection = OrderedDict()
+    for migration in pending:
+        by_collection.setdefault(migration.collection, []).append(migration)
+    for collection_name, collection_migrations in by_collection.items():
+        migrate_collection(db, collection_name, collection_migrations, dry_run=dry_run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument('--only', nargs='+', metavar='VERSION', help="run only these migrations")
+    parser.add_argument('--force', action='store_true', help="run migrations even if they were applied before")
+    parser.add_argument('--dry-run', action='store_true', help="count the documents that would change")
+    parser.add_argument('--list', action='store_true', help="show every migration and whether it was applied")
+    args = parser.parse_args()
+
+    metrics.start_job('migrate')
+
+    db = datastore.connect()
+    if args.list:
+        applied = applied_versions(db)
+        for migration in MIGRATIONS:
+            state = 'applied' if migration.version in applied else 'pending'
+            print(f"{migration.version:<48} {migration.collection:<14} {state:<8} {migration.description}")
+    else:
+        run_migrations(db, only=args.only, force=args.force, dry_run=args.dry_run)
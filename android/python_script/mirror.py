@@ -0,0 +1,178 @@
+import argparse
+import datetime
+import os
+
+import datastore
+import metrics
+from bulkwriter import UPDATED_AT, BulkWriter
+from localstore import LocalStore
+from scan import DOCUMENT_ID, scan_pages
+
+# A local copy of chosen collections for the analysis scripts, which can then
+# run with --mirror (or QOOT_DATASTORE=mirror) instead of reading every
+# document from Firestore again. The mirror is a local store file (see
+# localstore.py), so the scripts' queries work on it unchanged.
+#
+# The first sync copies each collection in full. Later syncs only fetch the
+# documents whose UPDATED_AT (stamped by the scripts' recipe writes) is past
+# the collection's watermark. Deletions leave no timestamp behind, so every
+# reconcile_days the sync also lists the collection's IDs (no fields) and
+# drops the documents that are gone; documents the app created without a
+# timestamp are picked up by the same listing. Edits made by the app itself
+# carry no timestamp either: run with --full to refresh everything.
+#
+#   python mirror.py                         sync recipes and users_recipes
+#   python mirror.py recipes --reconcile     also check for deleted documents now
+#   python export.py --mirror                export from the mirror
+
+DEFAULT_COLLECTIONS = ['recipes', 'users_recipes']
+
+# Sync state per collection, kept in the mirror itself
+STATE_COLLECTION = '_mirror'
+
+# Refetch a little before the watermark, in case of clock skew between the writers' commits
+OVERLAP = datetime.timedelta(minutes=5)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _mirror_value(mirror, value):
+    """Firestore values the local store cannot hold as they are (references, geo points, bytes)."""
+    if isinstance(value, dict):
+        return {key: _mirror_value(mirror, item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_mirror_value(mirror, item) for item in value]
+    if isinstance(value, (str, int, float, bool, datetime.datetime)) or value is None:
+        return value
+    if hasattr(value, 'path') and hasattr(value, 'collection'):  # DocumentReference
+        return mirror.document(value.path)
+    if hasattr(value, 'latitude') and hasattr(value, 'longitude'):  # GeoPoint
+        return {'latitude': value.latitude, 'longitude': value.longitude}
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+def _copy_pages(pages, mirror, name, writer):
+    """Write each page's documents into the mirror; returns (documents copied, their newest UPDATED_AT, IDs)."""
+    collection_ref = mirror.collection(name)
+    copied, newest, ids = 0, None, set()
+    for page in pages:
+        for doc in page:
+            data = _mirror_value(mirror, doc.to_dict())
+            writer.set(collection_ref.document(doc.id), data)
+            stamp = data.get(UPDATED_AT)
+            if isinstance(stamp, datetime.datetime) and (newest is None or stamp > newest):
+                newest = stamp
+            ids.add(doc.id)
+        copied += len(page)
+        metrics.current().progress(len(page))
+    return copied, newest, ids
+
+
+def _changed_pages(collection_ref, since, page_size):
+    """Pages of documents written after since, oldest first."""
+    query = collection_ref.where(UPDATED_AT, '>', since).order_by(UPDATED_AT).order_by(DOCUMENT_ID)
+    last = None
+    while True:
+        page_query = query.limit(page_size)
+        if last is not None:
+            page_query = page_query.start_after(last)
+        with metrics.current().time('fetch'):
+            docs = list(page_query.stream())
+        metrics.current().count('read', max(len(docs), 1))
+        if not docs:
+            return
+        yield docs
+        last = docs[-1]
+
+
+def _reconcile(source, mirror, name, writer, page_size):
+    """Delete mirrored documents that no longer exist and fetch ones the mirror never saw."""
+    source_ids = set()
+    for page in scan_pages(source.collection(name), page_size, select=[]):
+        source_ids.update(doc.id for doc in page)
+    mirror_ref = mirror.collection(name)
+    mirror_ids = {doc.id for doc in mirror_ref.select([]).stream()}
+
+    for doc_id in mirror_ids - source_ids:
+        writer.delete(mirror_ref.document(doc_id))
+    missing = sorted(source_ids - mirror_ids)
+    for start in range(0, len(missing), page_size):
+        refs = [source.collection(name).document(doc_id) for doc_id in missing[start:start + page_size]]
+        docs = [doc for doc in source.get_all(refs) if doc.exists]
+        metrics.current().count('read', len(refs))
+        _copy_pages([docs], mirror, name, writer)
+    return len(mirror_ids - source_ids), len(missing)
+
+
+def sync_collection(source, mirror, name, full=False, reconcile=None, reconcile_days=7, page_size=500):
+    """
+    Bring the mirror's copy of one collection up to date.
+
+    reconcile=None reconciles deletions when the last reconcile is older than
+    reconcile_days; True or False forces it either way.
+    """
+    state_ref = mirror.collection(STATE_COLLECTION).document(name)
+    snapshot = state_ref.get()
+    state = snapshot.to_dict() if snapshot.exists else {}
+    started = _now()
+    writer = BulkWriter(mirror)  # Unstamped, so the source's UPDATED_AT is kept
+
+    if full or 'watermark' not in state:
+        # Mirrored documents that are not seen again were deleted at the source
+        stale = {doc.id for doc in mirror.collection(name).select([]).stream()}
+        copied, _, ids = _copy_pages(scan_pages(source.collection(name), page_size), mirror, name, writer)
+        stale -= ids
+        for doc_id in stale:
+            writer.delete(mirror.collection(name).document(doc_id))
+        watermark = started  # Anything written from now on has a later UPDATED_AT
+        print(f"'{name}': copied {copied} documents, removed {len(stale)}")
+        reconciled = True
+    else:
+        since = state['watermark'] - OVERLAP
+        copied, newest, _ = _copy_pages(_changed_pages(source.collection(name), since, page_size),
+                                        mirror, name, writer)
+        watermark = max(state['watermark'], newest) if newest else state['watermark']
+        print(f"'{name}': {copied} documents changed since {since.isoformat()}")
+        last = state.get('reconciled_at')
+        reconciled = reconcile if reconcile is not None else (
+            last is None or started - last > datetime.timedelta(days=reconcile_days))
+        if reconciled:
+            deleted, added = _reconcile(source, mirror, name, writer, page_size)
+            print(f"'{name}': reconciled, {deleted} deleted and {added} untracked documents")
+
+    writer.close()
+    if writer.failed:
+        print(f"'{name}': {len(writer.failed)} mirror writes failed; watermark left at its old value.")
+        return
+    state = {**state, 'watermark': watermark, 'synced_at': started}
+    if reconciled:
+        state['reconciled_at'] = started
+    state_ref.set(state)
+
+
+def sync(source, mirror, collections=DEFAULT_COLLECTIONS, full=False, reconcile=None, reconcile_days=7):
+    for name in collections:
+        sync_collection(source, mirror, name, full=full, reconcile=reconcile, reconcile_days=reconcile_days)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync collections into the local mirror.")
+    parser.add_argument('collections', nargs='*', default=DEFAULT_COLLECTIONS)
+    parser.add_argument('--full', action='store_true', help="copy every document again")
+    reconcile = parser.add_mutually_exclusive_group()
+    reconcile.add_argument('--reconcile', action='store_true', default=None,
+                           help="check for deleted documents on this run")
+    reconcile.add_argument('--no-reconcile', dest='reconcile', action='store_false',
+                           help="skip the deletion check even if it is due")
+    parser.add_argument('--reconcile-days', type=int, default=7, help="days between deletion checks")
+    parser.add_argument('--path', default=datastore.mirror_path(), help="mirror file (default: $QOOT_MIRROR)")
+    args = parser.parse_args()
+
+    metrics.start_job('mirror')
+    os.makedirs(os.path.dirname(os.path.abspath(args.path)), exist_ok=True)
+    sync(datastore.connect(), LocalStore(args.path), args.collections, full=args.full,
+         reconcile=args.reconcile, reconcile_days=args.reconcile_days)
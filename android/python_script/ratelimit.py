@@ -0,0 +1,158 @@
+import os
+import random
+import threading
+import time
+
+import datastore
+import metrics
+
+# Client-side write pacing shared by every BulkWriter in the process.
+#
+# RateController is an AIMD limiter on write operations per second: while the
+# writers are held back by it and commits succeed, the rate grows additively;
+# a quota or contention error cuts it multiplicatively. Retries wait with
+# full-jitter exponential backoff and spend from a RetryBudget that is refilled
+# by successes, so a backend that keeps failing sees fewer retries, not more.
+
+# QOOT_WRITE_RATE sets the starting rate for Firestore (the 500/50/5 ramp-up rule starts at 500)
+WRITE_RATE_ENV = 'QOOT_WRITE_RATE'
+INITIAL_RATE = 500.0
+
+# google.api_core exception class names that mean "slow down and try again"
+RETRYABLE_ERRORS = {
+    'ResourceExhausted', 'TooManyRequests',  # RESOURCE_EXHAUSTED / HTTP 429
+    'Aborted', 'Conflict',  # ABORTED: contention on the same documents
+    'DeadlineExceeded', 'GatewayTimeout', 'ServiceUnavailable',
+    'TimeoutError',
+}
+
+
+def is_retryable(error):
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+class RateController:
+    """
+    Pace write operations to `rate` per second, adapting it to the backend.
+    rate=None means unlimited (the local store); errors still back off.
+    """
+
+    def __init__(self, rate=INITIAL_RATE, min_rate=20.0, max_rate=10000.0, increase=50.0, decrease=0.5,
+                 cooldown=1.0, burst=1.0):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase  # ops/s gained per second of successful, rate-limited traffic
+        self.decrease = decrease  # factor applied on a throttling error
+        self.cooldown = cooldown  # at most one decrease per cooldown, however many commits fail at once
+        self.burst = burst  # seconds of unused rate that may be spent at once
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+        self._last_decrease = 0.0
+        self._saturated = False
+        self.throttled = 0  # throttling errors seen
+
+    def acquire(self, ops=1):
+        """Block until ops more writes fit in the current rate."""
+        if self.rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next_free, now - self.burst)
+            self._next_free = start + ops / self.rate
+            wait = start - now
+            self._saturated = wait > 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self, ops=1):
+        if self.rate is None:
+            return
+        with self._lock:
+            if self._saturated:  # Only grow while the limit is what holds the writers back
+                self.rate = min(self.max_rate, self.rate + self.increase * ops / self.rate)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttled += 1
+            metrics.current().count('throttled')
+            now = time.monotonic()
+            if self.rate is None or now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+        print(f"Backend is throttling writes; slowing down to {self.rate:,.0f} ops/s")
+
+
+class RetryBudget:
+    """
+    Retries allowed as a fraction of successful calls (plus a small reserve),
+    so retries can never multiply the load on a struggling backend.
+    """
+
+    def __init__(self, ratio=0.2, reserve=20):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = float(reserve)
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def on_success(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.reserve + 100 * self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.retries += 1
+        metrics.current().count('retries')
+        return True
+
+
+def backoff(attempt, base=0.5, cap=32.0):
+    """Full-jitter exponential backoff: a random wait up to base * 2^attempt, capped."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Pacer:
+    """A controller and a retry budget; call() runs one write or commit under both."""
+
+    def __init__(self, controller, budget=None, max_attempts=8):
+        self.controller = controller
+        self.budget = budget or RetryBudget()
+        self.max_attempts = max_attempts
+
+    def call(self, function, ops=1):
+        attempt = 0
+        while True:
+            self.controller.acquire(ops)
+            try:
+                result = function()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self.controller.on_throttle()
+                attempt += 1
+                if attempt >= self.max_attempts or not self.budget.try_spend():
+                    raise
+                time.sleep(backoff(attempt - 1))
+                continue
+            self.controller.on_success(ops)
+            self.budget.on_success()
+            return result
+
+
+_pacers = {}
+_pacers_lock = threading.Lock()
+
+
+def pacer_for(db):
+    """The process-wide pacer for a client: Firestore starts at QOOT_WRITE_RATE, the local store is unlimited."""
+    local = datastore.is_local(db)
+    with _pacers_lock:
+        if local not in _pacers:
+            rate = None if local else float(os.environ.get(WRITE_RATE_ENV) or INITIAL_RATE)
+            _pacers[local] = Pacer(RateController(rate))
+        return _pacers[local]
@@ -0,0 +1,224 @@
+import functools
+import json
+import os
+import queue
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import startup
+
+# Field path Firestore uses for the document ID (FieldPath.document_id())
+DOCUMENT_ID = '__name__'
+
+# QOOT_CHECKPOINT_DIR keeps test and benchmark runs away from real checkpoints
+CHECKPOINT_DIR = os.environ.get('QOOT_CHECKPOINT_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'checkpoints')
+
+
+class Checkpoint:
+    """
+    The last fully processed document ID of a long-running job, kept in a local file.
+    A job that crashes or hits a quota error resumes after this ID on the next run.
+    """
+
+    def __init__(self, name, directory=CHECKPOINT_DIR):
+        self.path = os.path.join(directory, f"{name}.json")
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f).get('last_id')
+        except (OSError, ValueError):
+            return None
+
+    def save(self, last_id):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_id': last_id}, f)
+        os.replace(tmp_path, self.path)  # Atomic, so a crash never leaves a torn file
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def scan_pages(collection_ref, page_size=500, select=None, checkpoint=None, start_at=None, end_before=None):
+    """
+    Yield a collection's documents page by page, ordered by document ID.
+
+    The ID is unique and never changes, so pages neither skip nor repeat
+    documents while other fields are rewritten. With a checkpoint, the scan
+    starts after the last saved ID. select limits the fields fetched.
+    start_at and end_before limit the scan to a range of IDs.
+    """
+    query = collection_ref
+    if select is not None:
+        query = query.select(select)
+    query = query.order_by(DOCUMENT_ID)
+    if end_before is not None:
+        query = query.end_before({DOCUMENT_ID: end_before})
+
+    last_id = checkpoint.load() if checkpoint else None
+    if last_id:
+        print(f"Resuming after document ID: {last_id}")
+
+    while True:
+        page_query = query.limit(page_size)
+        if last_id:
+            page_query = page_query.start_after({DOCUMENT_ID: last_id})
+        elif start_at is not None:
+            page_query = page_query.start_at({DOCUMENT_ID: start_at})
+
+        with metrics.current().time('fetch'):
+            docs = list(page_query.stream())
+        metrics.current().count('read', max(len(docs), 1))  # An empty result is still billed as one read
+        if not docs:
+            return
+        startup.first_document()
+        yield docs
+        last_id = docs[-1].id
+
+
+def scan_documents(collection_ref, page_size=500, select=None, checkpoint=None, writer=None):
+    """
+    Yield documents one at a time (see scan_pages), advancing the checkpoint as pages finish.
+
+    When the job writes through a BulkWriter, pass it as writer: the checkpoint
+    then only moves past a page once every write queued for it is committed,
+    and stops moving once any write has failed, so the next run starts again
+    from before the first page with a failure.
+    """
+    failed_before = len(writer.failed) if writer else 0
+
+    def save_if_committed(last_id):
+        if len(writer.failed) == failed_before:
+            checkpoint.save(last_id)
+
+    for page in scan_pages(collection_ref, page_size, select, checkpoint):
+        yield from page
+        if checkpoint:
+            if writer:
+                writer.after_committed(functools.partial(save_if_committed, page[-1].id))
+            else:
+                checkpoint.save(page[-1].id)
+
+
+# Firestore's auto IDs are 20 characters drawn uniformly from these, which sort in this order
+AUTO_ID_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+
+
+def auto_id_split_points(partitions):
+    """IDs that cut the auto-ID space into equal ranges (even for random IDs, skewed for chosen ones)."""
+    size = len(AUTO_ID_ALPHABET)
+    points = []
+    for i in range(1, partitions):
+        position = i * size * size // partitions
+        points.append(AUTO_ID_ALPHABET[position // size] + AUTO_ID_ALPHABET[position % size])
+    return points
+
+
+def partition_bounds(db, collection_ref, partitions):
+    """
+    [(start_at, end_before), ...] document ID ranges that cover the collection,
+    None meaning open-ended. Split points come from Firestore's partition query
+    (get_partitions, which balances the ranges by document count); when that
+    is unavailable the auto-ID space is cut into equal slices instead.
+    """
+    if partitions <= 1:
+        return [(None, None)]
+    path = collection_ref.document('_').path.rsplit('/', 1)[0]
+    try:
+        group = db.collection_group(collection_ref.id)
+        # The group spans every collection with this ID; keep the split points in this one
+        points = [p.end_at.id for p in group.get_partitions(partitions)
+                  if p.end_at is not None and p.end_at.path.rsplit('/', 1)[0] == path]
+    except Exception as e:
+        print(f"Partition query unavailable ({e}); splitting the auto-ID range instead")
+        points = auto_id_split_points(partitions)
+    bounds = [None] + points + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+class _PartitionProgress:
+    """Rate-limited 'partitions done, documents per partition' lines."""
+
+    def __init__(self, partitions, every=5.0):
+        self.docs = [0] * partitions
+        self.done = [False] * partitions
+        self._every = every
+        self._last = time.monotonic()
+
+    def add(self, partition, count):
+        self.docs[partition] += count
+        self.tick()
+
+    def finish(self, partition):
+        self.done[partition] = True
+
+    def tick(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < self._every:
+            return
+        self._last = now
+        counts = ' '.join(f"{count:,}{'' if done else '+'}" for count, done in zip(self.docs, self.done))
+        print(f"Partitions: {sum(self.done)}/{len(self.done)} done, "
+              f"{sum(self.docs):,} documents ({counts})")
+
+
+def scan_partitioned(db, collection_ref, partitions=8, page_size=500, select=None, pages_ahead=None):
+    """
+    Yield a collection's documents page by page from several ID ranges streamed at once.
+
+    Each range (see partition_bounds) is read by its own thread with scan_pages,
+    so the scan is no longer limited to one cursor's throughput. Pages from a
+    range arrive in ID order, but ranges are interleaved as their pages come in.
+    Use scan_pages for a checkpointed scan: there is no single last ID to resume from.
+    """
+    bounds = partition_bounds(db, collection_ref, partitions)
+    pages = queue.Queue(maxsize=pages_ahead or len(bounds) * 2)
+    stop = threading.Event()
+    progress = _PartitionProgress(len(bounds))
+
+    def put(item):
+        while not stop.is_set():  # Give up once the consumer has gone away
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(partition, start_at, end_before):
+        try:
+            for page in scan_pages(collection_ref, page_size, select, start_at=start_at, end_before=end_before):
+                if not put((partition, page)):
+                    return
+            put((partition, None))
+        except Exception as e:
+            put((partition, e))
+
+    with ThreadPoolExecutor(max_workers=len(bounds)) as pool:
+        for partition, (start_at, end_before) in enumerate(bounds):
+            pool.submit(read, partition, start_at, end_before)
+        try:
+            remaining = len(bounds)
+            while remaining:
+                partition, page = pages.get()
+                if isinstance(page, Exception):
+                    raise page
+                if page is None:
+                    progress.finish(partition)
+                    remaining -= 1
+                    continue
+                progress.add(partition, len(page))
+                yield page
+            if len(bounds) > 1:
+                progress.tick(force=True)
+        finally:
+            stop.set()
@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import json
+import zlib
+
+import numpy as np
+
+import datastore
+import metrics
+from bulkwriter import BulkWriter
+from ingredientindex import SOURCES, index_key
+from scan import scan_documents
+
+# "Similar recipes" lists, precomputed so the detail page can show related
+# recipes with the one document read it already does:
+#
+#   recipes/{id}        {similar: ["recipes/<id>", "users_recipes/<id>", ...], similar_hash}
+#
+# Similarity is the Jaccard index of two recipes' cleaned ingredient sets.
+# Comparing every pair would grow with the square of the corpus, so each
+# recipe gets a MinHash signature (NUM_PERM minimum hashes of its ingredient
+# IDs) and the signatures are cut into BANDS bands: recipes that agree on a
+# whole band land in the same bucket and become candidates, and only
+# candidates get the exact Jaccard index. With 16 bands of 4 rows, pairs at
+# 0.5 similarity are found with probability ~0.65 per run, at 0.7 ~0.99.
+#
+# Runs are incremental: similar_hash records the ingredient set (and the
+# parameters) each list was computed from, and only recipes whose set changed,
+# plus the recipes that share a bucket with them or list them, are ranked
+# again. Lists are written only when they differ.
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+TOP_K = 10
+MIN_SIMILARITY = 0.2
+MAX_BUCKET = 500  # Buckets this large (e.g. "salt, water") hold no signal; the other bands still count
+
+# Bump when the parameters or the hashing change, so every list is recomputed
+SIMILAR_VERSION = 1
+
+_PRIME = (1 << 31) - 1  # Modulus of the hash family (a * x + b) mod p
+
+
+def similar_hash(ingredients):
+    payload = json.dumps([SIMILAR_VERSION, NUM_PERM, BANDS, TOP_K, MIN_SIMILARITY, sorted(ingredients)],
+                         ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class SimilarityIndex:
+    """MinHash signatures and LSH buckets over a set of recipes' ingredient sets."""
+
+    def __init__(self, recipes, seed=1):
+        """recipes maps each recipe key ('<collection>/<id>') to its set of ingredient keys."""
+        self.keys = sorted(key for key, ingredients in recipes.items() if ingredients)
+        self.positions = {key: n for n, key in enumerate(self.keys)}
+        ingredient_ids = {}
+        self.sets = [frozenset(ingredient_ids.setdefault(i, len(ingredient_ids)) for i in recipes[key])
+                     for key in self.keys]
+
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, _PRIME, size=(NUM_PERM, 1), dtype=np.int64)
+        b = rng.integers(0, _PRIME, size=(NUM_PERM, 1), dtype=np.int64)
+        # Hash of every ingredient under every permutation, computed once. The
+        # permutations run over a stable hash of the ingredient key, not its
+        # interned ID, so signatures do not depend on the order sets iterate in.
+        stable = np.array([zlib.crc32(i.encode('utf-8')) % _PRIME for i in ingredient_ids], dtype=np.int64)
+        hashes = ((a * stable + b) % _PRIME).astype(np.uint32)
+        self.signatures = self._signatures(hashes)
+        self.band_hashes = self._band_hashes(rng)
+        self._buckets = [self._group(band) for band in range(BANDS)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _signatures(self, hashes, chunk=20000):
+        """(recipes, NUM_PERM) minimum hashes: a min-reduction over each recipe's ingredient columns."""
+        signatures = np.empty((len(self.sets), NUM_PERM), dtype=np.uint32)
+        for start in range(0, len(self.sets), chunk):
+            sets = self.sets[start:start + chunk]
+            indices = np.fromiter((i for s in sets for i in s), dtype=np.int64, count=sum(map(len, sets)))
+            offsets = np.cumsum([0] + [len(s) for s in sets[:-1]])
+            signatures[start:start + len(sets)] = np.minimum.reduceat(hashes[:, indices], offsets, axis=1).T
+        return signatures
+
+    def _band_hashes(self, rng):
+        """(BANDS, recipes) 64-bit hash of each band of each signature."""
+        multipliers = rng.integers(1, 1 << 62, size=ROWS, dtype=np.uint64) | np.uint64(1)
+        bands = self.signatures.reshape(len(self.sets), BANDS, ROWS).astype(np.uint64)
+        return (bands * multipliers).sum(axis=2, dtype=np.uint64).T  # Wraps mod 2**64, which is fine
+
+    def _group(self, band):
+        """Recipe number -> the bucket (array of recipe numbers) it shares with others in this band."""
+        values = self.band_hashes[band]
+        order = np.argsort(values, kind='stable')
+        sorted_values = values[order]
+        starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        buckets = {}
+        for start, end in zip(starts, ends):
+            if 2 <= end - start <= MAX_BUCKET:
+                members = order[start:end]
+                for member in members:
+                    buckets[int(member)] = members
+        return buckets
+
+    def candidates(self, n):
+        found = set()
+        for buckets in self._buckets:
+            members = buckets.get(n)
+            if members is not None:
+                found.update(members.tolist())
+        found.discard(n)
+        return found
+
+    def neighbours(self, key, k=TOP_K, min_similarity=MIN_SIMILARITY):
+        """The k most similar recipe keys, most similar first."""
+        n = self.positions.get(key)
+        if n is None:
+            return []
+        mine = self.sets[n]
+        scored = []
+        for other in self.candidates(n):
+            theirs = self.sets[other]
+            similarity = len(mine & theirs) / len(mine | theirs)
+            if similarity >= min_similarity:
+                scored.append((-similarity, self.keys[other]))
+        scored.sort()
+        return [other for _, other in scored[:k]]
+
+
+def collect_recipes(db, page_size=500):
+    """Every source recipe's ingredient set, stored list and hash, keyed by '<collection>/<id>'."""
+    recipes = {}
+    for source, condition in SOURCES.items():
+        collection_ref = db.collection(source)
+        if condition:
+            collection_ref = collection_ref.where(*condition)
+        fields = ['cleaned_ingredients', 'similar', 'similar_hash']
+        for doc in scan_documents(collection_ref, page_size, select=fields):
+            data = doc.to_dict()
+            cleaned = data.get('cleaned_ingredients')
+            ingredients = {index_key(str(i)) for i in cleaned} - {None} if isinstance(cleaned, list) else set()
+            recipes[f"{source}/{doc.id}"] = (ingredients, data.get('similar'), data.get('similar_hash'))
+    return recipes
+
+
+def update_similar(db, source_db=None, full=False, dry_run=False):
+    """
+    Compute and write 'similar' for every recipe whose list may have changed.
+    source_db is where the recipes are read from (e.g. the local mirror); the
+    lists are always written to db.
+    """
+    job = metrics.current()
+    with job.time('load'):
+        recipes = collect_recipes(source_db or db)
+    with job.time('minhash'):
+        index = SimilarityIndex({key: ingredients for key, (ingredients, _, _) in recipes.items()})
+    print(f"Indexed {len(index)} recipes with ingredients")
+
+    hashes = {key: similar_hash(ingredients) for key, (ingredients, _, _) in recipes.items()}
+    changed = {key for key, (_, _, stored_hash) in recipes.items() if full or stored_hash != hashes[key]}
+    dirty = set(changed)
+    if not full:
+        # A changed recipe can enter or leave the lists of its candidates and of the recipes listing it
+        for key in changed:
+            n = index.positions.get(key)
+            if n is not None:
+                dirty.update(index.keys[other] for other in index.candidates(n))
+        # Recipes that were deleted or made private count as changed too
+        listed = {key: set(stored) for key, (_, stored, _) in recipes.items() if isinstance(stored, list)}
+        gone = set().union(*listed.values()) - set(recipes)
+        dirty.update(key for key, members in listed.items() if members & (changed | gone))
+    print(f"{len(changed)} recipes changed; ranking {len(dirty)}")
+
+    writer = BulkWriter(db)
+    written = 0
+    with job.time('rank'):
+        for key in sorted(dirty):
+            _, stored, stored_hash = recipes[key]
+            similar = index.neighbours(key)
+            if similar == stored and stored_hash == hashes[key]:
+                continue
+            written += 1
+            if not dry_run:
+                writer.update(db.document(key), {'similar': similar, 'similar_hash': hashes[key]}, stamp=True)
+            job.progress()
+    writer.close()
+    action = "Would update" if dry_run else "Updated"
+    print(f"{action} {written} 'similar' lists, {len(writer.failed)} failed.")
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute 'similar' recipe lists with MinHash LSH.")
+    parser.add_argument('--full', action='store_true', help="rank every recipe, not only the changed ones")
+    parser.add_argument('--mirror', action='store_true',
+                        help="read the recipes from the local mirror (see mirror.py); lists are still written")
+    parser.add_argument('--dry-run', action='store_true', help="count the lists that would change")
+    args = parser.parse_args()
+
+    metrics.start_job('similar')
+    update_similar(datastore.connect(), datastore.connect('mirror') if args.mirror else None,
+                   full=args.full, dry_run=args.dry_run)
@@ -0,0 +1,41 @@
+import os
+import sys
+import threading
+import time
+
+# Startup budget: how long a job takes from process start to its first
+# document. Long-running scans call first_document() when their first page
+# arrives; the result is printed once and kept in `elapsed` for benchmarks.
+# Set QOOT_STARTUP_BUDGET (seconds) to get a warning when a job boots slower.
+
+STARTUP_BUDGET_ENV = 'QOOT_STARTUP_BUDGET'
+
+_imported_at = time.monotonic()
+elapsed = None  # seconds from process start to the first document, once known
+_lock = threading.Lock()  # Parallel scans can deliver their first pages at the same time
+
+
+def process_uptime():
+    """Seconds since this process started (since this module was imported where /proc is unavailable)."""
+    try:
+        with open('/proc/self/stat', encoding='ascii') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', encoding='ascii') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')  # starttime is field 22 of stat
+    except (OSError, ValueError, IndexError):
+        return time.monotonic() - _imported_at
+
+
+def first_document():
+    """Record the time to the first document; only the first call in a process counts."""
+    global elapsed
+    with _lock:
+        if elapsed is not None:
+            return
+        elapsed = process_uptime()
+    budget = os.environ.get(STARTUP_BUDGET_ENV)
+    if budget and elapsed > float(budget):
+        print(f"Startup took {elapsed:.2f}s, over the {float(budget):.2f}s budget", file=sys.stderr)
+    else:
+        print(f"Startup: first document after {elapsed:.2f}s")
@@ -1,25 +1,21 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+import datastore
+from audit import MissingField, run_audit
 
-# Initialize Firebase
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-firebase_admin.initialize_app(cred)
+parser = argparse.ArgumentParser(description="Count recipes without 'Tags'.")
+parser.add_argument('--mirror', action='store_true', help="read the local mirror (see mirror.py)")
+args = parser.parse_args()
 
-# Initialize Firestore
-db = firestore.client()
+# Firestore, the local mirror, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect('mirror' if args.mirror else None)
 
 # Define the Firestore collection name
 collection_name = 'recipes'  # Ensure this is the correct collection
 
-# Count documents missing the 'Tags' field
-missing_tags_count = 0
-
-# Retrieve all documents and check for 'Tags' field
-docs = db.collection(collection_name).stream()
-for doc in docs:
-    data = doc.to_dict()
-    if 'Tags' not in data:  # Checking for missing 'Tags'
-        missing_tags_count += 1
+# Count documents missing the 'Tags' field, fetching only that field
+missing_tags = MissingField('Tags')
+run_audit(db, collection_name, [missing_tags])
+missing_tags_count = len(missing_tags.doc_ids)
 
 # Output the result
 print(f"Number of documents missing the 'Tags' field: {missing_tags_count}")
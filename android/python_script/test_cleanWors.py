@@ -0,0 +1,29 @@
+import functools
+
+import cleaning
+import cleanWors
+from scan import Checkpoint
+
+
+def test_checkpoint_stays_before_a_failed_write(failing_store, tmp_path, monkeypatch):
+    lexicon, _ = cleaning.load_golden()
+    monkeypatch.setattr(cleaning, 'get_normalizer', lambda: cleaning.IngredientNormalizer(lexicon))
+    monkeypatch.setattr(cleanWors, 'cleaning_version', lambda: 'test')
+    monkeypatch.setattr(cleanWors, 'Checkpoint', functools.partial(Checkpoint, directory=str(tmp_path)))
+    monkeypatch.setattr(cleanWors, 'db', failing_store)
+    db = failing_store
+    for n in range(250):
+        db.collection('recipes').document(f"r{n:03d}").set({'ingredients': "['1 tsp salt', '2 eggs']"})
+    db.failing.add('r150')
+    checkpoint = Checkpoint('cleanWors-recipes', directory=str(tmp_path))
+    checkpoint.save('r009')  # An earlier run was interrupted after the first ten recipes
+
+    cleanWors.process_and_update_firestore()
+    assert 'cleaned_ingredients' not in db.document('recipes/r150').get().to_dict()
+    assert checkpoint.load() in ('r009', 'r099')  # Never past the page with the failure, and not cleared
+
+    db.failing.clear()
+    cleanWors.process_and_update_firestore()
+    assert db.document('recipes/r150').get().to_dict()['cleaned_ingredients'] == ['salt', 'eggs']
+    assert db.document('ingredient_index/salt').get().to_dict()['count'] == 240
+    assert not list(tmp_path.iterdir())
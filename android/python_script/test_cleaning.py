@@ -0,0 +1,27 @@
+import pytest
+
+from cleaning import IngredientNormalizer, compare_with_legacy, ingredients_as_list, load_golden
+from foodlexicon import require_nltk_data
+
+
+def test_fused_cleaner_reproduces_legacy_golden_output():
+    # Recorded from legacy_clean_ingredients with the WordNet lexicon (python cleaning.py --write-golden)
+    lexicon, samples = load_golden()
+    normalizer = IngredientNormalizer(lexicon)
+    for ingredients_list, legacy in samples:
+        assert sorted(normalizer.normalize(ingredients_list)) == legacy, ingredients_list
+
+
+def test_compare_with_legacy():
+    try:
+        require_nltk_data('tokenizers/punkt_tab', 'corpora/wordnet')
+    except LookupError as e:
+        pytest.skip(str(e))
+    assert compare_with_legacy([ingredients_list for ingredients_list, _ in load_golden()[1]]) == []
+
+
+def test_ingredients_as_list():
+    assert ingredients_as_list("['1 cup rice', '2 eggs']") == ['1 cup rice', '2 eggs']
+    assert ingredients_as_list("[1 cup rice, 2 eggs]") == ['1 cup rice', '2 eggs']  # Not a Python literal
+    assert ingredients_as_list(['salt', 3]) == ['salt', '3']
+    assert ingredients_as_list(None) is None
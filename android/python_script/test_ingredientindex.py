@@ -0,0 +1,61 @@
+from bulkwriter import BulkWriter
+from ingredientindex import IndexUpdater, shard_for
+from localstore import LocalStore
+from vocabulary import VocabularyUpdater
+
+
+def clean(db, recipes):
+    """Write cleaned ingredients the way cleanWors does, indexing each recipe once its write commits."""
+    writer = BulkWriter(db, on_error=None)
+    index = IndexUpdater(db, writer)
+    vocabulary = VocabularyUpdater(db, writer)
+    for doc_id, cleaned in recipes.items():
+        old = db.document(f"recipes/{doc_id}").get().to_dict().get('cleaned_ingredients')
+
+        def index_recipe(doc_id=doc_id, old=old, cleaned=cleaned):
+            index.update('recipes', doc_id, old, cleaned)
+            vocabulary.update('recipes', doc_id, old, cleaned)
+
+        writer.update(db.document(f"recipes/{doc_id}"), {'cleaned_ingredients': cleaned},
+                      on_committed=index_recipe)
+    writer.flush()
+    index.flush()
+    vocabulary.flush()
+    writer.close()
+    return writer
+
+
+def test_failed_recipe_write_is_not_indexed(failing_store):
+    db = failing_store
+    for doc_id in ('r1', 'r2'):
+        db.collection('recipes').document(doc_id).set({'ingredients': 'salt'})
+    db.failing.add('r2')
+
+    writer = clean(db, {'r1': ['salt'], 'r2': ['salt']})
+    assert [op.ref.id for op, _ in writer.failed] == ['r2']
+    assert db.document('ingredient_index/salt').get().to_dict()['count'] == 1
+    assert db.document('ingredient_vocab/sa').get().to_dict()['counts'] == {'salt': 1}
+
+    db.failing.clear()
+    clean(db, {'r2': ['salt']})  # The retry sees the same previous value
+    assert db.document('ingredient_index/salt').get().to_dict()['count'] == 2
+    assert sorted(db.document('ingredient_index/salt/shards/0').get().to_dict()['recipes']) == \
+        ['recipes/r1', 'recipes/r2']
+    assert db.document('ingredient_vocab/sa').get().to_dict()['counts'] == {'salt': 2}
+
+
+def test_flush_uses_the_stored_shard_count():
+    db = LocalStore()
+    writer = BulkWriter(db)
+    index = IndexUpdater(db, writer)
+    index.update('recipes', 'r0', None, ['salt'])
+    index.flush()
+    writer.flush()
+
+    # Another process re-shards the ingredient between two flushes
+    db.document('ingredient_index/salt').update({'shards': 4})
+    index.update('recipes', 'r1', None, ['salt'])
+    index.flush()
+    writer.close()
+    shard = db.document(f"ingredient_index/salt/shards/{shard_for('recipes/r1', 4)}").get()
+    assert shard.to_dict()['recipes'] == ['recipes/r1']
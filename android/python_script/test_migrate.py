@@ -0,0 +1,24 @@
+import functools
+
+import migrate
+from scan import Checkpoint
+
+
+def test_failed_update_is_retried_on_the_next_run(failing_store, tmp_path, monkeypatch):
+    monkeypatch.setattr(migrate, 'Checkpoint', functools.partial(Checkpoint, directory=str(tmp_path)))
+    db = failing_store
+    for n in range(30):
+        db.collection('recipes').document(f"r{n:02d}").set({'name': str(n), 'dish_type': 'main'})
+    db.failing.add('r15')
+    migration = migrate.MIGRATIONS[0]
+
+    migrate.migrate_collection(db, 'recipes', [migration], page_size=10)
+    assert 'dish_type' in db.document('recipes/r15').get().to_dict()
+    assert 'dish_type' not in db.document('recipes/r25').get().to_dict()
+    assert migrate.pending_migrations(db, [migration]) == [migration]
+
+    db.failing.clear()
+    migrate.migrate_collection(db, 'recipes', [migration], page_size=10)
+    assert 'dish_type' not in db.document('recipes/r15').get().to_dict()
+    assert migrate.pending_migrations(db, [migration]) == []
+    assert not list(tmp_path.iterdir())  # The checkpoint is cleared once the pass succeeds
@@ -1,12 +1,9 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import datastore
+from audit import LeftoverFields, run_audit
+from deleteFeilds import delete_fields
 
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate('/Users/saraabdullah/Desktop/flutternew/android/python_script/ServiceAccountKey.json')
-firebase_admin.initialize_app(cred)
-
-# Get Firestore client
-db = firestore.client()
+# Firestore, or the local store named by $QOOT_DATASTORE (see datastore.py)
+db = datastore.connect()
 
 # Replace 'your_collection_name' with the name of your collection
 collection_name = "recipes"
@@ -14,42 +11,15 @@ collection_name = "recipes"
 # Define the fields to be deleted
 fields_to_delete = ["dish_type", "nutrients", "rattings", "serves", "subcategory"]
 
-def delete_fields(batch_size=50):
-    docs = db.collection(collection_name).limit(batch_size).stream()
-
-    while True:
-        docs_processed = 0
-
-        for doc in docs:
-            doc_ref = db.collection(collection_name).document(doc.id)
-            updates = {field: firestore.DELETE_FIELD for field in fields_to_delete}
-
-            try:
-                doc_ref.update(updates)
-                print(f"Successfully deleted fields from document ID: {doc.id}")
-                docs_processed += 1
-            except Exception as e:
-                print(f"Failed to update document ID: {doc.id}. Error: {e}")
-
-        if docs_processed < batch_size:
-            # Exit loop when fewer documents are processed (end of collection)
-            print("Completed processing all documents.")
-            break
-        else:
-            # Continue with the next batch
-            docs = db.collection(collection_name).limit(batch_size).stream()
-
 def verify_deletion():
     """Verify that the specified fields have been deleted from all documents."""
-    all_verified = True
-    docs = db.collection(collection_name).stream()
+    leftover = LeftoverFields(fields_to_delete)
+    run_audit(db, collection_name, [leftover])
 
-    for doc in docs:
-        data = doc.to_dict()
-        for field in fields_to_delete:
-            if field in data:
-                print(f"Field '{field}' still exists in document ID: {doc.id}")
-                all_verified = False
+    for doc_id, fields in leftover.found.items():
+        for field in fields:
+            print(f"Field '{field}' still exists in document ID: {doc_id}")
+    all_verified = not leftover.found
 
     if all_verified:
         print("All fields successfully deleted from all documents.")
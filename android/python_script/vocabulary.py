@@ -0,0 +1,167 @@
+import argparse
+import threading
+from collections import Counter, defaultdict
+
+import datastore
+import metrics
+from bulkwriter import BulkWriter
+from ingredientindex import SOURCES, index_key
+from scan import scan_documents
+
+# The ingredient vocabulary with recipe counts, sharded by prefix so the
+# picker and the search box read one small document per typed prefix instead
+# of every recipe:
+#
+#   ingredient_vocab/{prefix}   {prefix, counts: {ingredient: recipes}, ranked: [ingredient, ...]}
+#
+# The prefix is the first PREFIX_LENGTH characters of the ingredient key
+# (see ingredientindex.index_key). ranked holds the shard's RANKED most used
+# ingredients, most used first, for completions; counts holds every
+# ingredient, so a longer typed prefix can be completed from the same read.
+#
+# build_vocabulary() recounts everything. Between rebuilds the cleaners keep
+# the counts exact with increments through VocabularyUpdater, one write per
+# shard per flush. Several updaters can touch a shard at once, so they leave
+# ranked alone: rerank_vocabulary() recomputes it from the stored counts at
+# the end of a cleanWors run, and for the listener from a periodic
+# `python vocabulary.py --rerank`. A shard created since then has no ranked yet.
+
+VOCAB_COLLECTION = 'ingredient_vocab'
+PREFIX_LENGTH = 2
+RANKED = 50
+
+
+def prefix_for(key):
+    """Shard document ID for an ingredient key; prefixes Firestore would reject are hex-encoded."""
+    prefix = key[:PREFIX_LENGTH]
+    if prefix in ('.', '..') or prefix.startswith('__') or prefix.endswith('.'):
+        return '~' + prefix.encode('utf-8').hex()
+    return prefix
+
+
+def ranked(counts, limit=RANKED):
+    """The most used ingredients, most used first; ties in alphabetical order."""
+    used = [(-count, key) for key, count in counts.items() if count > 0]
+    return [key for _, key in sorted(used)[:limit]]
+
+
+def collect_counts(db, page_size=500):
+    """Number of source recipes using each ingredient."""
+    counts = Counter()
+    for source, condition in SOURCES.items():
+        collection_ref = db.collection(source)
+        if condition:
+            collection_ref = collection_ref.where(*condition)
+        for doc in scan_documents(collection_ref, page_size, select=['cleaned_ingredients']):
+            cleaned = doc.to_dict().get('cleaned_ingredients')
+            if isinstance(cleaned, list):
+                counts.update({index_key(str(ingredient)) for ingredient in cleaned} - {None})
+    return counts
+
+
+def build_vocabulary(db, source_db=None):
+    """
+    Recount the vocabulary from the recipe collections and rewrite every
+    shard. Shards whose prefix no longer appears are deleted. source_db is
+    where the recipes are read from (e.g. the local mirror).
+    """
+    job = metrics.current()
+    with job.time('load'):
+        counts = collect_counts(source_db or db)
+    shards = defaultdict(dict)
+    for key, count in counts.items():
+        shards[prefix_for(key)][key] = count
+
+    vocab_ref = db.collection(VOCAB_COLLECTION)
+    old = {doc.id for doc in scan_documents(vocab_ref, select=[])}
+    writer = BulkWriter(db)
+    for prefix, shard in shards.items():
+        writer.set(vocab_ref.document(prefix), {
+            'prefix': next(iter(shard))[:PREFIX_LENGTH],
+            'counts': shard,
+            'ranked': ranked(shard),
+        })
+    for prefix in old - set(shards):
+        writer.delete(vocab_ref.document(prefix))
+    writer.close()
+    print(f"{len(counts)} ingredients in {len(shards)} shards. {writer.committed} writes, "
+          f"{len(writer.failed)} failed.")
+
+
+def rerank_vocabulary(db, prefixes=None):
+    """Rewrite ranked from the stored counts, for the given shard IDs or every shard."""
+    vocab_ref = db.collection(VOCAB_COLLECTION)
+    if prefixes is None:
+        shards = scan_documents(vocab_ref, select=['counts'])
+    else:
+        refs = [vocab_ref.document(prefix) for prefix in sorted(prefixes)]
+        metrics.current().count('read', len(refs))
+        shards = db.get_all(refs)
+    writer = BulkWriter(db)
+    for snapshot in shards:
+        if snapshot.exists:
+            # Only ranked is written, so increments committed since the read are kept
+            writer.update(snapshot.reference, {'ranked': ranked(snapshot.to_dict().get('counts', {}))})
+    writer.close()
+
+
+class VocabularyUpdater:
+    """
+    Keep the vocabulary counts in step with the cleaners' writes.
+
+    Same calls as ingredientindex.IndexUpdater, made once the recipe's own
+    write has committed: update() and remove() collect the count changes in
+    memory, and flush() queues one write per touched shard on the cleaner's
+    BulkWriter. Call flush() once per page or batch, and before closing the
+    writer. touched collects the shards written, to pass to
+    rerank_vocabulary() once the writer is closed.
+    """
+
+    def __init__(self, db, writer):
+        self._vocab_ref = db.collection(VOCAB_COLLECTION)
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._deltas = defaultdict(Counter)  # prefix -> {ingredient: count change}
+        self.touched = set()
+
+    def update(self, source, doc_id, old_ingredients, new_ingredients):
+        old_keys = {index_key(str(i)) for i in old_ingredients or []} - {None}
+        new_keys = {index_key(str(i)) for i in new_ingredients or []} - {None}
+        with self._lock:
+            for key in new_keys - old_keys:
+                self._deltas[prefix_for(key)][key] += 1
+            for key in old_keys - new_keys:
+                self._deltas[prefix_for(key)][key] -= 1
+
+    def remove(self, source, doc_id, old_ingredients):
+        """Drop a recipe that was deleted or made private."""
+        self.update(source, doc_id, old_ingredients, [])
+
+    def flush(self):
+        """Queue the collected count changes on the writer."""
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(Counter)
+        for prefix, changes in deltas.items():
+            changes = {key: delta for key, delta in changes.items() if delta}
+            if not changes:
+                continue
+            self._writer.set(self._vocab_ref.document(prefix), {
+                'prefix': next(iter(changes))[:PREFIX_LENGTH],
+                'counts': {key: datastore.Increment(delta) for key, delta in changes.items()},
+            }, merge=True)
+            self.touched.add(prefix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the prefix-sharded ingredient vocabulary.")
+    parser.add_argument('--mirror', action='store_true',
+                        help="read the recipes from the local mirror (see mirror.py); shards are still written")
+    parser.add_argument('--rerank', action='store_true',
+                        help="only recompute every shard's ranked completions from its stored counts")
+    args = parser.parse_args()
+
+    metrics.start_job('vocabulary')
+    if args.rerank:
+        rerank_vocabulary(datastore.connect())
+    else:
+        build_vocabulary(datastore.connect(), datastore.connect('mirror') if args.mirror else None)